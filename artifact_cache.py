@@ -0,0 +1,118 @@
+"""On-disk cache for generated and rendered images.
+
+Artifacts are keyed by a hash of the image prompt and the overlay text, so a
+run that fails after generation can pick the same image back up instead of
+paying for gpt-image-1 again.
+"""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+ARTIFACT_CACHE_DIR = ".artifact_cache"
+ARTIFACT_MAX_BYTES = 512 * 1024 * 1024
+ARTIFACT_MAX_AGE_DAYS = 14
+
+# kind -> file suffix
+ARTIFACT_KINDS = {
+    "raw": ".raw",          # image bytes exactly as returned by the image API
+    "final": ".final.jpg",  # add_text output, ready to upload
+    "queued": ".queued.jpg",  # pre-generated post waiting in the queue; never evicted
+}
+PINNED_KINDS = ("queued",)
+
+
+def artifact_key(prompt, text):
+    return hashlib.sha256(f"{prompt}\0{text}".encode("utf-8")).hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root=ARTIFACT_CACHE_DIR, max_bytes=ARTIFACT_MAX_BYTES,
+                 max_age_days=ARTIFACT_MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+
+    def path(self, key, kind):
+        return os.path.join(self.root, key[:2], key + ARTIFACT_KINDS[kind])
+
+    def get(self, key, kind):
+        path = self.path(key, kind)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Bump mtime so size-based eviction drops least recently used first.
+        os.utime(path)
+        return data
+
+    def put(self, key, kind, data):
+        path = self.path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    @contextmanager
+    def writer(self, key, kind):
+        """File to stream an artifact into; it only appears once the block succeeds."""
+        path = self.path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def delete(self, key, kind):
+        try:
+            os.remove(self.path(key, kind))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, now=None):
+        """Drop artifacts past max age, then oldest first until under max_bytes.
+
+        Pinned kinds are skipped and do not count towards max_bytes.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        now = now if now is not None else time.time()
+        pinned_suffixes = tuple(ARTIFACT_KINDS[kind] for kind in PINNED_KINDS)
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(pinned_suffixes):
+                    continue
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+
+        removed = 0
+        total = 0
+        kept = []
+        for mtime, size, path in entries:
+            if now - mtime > self.max_age_seconds or path.endswith(".tmp"):
+                os.remove(path)
+                removed += 1
+            else:
+                kept.append((mtime, size, path))
+                total += size
+
+        kept.sort()
+        for mtime, size, path in kept:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,140 @@
+"""Compare region-limited compositing in add_text with the old full-frame path.
+
+Each (variant, size) pair runs in a fresh subprocess so peak RSS is measured
+in isolation. Usage:
+
+    python benchmarks/compositing.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = [(1024, 1536), (1536, 2304), (2048, 3072)]
+TEXT = "Healing doesn't mean forgetting. It means it no longer controls you."
+
+
+def make_source(size):
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    h, w = size[1], size[0]
+    gradient = np.linspace(40, 220, h, dtype=np.float32)[:, None, None]
+    noise = rng.normal(0, 12, (h, w, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    buf = BytesIO()
+    Image.fromarray(pixels).save(buf, "PNG")
+    buf.seek(0)
+    return buf
+
+
+def add_text_full_frame(image_buffer, text):
+    """The pre-region add_text: whole frame to RGBA plus a full-size overlay."""
+    import main
+    from PIL import Image, ImageDraw
+
+    img = Image.open(image_buffer).convert("RGBA")
+    img = main.crop_to_4_5(img)
+    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+
+    font_size = main.text_font_size(text)
+    line_height = int(font_size * 1.35)
+    font = main.load_font(main.FONT_MAIN, font_size)
+    box_width = main.text_box_width(img.width)
+    box_height = line_height * 4
+    box_x, box_y, luminance = main.find_text_box(img, box_width, box_height)
+    text_color = (245, 245, 240, 255) if luminance < 135 else (30, 30, 30, 255)
+    shadow_color = (0, 0, 0, 70) if luminance < 135 else (0, 0, 0, 40)
+
+    lines = main.layout_text(text, main.FONT_MAIN, font_size, box_width)
+    y = box_y + (box_height - len(lines) * line_height) // 2
+    for line, w in lines:
+        x = box_x + (box_width - w) // 2
+        draw.text((x + 2, y + 2), line, font=font, fill=shadow_color)
+        draw.text((x, y), line, font=font, fill=text_color)
+        y += line_height
+
+    mark_font = main.load_font(main.FONT_MARK, main.WATERMARK_FONT_SIZE)
+    mw = mark_font.getlength(main.WATERMARK_TEXT)
+    draw.text(((img.width - mw) // 2, img.height - 58), main.WATERMARK_TEXT,
+              font=mark_font, fill=(255, 255, 255, 130))
+
+    final = Image.alpha_composite(img, overlay)
+    out = BytesIO()
+    final.convert("RGB").save(out, "JPEG", quality=95)
+    out.seek(0)
+    return out
+
+
+def run_worker(variant, size, repeat):
+    import main
+
+    os.chdir(ROOT)
+    fn = main.add_text if variant == "region" else add_text_full_frame
+    source = make_source(size)
+    # Warm fonts and layouts so only compositing-related work differs.
+    fn(source, TEXT)
+    source.seek(0)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    for _ in range(repeat):
+        source.seek(0)
+        start = time.perf_counter()
+        fn(source, TEXT)
+        timings.append(time.perf_counter() - start)
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "variant": variant,
+        "size": f"{size[0]}x{size[1]}",
+        "best_ms": min(timings) * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def compare(repeat):
+    results = []
+    for size in SIZES:
+        for variant in ("full_frame", "region"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", variant, f"{size[0]}x{size[1]}",
+                 "--repeat", str(repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--worker", nargs=2, metavar=("VARIANT", "WxH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        variant, size = args.worker
+        w, h = (int(v) for v in size.split("x"))
+        print(json.dumps(run_worker(variant, (w, h), args.repeat)))
+        return
+
+    results = compare(args.repeat)
+    print(f"{'size':>10} {'variant':>11} {'best ms':>9} {'mean ms':>9} {'peak MB':>9}")
+    for r in results:
+        print(f"{r['size']:>10} {r['variant']:>11} {r['best_ms']:9.1f} {r['mean_ms']:9.1f} "
+              f"{r['peak_rss_mb']:9.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,124 @@
+"""Compare the streaming base64 ingest in generate_image_from_scene with the old
+buffered one, from API payload to rendered feed image.
+
+Each (variant, format) pair runs in a fresh subprocess so peak RSS is measured
+in isolation. Payloads are built up front and only read by the workers; the
+payload string is loaded before the baseline RSS reading, since the API
+response holds it either way. Usage:
+
+    python benchmarks/ingest.py [--repeat N]
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FORMATS = ["png", "jpeg"]
+SIZE = (1024, 1536)
+TEXT = "Healing doesn't mean forgetting. It means it no longer controls you."
+
+
+def make_payload(fmt):
+    from PIL import Image
+    from compositing import make_source
+
+    if fmt == "png":
+        return base64.b64encode(make_source(SIZE).getvalue()).decode("ascii")
+    buf = BytesIO()
+    Image.open(make_source(SIZE)).save(buf, "JPEG", quality=95)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def ingest_buffered(b64, cache, key):
+    """The pre-streaming path: full decode, BytesIO, a copy for the cache."""
+    import main
+
+    image_buffer = BytesIO(base64.b64decode(b64))
+    cache.put(key, "raw", image_buffer.getvalue())
+    return main.render_renditions(image_buffer, TEXT, names=[main.PRIMARY_RENDITION])
+
+
+def ingest_streaming(b64, cache, key):
+    import main
+
+    with cache.writer(key, "raw") as sink:
+        img, _ = main.decode_b64_image(b64, sink)
+    return main.render_renditions(img, TEXT, names=[main.PRIMARY_RENDITION])
+
+
+def run_worker(variant, payload_path, repeat):
+    import contextlib
+    import main
+    from artifact_cache import ArtifactCache
+
+    os.chdir(ROOT)
+    fn = ingest_streaming if variant == "streaming" else ingest_buffered
+    with open(payload_path) as f:
+        b64 = f.read()
+    cache = ArtifactCache(tempfile.mkdtemp())
+    with contextlib.redirect_stdout(sys.stderr):
+        # Warm fonts and layouts so only ingest-related work differs.
+        main.warm_fonts([TEXT])
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            fn(b64, cache, f"{i:064d}")
+            timings.append(time.perf_counter() - start)
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "variant": variant,
+        "format": os.path.basename(payload_path),
+        "payload_kb": len(b64) / 1024,
+        "best_ms": min(timings) * 1000,
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def compare(repeat):
+    results = []
+    workdir = tempfile.mkdtemp()
+    for fmt in FORMATS:
+        payload_path = os.path.join(workdir, fmt)
+        with open(payload_path, "w") as f:
+            f.write(make_payload(fmt))
+        for variant in ("buffered", "streaming"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", variant, payload_path, "--repeat", str(repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker", nargs=2, metavar=("VARIANT", "PAYLOAD"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(*args.worker, args.repeat)))
+        return
+
+    results = compare(args.repeat)
+    print(f"{'format':>7} {'variant':>10} {'payload KB':>11} {'best ms':>9} {'peak MB':>9} {'growth MB':>10}")
+    for r in results:
+        print(f"{r['format']:>7} {r['variant']:>10} {r['payload_kb']:11.0f} {r['best_ms']:9.1f} "
+              f"{r['peak_rss_mb']:9.1f} {r['rss_growth_mb']:10.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,209 @@
+"""Benchmark suite for the rendering, selection and state hot paths.
+
+Results are compared against benchmarks/baseline.json; any case slower than
+the baseline by more than --threshold is reported as a regression and the
+exit code is 1. Usage:
+
+    python benchmarks/run.py [--filter choose] [--repeat 5] [--threshold 0.25]
+    python benchmarks/run.py --save-baseline     # after an intended change
+    python benchmarks/run.py --output results.json
+
+Baselines are only comparable on the machine that recorded them; the
+recorded platform is printed next to the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+IMAGE_SIZES = [(1024, 1536), (1536, 2304), (2048, 3072)]
+TEXTS = {
+    "short": "Rest is not quitting.",
+    "medium": "Healing doesn't mean forgetting. It means it no longer controls you.",
+    "long": ("Some seasons are just for learning, not harvesting, and the quiet work "
+             "you do in them is still the work that carries you into the next one."),
+}
+BANK_SIZES = [10, 1000, 100000]
+STATE_SIZES = [10, 1000, 100000]
+
+
+def measure(fn, repeat, min_time=0.05):
+    """Best and median seconds per call, auto-scaling calls per repeat."""
+    start = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - start, 1e-7)
+    number = max(1, int(min_time / once))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings), statistics.median(timings)
+
+
+# =========================================================
+# CASES (each yields (name, zero-argument callable))
+# =========================================================
+def rendering_cases():
+    import main
+    from compositing import make_source
+    from PIL import Image
+
+    for size in IMAGE_SIZES:
+        label = f"{size[0]}x{size[1]}"
+        source = make_source(size)
+        img = Image.open(source).convert("RGB")
+
+        yield f"crop_to_4_5[{label}]", lambda img=img: main.crop_to_4_5(img)
+
+        for text_name, text in TEXTS.items():
+            def add_text(source=source, text=text):
+                source.seek(0)
+                main.add_text(source, text)
+            yield f"add_text[{label},{text_name}]", add_text
+
+
+def selection_cases():
+    """choose_scene_and_text with a bank and a history of the same size."""
+    import main
+    from simulate import synthetic_bank
+    from state_store import StateStore
+
+    workdir = tempfile.mkdtemp()
+    today = date.today().toordinal()
+    for size in BANK_SIZES:
+        bank = synthetic_bank(size, workdir)
+        store = StateStore(":memory:", legacy_dir=None)
+        rng = random.Random(size)
+        texts = [t for thoughts in bank.thoughts.values() for t in thoughts]
+        # History spread over two years, so about 1 in 20 is cooling.
+        with store.transaction():
+            for text in texts:
+                store.set_thought_used(text, date.fromordinal(today - rng.randrange(730)).isoformat())
+            for scene in bank.scenes:
+                store.set_scene_used(scene["name"], date.fromordinal(today - rng.randrange(10)).isoformat())
+
+        def choose(bank=bank, store=store):
+            main._bank, main._store = bank, store
+            main.choose_scene_and_text()
+        yield f"choose_scene_and_text[{size}]", choose
+
+
+def state_file_cases():
+    import main
+
+    workdir = tempfile.mkdtemp()
+    for size in STATE_SIZES:
+        path = os.path.join(workdir, f"state-{size}.json")
+        data = {f"Thought number {i} in a growing history.": "2026-01-01" for i in range(size)}
+        main.save_json_file(path, data)
+        yield f"load_json_file[{size}]", lambda path=path: main.load_json_file(path)
+        yield f"save_json_file[{size}]", lambda path=path, data=data: main.save_json_file(path, data)
+
+
+SUITES = {
+    "rendering": rendering_cases,
+    "selection": selection_cases,
+    "state": state_file_cases,
+}
+
+
+# =========================================================
+# BASELINE COMPARISON
+# =========================================================
+def machine():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print results next to the baseline. Returns the names that regressed."""
+    base = baseline.get("results", {})
+    regressions = []
+    print(f"{'case':<40} {'best ms':>10} {'baseline':>10} {'change':>8}")
+    for name, r in results.items():
+        old = base.get(name)
+        if old is None:
+            print(f"{name:<40} {r['best_ms']:10.3f} {'-':>10} {'new':>8}")
+            continue
+        change = r["best_ms"] / old["best_ms"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} {r['best_ms']:10.3f} {old['best_ms']:10.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark suite")
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append",
+                        help="run only these suites (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown vs baseline, as a fraction")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write these results as the new baseline")
+    parser.add_argument("--output", help="also write results as JSON here")
+    args = parser.parse_args()
+
+    results = {}
+    for suite in args.suite or SUITES:
+        for name, fn in SUITES[suite]():
+            if args.filter not in name:
+                continue
+            best, median = measure(fn, args.repeat)
+            results[name] = {"best_ms": best * 1000, "median_ms": median * 1000}
+
+    record = {"machine": machine(), "repeat": args.repeat, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(record, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {"machine": machine(), "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline["machine"] = machine()
+        baseline["results"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved {len(results)} result(s) to {args.baseline}.")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine():
+            print(f"Note: baseline recorded on {baseline.get('machine')}")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
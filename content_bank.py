@@ -0,0 +1,342 @@
+"""Content bank: thoughts, scenes and prompt components kept as data.
+
+content/bank.json is the editable source. compile_bank() validates it and
+writes content/bank.idx, a binary index that is mmapped at startup so loading
+cost does not grow with the number of thoughts:
+
+    header   magic (with format version), thought count, meta length,
+             sha256 of bank.json
+    meta     JSON: categories as [name, start, stop] id ranges, plus the small
+             sections (scenes, seasons, lighting, atmosphere, moods, holidays)
+    records  one (offset, length, hash) per thought id, category by category
+    table    (hash, id) pairs sorted by hash, for text -> id lookups
+    strings  UTF-8 text of every thought, back to back
+
+    python content_bank.py            validate and compile
+    python content_bank.py --check    validate only
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import random
+import struct
+from collections.abc import Sequence
+
+BANK_SOURCE_FILE = "content/bank.json"
+BANK_INDEX_FILE = "content/bank.idx"
+
+_MAGIC = b"YLBANK\x00\x01"
+_HEADER = struct.Struct("<8sII32s")  # magic, count, meta length, source sha256
+_RECORD = struct.Struct("<IIQ")      # string offset, byte length, text hash
+_ENTRY = struct.Struct("<QI")        # text hash, thought id
+
+SMALL_SECTIONS = ("scenes", "seasons", "lighting", "atmosphere", "moods", "holidays")
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def _source_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+# =========================================================
+# VALIDATION + COMPILE
+# =========================================================
+def validate_bank(bank):
+    """Return a list of problems with a parsed bank.json (empty if it is fine)."""
+    errors = []
+
+    def strings(where, values):
+        if not isinstance(values, list) or not values:
+            errors.append(f"{where}: expected a non-empty list")
+            return
+        seen = set()
+        for i, value in enumerate(values):
+            if not isinstance(value, str) or not value.strip():
+                errors.append(f"{where}[{i}]: expected non-empty text")
+            elif value in seen:
+                errors.append(f"{where}[{i}]: duplicate {value!r}")
+            seen.add(value)
+
+    thoughts = bank.get("thoughts")
+    if not isinstance(thoughts, dict) or not thoughts:
+        errors.append("thoughts: expected a non-empty object of categories")
+    else:
+        for category, texts in thoughts.items():
+            strings(f"thoughts.{category}", texts)
+
+    names = set()
+    for i, scene in enumerate(bank.get("scenes") or []):
+        for field in ("name", "scene", "details"):
+            if not isinstance(scene.get(field), str) or not scene[field].strip():
+                errors.append(f"scenes[{i}].{field}: expected non-empty text")
+        if scene.get("name") in names:
+            errors.append(f"scenes[{i}]: duplicate name {scene['name']!r}")
+        names.add(scene.get("name"))
+    if not bank.get("scenes"):
+        errors.append("scenes: expected a non-empty list")
+
+    seasons = bank.get("seasons")
+    if not isinstance(seasons, dict) or not seasons:
+        errors.append("seasons: expected a non-empty object")
+    else:
+        for key, skies in seasons.items():
+            strings(f"seasons.{key}", skies)
+    for section in ("lighting", "atmosphere", "moods"):
+        strings(section, bank.get(section))
+
+    # Holidays fall on a fixed month/day, or on the nth weekday of a month
+    # (weekday 0 = Monday, nth -1 = last), e.g. Thanksgiving.
+    dates = set()
+    holiday_names = set()
+    for i, holiday in enumerate(bank.get("holidays") or []):
+        where = f"holidays[{i}]"
+        for field in ("name", "text", "scene"):
+            if not isinstance(holiday.get(field), str) or not holiday[field].strip():
+                errors.append(f"{where}.{field}: expected non-empty text")
+        month, day = holiday.get("month"), holiday.get("day")
+        if not (isinstance(month, int) and 1 <= month <= 12):
+            errors.append(f"{where}: invalid month {month}")
+        if "day" in holiday:
+            if not (isinstance(day, int) and 1 <= day <= 31):
+                errors.append(f"{where}: invalid day {day}")
+            if (month, day) in dates:
+                errors.append(f"{where}: two holidays on {month}/{day}")
+            dates.add((month, day))
+        elif holiday.get("weekday") not in range(7) or holiday.get("nth") not in (1, 2, 3, 4, -1):
+            errors.append(f"{where}: needs a day, or a weekday (0-6) and nth (1-4 or -1)")
+        if holiday.get("name") in holiday_names:
+            errors.append(f"{where}: duplicate name {holiday['name']!r}")
+        holiday_names.add(holiday.get("name"))
+    return errors
+
+
+def load_source(source=BANK_SOURCE_FILE):
+    with open(source, encoding="utf-8") as f:
+        bank = json.load(f)
+    errors = validate_bank(bank)
+    if errors:
+        raise Exception(f"Invalid content bank {source}:\n  " + "\n  ".join(errors))
+    return bank
+
+
+def build_index(bank, digest):
+    """Serialize a validated bank into the binary index format."""
+    categories = []
+    records = []
+    strings = bytearray()
+    for category, texts in bank["thoughts"].items():
+        start = len(records)
+        for text in texts:
+            data = text.encode("utf-8")
+            records.append((len(strings), len(data), text_hash(text)))
+            strings += data
+        categories.append([category, start, len(records)])
+
+    meta = {"categories": categories}
+    meta.update((section, bank[section]) for section in SMALL_SECTIONS if section in bank)
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    out = bytearray(_HEADER.pack(_MAGIC, len(records), len(meta_bytes), digest))
+    out += meta_bytes
+    for record in records:
+        out += _RECORD.pack(*record)
+    for thought_id, record in sorted(enumerate(records), key=lambda r: (r[1][2], r[0])):
+        out += _ENTRY.pack(record[2], thought_id)
+    out += strings
+    return bytes(out)
+
+
+def compile_bank(source=BANK_SOURCE_FILE, index=BANK_INDEX_FILE):
+    """Validate source and (re)write the index. Returns the thought count."""
+    bank = load_source(source)
+    data = build_index(bank, _source_digest(source))
+    tmp_path = f"{index}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, index)
+    return sum(len(texts) for texts in bank["thoughts"].values())
+
+
+# =========================================================
+# LOADING
+# =========================================================
+class ThoughtList(Sequence):
+    """One category's thoughts, decoded from the index on access."""
+
+    def __init__(self, bank, start, stop):
+        self._bank = bank
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._bank.thought(self._start + i)
+
+    def __repr__(self):
+        return f"<ThoughtList {len(self)} thoughts>"
+
+
+class ContentBank:
+    """Read-only view of a compiled bank.idx."""
+
+    def __init__(self, data):
+        self._data = data
+        magic, self.count, meta_len, self.source_digest = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise Exception("Not a content bank index (bad magic)")
+        meta_start = _HEADER.size
+        meta = json.loads(bytes(data[meta_start:meta_start + meta_len]).decode("utf-8"))
+        self._records = meta_start + meta_len
+        self._table = self._records + self.count * _RECORD.size
+        self._strings = self._table + self.count * _ENTRY.size
+
+        self.categories = {name: (start, stop) for name, start, stop in meta["categories"]}
+        self.thoughts = {name: ThoughtList(self, start, stop) for name, (start, stop) in self.categories.items()}
+        self.scenes = meta.get("scenes", [])
+        self.seasons = meta.get("seasons", {})
+        self.lighting = meta.get("lighting", [])
+        self.atmosphere = meta.get("atmosphere", [])
+        self.moods = meta.get("moods", [])
+        self.holidays = meta.get("holidays", [])
+        self._hash_keys = _HashKeys(self)
+
+    @classmethod
+    def open(cls, path=BANK_INDEX_FILE):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _record(self, thought_id):
+        return _RECORD.unpack_from(self._data, self._records + thought_id * _RECORD.size)
+
+    def thought(self, thought_id):
+        offset, length, _ = self._record(thought_id)
+        start = self._strings + offset
+        return bytes(self._data[start:start + length]).decode("utf-8")
+
+    def pick_thought_id(self, categories, cooling, rng=random):
+        """Uniform thought id from the given categories, skipping cooling texts.
+
+        Only the cooling texts are looked up (by hash), so the cost grows with
+        the recent history rather than the size of the bank. Returns None if
+        nothing is left.
+        """
+        spans = [self.categories[c] for c in categories if c in self.categories]
+        # Offsets of each span once the chosen categories are laid end to end.
+        offsets = []
+        total = 0
+        for start, stop in spans:
+            offsets.append(total)
+            total += stop - start
+
+        excluded = []
+        for t in cooling:
+            for pos in self.ids(t):
+                for (start, stop), offset in zip(spans, offsets):
+                    if start <= pos < stop:
+                        excluded.append(offset + pos - start)
+        if len(excluded) >= total:
+            return None
+        excluded.sort()
+
+        i = nth_not_excluded(total, excluded, rng)
+        span = bisect.bisect_right(offsets, i) - 1
+        return spans[span][0] + i - offsets[span]
+
+    def pick_thought(self, categories, cooling, rng=random):
+        """Like pick_thought_id, but returns (category, text) or None."""
+        thought_id = self.pick_thought_id(categories, cooling, rng)
+        if thought_id is None:
+            return None
+        return self.category_of(thought_id), self.thought(thought_id)
+
+    def category_of(self, thought_id):
+        for name, (start, stop) in self.categories.items():
+            if start <= thought_id < stop:
+                return name
+        raise IndexError(thought_id)
+
+    def ids(self, text):
+        """Every thought id holding this text (binary search on the hash table)."""
+        h = text_hash(text)
+        found = []
+        i = bisect.bisect_left(self._hash_keys, h)
+        while i < self.count:
+            key, thought_id = _ENTRY.unpack_from(self._data, self._table + i * _ENTRY.size)
+            if key != h:
+                break
+            if self.thought(thought_id) == text:
+                found.append(thought_id)
+            i += 1
+        return found
+
+
+def nth_not_excluded(n, excluded, rng=random):
+    """Uniformly pick an index in range(n) not in the sorted `excluded` list."""
+    r = rng.randrange(n - len(excluded))
+    for e in excluded:
+        if e > r:
+            break
+        r += 1
+    return r
+
+
+class _HashKeys(Sequence):
+    """The sorted hash column, viewed as a sequence for bisect."""
+
+    def __init__(self, bank):
+        self._bank = bank
+
+    def __len__(self):
+        return self._bank.count
+
+    def __getitem__(self, i):
+        return _ENTRY.unpack_from(self._bank._data, self._bank._table + i * _ENTRY.size)[0]
+
+
+def load_bank(source=BANK_SOURCE_FILE, index=BANK_INDEX_FILE):
+    """Open the compiled index, recompiling first if bank.json has changed."""
+    digest = _source_digest(source) if os.path.exists(source) else None
+    if os.path.exists(index):
+        bank = ContentBank.open(index)
+        if digest is None or bank.source_digest == digest:
+            return bank
+        print(f"{source} changed; recompiling {index}.")
+    try:
+        compile_bank(source, index)
+    except OSError:
+        # Read-only checkout: use an in-memory index for this run.
+        return ContentBank(build_index(load_source(source), digest))
+    return ContentBank.open(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and compile the content bank")
+    parser.add_argument("--source", default=BANK_SOURCE_FILE)
+    parser.add_argument("--index", default=BANK_INDEX_FILE)
+    parser.add_argument("--check", action="store_true", help="validate only")
+    args = parser.parse_args()
+
+    if args.check:
+        bank = load_source(args.source)
+        print(f"{args.source} ok: {sum(len(t) for t in bank['thoughts'].values())} thoughts.")
+        return
+    print(f"Compiled {compile_bank(args.source, args.index)} thoughts into {args.index}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,683 @@
+"""Local stand-ins for external APIs, for exercising the real client code offline.
+
+    python fakes.py graph [--port 8081]    serve a fake Graph API
+    python fakes.py images [--port 8082]   serve a fake OpenAI images API
+    python fakes.py check                  run client retry/timeout and encode scenarios
+    python fakes.py e2e [--rounds 5]       post end to end against both fakes
+
+Point the bot at running fakes with GRAPH_API_BASE=http://127.0.0.1:8081,
+FB_PAGE_ACCESS_TOKEN=fake-page-token, OPENAI_BASE_URL=http://127.0.0.1:8082/v1
+and OPENAI_API_KEY=fake-openai-key. Both servers take --latency, --jitter and
+--error-rate / --rate-limit-rate / --token-error-rate to inject faults at
+random on top of any queued with inject(). The images server's --detail
+serves photo-like, hard-to-compress images instead.
+"""
+import argparse
+import base64
+import collections
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FAKE_TOKEN = "fake-page-token"
+FAKE_OPENAI_KEY = "fake-openai-key"
+
+Fault = collections.namedtuple("Fault", "status error delay headers")
+# Standing faults: fixed latency plus uniform jitter (seconds), and the chance
+# of each error kind per request.
+Chaos = collections.namedtuple(
+    "Chaos", "latency jitter error_rate rate_limit_rate token_error_rate retry_after"
+)
+NO_CHAOS = Chaos(0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+
+INVALID_TOKEN_ERROR = {
+    "message": "Invalid OAuth access token - Cannot parse access token",
+    "type": "OAuthException",
+    "code": 190,
+}
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is expected here.
+        exc = sys.exc_info()[1]
+        if not isinstance(exc, (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class _FakeServer:
+    """Threaded HTTP server with a FIFO of injected faults."""
+
+    handler_class = None
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.faults = collections.deque()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.chaos = NO_CHAOS
+        self.rng = random.Random()
+        handler = type("Handler", (self.handler_class,), {"fake": self})
+        self.httpd = _QuietServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def inject(self, status=None, error=None, delay=0.0, headers=None, count=1):
+        """Apply a fault to the next `count` requests.
+
+        With a status the request is answered with that status and Graph-style
+        error body; with only a delay it is served normally after sleeping.
+        """
+        with self.lock:
+            for _ in range(count):
+                self.faults.append(Fault(status, error, delay, headers or {}))
+
+    def configure(self, seed=None, **chaos):
+        """Set standing latency and random fault rates (see Chaos) for every request."""
+        self.chaos = NO_CHAOS._replace(**chaos)
+        self.rng = random.Random(seed)
+        return self
+
+    def next_fault(self):
+        with self.lock:
+            return self.faults.popleft() if self.faults else None
+
+    def roll(self):
+        """(delay, error kind or None) for one request under the standing chaos."""
+        chaos = self.chaos
+        with self.lock:
+            delay = chaos.latency + (self.rng.uniform(0, chaos.jitter) if chaos.jitter else 0.0)
+            r = self.rng.random()
+        for kind, rate in (("server", chaos.error_rate), ("rate_limit", chaos.rate_limit_rate),
+                           ("token", chaos.token_error_rate)):
+            if r < rate:
+                return delay, kind
+            r -= rate
+        return delay, None
+
+    def status_counts(self):
+        with self.lock:
+            return dict(collections.Counter(status for _, _, status in self.requests))
+
+    def record(self, method, path, status):
+        with self.lock:
+            self.requests.append((method, path, status))
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    fake = None
+    # kind -> (status, error body) in the style of the API being faked
+    ERRORS = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        # Record first: once the body is out, the client (and a check reading
+        # the counters) can move on before this thread runs another line.
+        self.fake.record(self.command, urlparse(self.path).path, status)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def apply_fault(self):
+        """Serve an injected or random fault. Returns True if the request was answered."""
+        fault = self.fake.next_fault()
+        if fault is None:
+            return self.apply_chaos()
+        if fault.delay:
+            time.sleep(fault.delay)
+        if fault.status is None:
+            return False
+        self.send_json(fault.status, {"error": fault.error or {"message": "Injected fault"}}, fault.headers)
+        return True
+
+    def apply_chaos(self):
+        delay, kind = self.fake.roll()
+        if delay:
+            time.sleep(delay)
+        if kind is None:
+            return False
+        status, error = self.ERRORS[kind]
+        headers = {}
+        if kind != "token":
+            retry_after = self.fake.chaos.retry_after
+            headers = {"Retry-After": str(math.ceil(retry_after)),
+                       "retry-after-ms": str(int(retry_after * 1000))}
+        self.send_json(status, {"error": error}, headers)
+        return True
+
+
+# =========================================================
+# GRAPH API
+# =========================================================
+class _GraphHandler(_JsonHandler):
+    ERRORS = {
+        "server": (503, {"message": "Service temporarily unavailable", "type": "OAuthException",
+                         "code": 2, "is_transient": True}),
+        "rate_limit": (400, {"message": "Application request limit reached",
+                             "type": "OAuthException", "code": 4}),
+        "token": (400, INVALID_TOKEN_ERROR),
+    }
+
+    def do_GET(self):
+        self.handle_graph()
+
+    def do_POST(self):
+        self.handle_graph()
+
+    def handle_graph(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+        if self.apply_fault():
+            return
+
+        auth = self.headers.get("Authorization", "")
+        token = auth.split(" ", 1)[1] if " " in auth else parse_qs(url.query).get("access_token", [""])[0]
+        if token != self.fake.token:
+            self.send_json(400, {"error": INVALID_TOKEN_ERROR})
+            return
+
+        m = re.match(r"^/v\d+\.\d+/(.+)$", url.path)
+        route = m.group(1) if m else ""
+        if self.command == "GET" and route == "me":
+            self.send_json(200, {"id": "1000", "name": "Fake Page"})
+        elif self.command == "GET" and route == "debug_token":
+            input_token = parse_qs(url.query).get("input_token", [""])[0]
+            self.send_json(200, {"data": {
+                "is_valid": input_token == self.fake.token,
+                "type": "PAGE",
+                "expires_at": self.fake.token_expires_at,
+            }})
+        elif self.command == "POST" and route.endswith("/photos"):
+            page_id = route.split("/")[0]
+            with self.fake.lock:
+                self.fake.uploads.append(len(body))
+                photo_id = str(len(self.fake.uploads))
+            self.send_json(200, {"id": photo_id, "post_id": f"{page_id}_{photo_id}"})
+        else:
+            self.send_json(400, {"error": {"message": f"Unknown path {url.path}", "code": 803}})
+
+
+class FakeGraphServer(_FakeServer):
+    """Stand-in for the Graph API endpoints the bot calls."""
+
+    handler_class = _GraphHandler
+
+    def __init__(self, host="127.0.0.1", port=0, token=FAKE_TOKEN):
+        super().__init__(host, port)
+        self.token = token
+        self.token_expires_at = 0  # never, like a long-lived page token
+        self.uploads = []
+
+
+# =========================================================
+# OPENAI IMAGES API
+# =========================================================
+class _ImagesHandler(_JsonHandler):
+    ERRORS = {
+        "server": (500, {"message": "The server had an error while processing your request.",
+                         "type": "server_error", "param": None, "code": None}),
+        "rate_limit": (429, {"message": "Rate limit reached for gpt-image-1 on images per minute.",
+                             "type": "requests", "param": None, "code": "rate_limit_exceeded"}),
+        "token": (401, {"message": "Incorrect API key provided.", "type": "invalid_request_error",
+                        "param": None, "code": "invalid_api_key"}),
+    }
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+        if self.apply_fault():
+            return
+
+        if self.headers.get("Authorization", "") != f"Bearer {self.fake.api_key}":
+            status, error = self.ERRORS["token"]
+            self.send_json(status, {"error": error})
+            return
+        if url.path.rstrip("/") not in ("/v1/images/generations", "/images/generations"):
+            self.send_json(404, {"error": {"message": f"Unknown path {url.path}", "type": "invalid_request_error"}})
+            return
+
+        request = json.loads(body or b"{}")
+        fmt = request.get("output_format", "png")
+        b64 = self.fake.payload(request.get("size", "1024x1536"), fmt,
+                                request.get("output_compression", 100))
+        self.send_json(200, {
+            "created": int(time.time()),
+            "data": [{"b64_json": b64}],
+            "output_format": fmt,
+            "usage": {"input_tokens": 50, "output_tokens": 6240, "total_tokens": 6290},
+        })
+
+
+class FakeImagesServer(_FakeServer):
+    """Stand-in for POST /v1/images/generations with realistically sized payloads."""
+
+    handler_class = _ImagesHandler
+
+    def __init__(self, host="127.0.0.1", port=0, api_key=FAKE_OPENAI_KEY, detail=False):
+        super().__init__(host, port)
+        self.api_key = api_key
+        self.detail = detail
+        self._payloads = {}
+
+    @property
+    def openai_base_url(self):
+        return f"{self.base_url}/v1"
+
+    def payload(self, size, fmt, compression):
+        """Base64 image of the requested size and format, built once per combination.
+
+        Noise over gradients, so it compresses about as badly as a real
+        painterly image (a 1024x1536 png comes out near 2 MB). With detail,
+        strong per-channel noise stands in for foliage or water: a feed crop
+        is about 1.25 MB as a plain quality 95 JPEG.
+        """
+        key = (size, fmt, compression)
+        with self.lock:
+            if key not in self._payloads:
+                from io import BytesIO
+                from PIL import Image
+
+                w, h = (int(v) for v in size.split("x"))
+                gradient = Image.linear_gradient("L").resize((w, h))
+                if self.detail:
+                    img = Image.merge("RGB", [
+                        Image.blend(Image.effect_noise((w, h), 64), gradient, 0.25) for _ in range(3)
+                    ])
+                else:
+                    noise = Image.effect_noise((w, h), 24)
+                    img = Image.merge("RGB", (Image.blend(noise, gradient, 0.6), gradient,
+                                              Image.blend(gradient, noise, 0.3)))
+                out = BytesIO()
+                options = {} if fmt == "png" else {"quality": compression}
+                img.save(out, {"jpeg": "JPEG", "webp": "WEBP"}.get(fmt, "PNG"), **options)
+                self._payloads[key] = base64.b64encode(out.getvalue()).decode("ascii")
+            return self._payloads[key]
+
+
+# =========================================================
+# SCENARIOS
+# =========================================================
+def run_graph_checks():
+    """Exercise GraphClient against the fake server. Returns the failure count."""
+    from io import BytesIO
+    from graph_client import GraphAPIError, GraphClient
+
+    def client(fake, **kwargs):
+        kwargs.setdefault("sleep", lambda s: None)
+        return GraphClient(FAKE_TOKEN, base_url=fake.base_url, **kwargs)
+
+    def expect_error(fn, kind):
+        try:
+            fn()
+        except GraphAPIError as e:
+            assert e.kind == kind, f"expected {kind}, got {e.kind}: {e}"
+            return e
+        raise AssertionError(f"expected a {kind} error")
+
+    def retries_5xx(fake):
+        fake.inject(status=503, count=2)
+        c = client(fake)
+        assert c.me()["id"] == "1000"
+        assert c.retries == 2, c.retries
+
+    def retries_rate_limit(fake):
+        fake.inject(status=429, headers={"Retry-After": "1"})
+        fake.inject(status=400, error={"message": "Application request limit reached", "code": 4})
+        c = client(fake)
+        assert c.me()["id"] == "1000"
+        assert c.retries == 2, c.retries
+
+    def gives_up_after_max_retries(fake):
+        fake.inject(status=500, count=5)
+        c = client(fake, max_retries=3)
+        expect_error(c.me, "transient")
+        assert c.retries == 3, c.retries
+
+    def auth_error_not_retried(fake):
+        c = GraphClient("wrong-token", base_url=fake.base_url, sleep=lambda s: None)
+        e = expect_error(c.me, "auth")
+        assert e.code == 190 and c.retries == 0
+
+    def get_read_timeout_retried(fake):
+        fake.inject(delay=0.5)
+        c = client(fake, read_timeout=0.2)
+        assert c.me()["id"] == "1000"
+        assert c.retries == 1, c.retries
+
+    def upload_read_timeout_not_retried(fake):
+        fake.inject(delay=0.5)
+        c = client(fake, read_timeout=0.2)
+        expect_error(lambda: c.upload_photo("42", BytesIO(b"jpeg")), "fatal")
+        assert c.retries == 0
+
+    def upload_not_retried_on_5xx(fake):
+        # Graph can answer 5xx after the photo went up; a retry would double post.
+        fake.inject(status=502)
+        c = client(fake)
+        expect_error(lambda: c.upload_photo("42", BytesIO(b"x" * 1000)), "fatal")
+        assert c.retries == 0, c.retries
+
+    def connection_refused_retried(fake):
+        port = fake.httpd.server_address[1]
+        fake.stop()
+        c = GraphClient(FAKE_TOKEN, base_url=f"http://127.0.0.1:{port}", max_retries=1,
+                        sleep=lambda s: None)
+        expect_error(lambda: c.upload_photo("42", BytesIO(b"x")), "transient")
+        assert c.retries == 1
+
+    failures = 0
+    for scenario in (retries_5xx, retries_rate_limit, gives_up_after_max_retries,
+                     auth_error_not_retried, get_read_timeout_retried,
+                     upload_read_timeout_not_retried, upload_not_retried_on_5xx,
+                     connection_refused_retried):
+        fake = FakeGraphServer().start()
+        try:
+            scenario(fake)
+            print(f"PASS {scenario.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {scenario.__name__}: {e}")
+        finally:
+            try:
+                fake.stop()
+            except OSError:
+                pass
+    return failures
+
+
+def run_image_checks():
+    """Exercise the OpenAI client's retries against the fake images server. Returns the failure count."""
+    from openai import AuthenticationError, OpenAI
+
+    def client(fake, key=FAKE_OPENAI_KEY, max_retries=2):
+        return OpenAI(api_key=key, base_url=fake.openai_base_url, max_retries=max_retries)
+
+    def generate(c, **kwargs):
+        return c.images.generate(model="gpt-image-1", prompt="a lake", size="1024x1536", n=1, **kwargs)
+
+    def fast_retry(fake, **chaos):
+        fake.configure(retry_after=0.01, **chaos)
+
+    def returns_realistic_png(fake):
+        data = base64.b64decode(generate(client(fake)).data[0].b64_json)
+        assert data.startswith(b"\x89PNG") and len(data) > 1024 * 1024, len(data)
+
+    def jpeg_output_is_smaller(fake):
+        png = generate(client(fake)).data[0].b64_json
+        jpeg = generate(client(fake), output_format="jpeg", output_compression=90).data[0].b64_json
+        assert len(jpeg) * 2 < len(png), (len(jpeg), len(png))
+
+    def retries_5xx(fake):
+        fast_retry(fake)
+        fake.inject(status=500, error=_ImagesHandler.ERRORS["server"][1],
+                    headers={"retry-after-ms": "10"}, count=2)
+        generate(client(fake))
+        assert fake.status_counts() == {500: 2, 200: 1}, fake.status_counts()
+
+    def retries_rate_limit(fake):
+        fast_retry(fake, rate_limit_rate=1.0)
+        try:
+            generate(client(fake, max_retries=2))
+        except Exception as e:
+            assert getattr(e, "status_code", None) == 429, e
+        assert fake.status_counts() == {429: 3}, fake.status_counts()
+
+    def bad_key_not_retried(fake):
+        try:
+            generate(client(fake, key="wrong-key"))
+        except AuthenticationError:
+            pass
+        else:
+            raise AssertionError("expected AuthenticationError")
+        assert fake.status_counts() == {401: 1}, fake.status_counts()
+
+    failures = 0
+    for scenario in (returns_realistic_png, jpeg_output_is_smaller, retries_5xx,
+                     retries_rate_limit, bad_key_not_retried):
+        fake = FakeImagesServer().start()
+        try:
+            scenario(fake)
+            print(f"PASS {scenario.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {scenario.__name__}: {e}")
+        finally:
+            fake.stop()
+    return failures
+
+
+def run_encode_checks():
+    """Render and encode high-detail payloads the way a run does. Returns the failure count."""
+    import contextlib
+    import io
+    import main
+    from PIL import Image
+
+    fake = FakeImagesServer(detail=True)
+    text = "Healing doesn't mean forgetting. It means it no longer controls you."
+
+    def decode(b64):
+        img, _ = main.decode_b64_image(b64)
+        return img
+
+    def renditions_within_budget():
+        img = decode(fake.payload("1024x1536", "png", 100))
+        with contextlib.redirect_stdout(io.StringIO()):
+            renditions = main.render_renditions(img, text, max_workers=1)
+        for name, data in renditions.items():
+            size = len(data.getvalue())
+            assert size <= main.JPEG_MAX_BYTES, (name, size)
+            Image.open(data).verify()
+
+    def budget_above_encoder_buffer():
+        # A feed crop has 1.25 MP, so every 4:4:4 attempt below q95 overflows
+        # Pillow's progressive buffer; with a 2 MiB budget one of them is the pick.
+        img = main.crop_to_aspect(decode(fake.payload("1024x1536", "png", 100)), (4, 5))
+        out, stats = main.encode_jpeg_targeted(img, max_bytes=2 * 1024 * 1024)
+        Image.open(out).verify()
+        assert stats["bytes"] == len(out.getvalue()), stats
+        assert not stats["progressive"] and not stats["over_budget"], stats
+
+    def psnr_floor_over_budget():
+        img = main.crop_to_aspect(decode(fake.payload("1024x1536", "jpeg", 95)), (4, 5))
+        saved = main.JPEG_MIN_PSNR
+        main.JPEG_MIN_PSNR = 60.0
+        try:
+            out, stats = main.encode_jpeg_targeted(img)
+        finally:
+            main.JPEG_MIN_PSNR = saved
+        Image.open(out).verify()
+        assert stats["over_budget"], stats
+
+    failures = 0
+    for scenario in (renditions_within_budget, budget_above_encoder_buffer,
+                     psnr_floor_over_budget):
+        try:
+            scenario()
+            print(f"PASS {scenario.__name__}")
+        except (AssertionError, OSError) as e:
+            failures += 1
+            print(f"FAIL {scenario.__name__}: {e!r}")
+    return failures
+
+
+# =========================================================
+# END TO END
+# =========================================================
+def run_e2e(rounds=5, pages=1, image_latency=2.0, graph_latency=0.05, jitter=0.0,
+            error_rate=0.0, rate_limit_rate=0.0, token_error_rate=0.0, seed=1, verbose=False,
+            detail=False):
+    """Post `rounds` times for each of `pages` pages through the real clients against
+    both fakes (faults apply to both). Returns a report dict."""
+    import contextlib
+    import io
+    import sqlite3
+    import tempfile
+
+    chaos = dict(jitter=jitter, error_rate=error_rate, rate_limit_rate=rate_limit_rate,
+                 token_error_rate=token_error_rate)
+    with FakeImagesServer(detail=detail) as images, FakeGraphServer() as graph:
+        images.configure(seed=seed, latency=image_latency, **chaos)
+        graph.configure(seed=seed + 1, latency=graph_latency, **chaos)
+        # Read by main and graph_client at import time.
+        os.environ.update({
+            "DRY_RUN": "false",
+            "OPENAI_API_KEY": images.api_key,
+            "OPENAI_BASE_URL": images.openai_base_url,
+            "FB_PAGE_ACCESS_TOKEN": FAKE_TOKEN,
+            "GRAPH_API_BASE": graph.base_url,
+        })
+        import main
+        from artifact_cache import ArtifactCache
+
+        main.POST_WINDOWS = [(0, 24)]
+        workdir = tempfile.mkdtemp(prefix="e2e-")
+        main._artifact_cache = ArtifactCache(os.path.join(workdir, "cache"))
+        outcomes = collections.Counter()
+        round_seconds = []
+        graph_retries = 0
+        started = time.perf_counter()
+        for n in range(rounds):
+            contexts = [
+                main.PageContext(f"page{i}", str(1000 + i), FAKE_TOKEN,
+                                 state_dir=os.path.join(workdir, f"round{n}", f"page{i}"))
+                for i in range(pages)
+            ]
+            round_start = time.perf_counter()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                main.run_batch(contexts)
+            round_seconds.append(time.perf_counter() - round_start)
+            for page in contexts:
+                graph_retries += page.graph_client.retries if page.graph_client else 0
+                if os.path.exists(page.path(main.KILL_SWITCH_FILE)):
+                    outcomes["kill_switch"] += 1
+                conn = sqlite3.connect(page.path(main.STATE_DB_FILE))
+                row = conn.execute("SELECT status FROM engagement_log ORDER BY id DESC LIMIT 1").fetchone()
+                conn.close()
+                outcomes[row[0].split(":")[0] if row else "no_post"] += 1
+        elapsed = time.perf_counter() - started
+
+    round_seconds.sort()
+    return {
+        "rounds": rounds,
+        "pages": pages,
+        "outcomes": dict(outcomes),
+        "elapsed_s": round(elapsed, 2),
+        "posts_per_minute": round(outcomes["SUCCESS"] / elapsed * 60, 2),
+        "round_s": {"p50": round(round_seconds[len(round_seconds) // 2], 2),
+                    "max": round(round_seconds[-1], 2)},
+        "image_requests": images.status_counts(),
+        "graph_requests": graph.status_counts(),
+        "graph_retries": graph_retries,
+        "uploaded_kb": round(sum(graph.uploads) / 1024),
+    }
+
+
+def _add_chaos_args(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance of a 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="chance of a rate-limit error")
+    parser.add_argument("--token-error-rate", type=float, default=0.0, help="chance of a token error")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def _serve(fake, label):
+    with fake:
+        print(f"{label} on {fake.base_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake API servers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    graph = sub.add_parser("graph", help="serve a fake Graph API")
+    graph.add_argument("--host", default="127.0.0.1")
+    graph.add_argument("--port", type=int, default=8081)
+    _add_chaos_args(graph)
+    images = sub.add_parser("images", help="serve a fake OpenAI images API")
+    images.add_argument("--host", default="127.0.0.1")
+    images.add_argument("--port", type=int, default=8082)
+    images.add_argument("--detail", action="store_true", help="serve high-detail, hard-to-compress images")
+    _add_chaos_args(images)
+    sub.add_parser("check", help="run GraphClient, OpenAI client and encode scenarios")
+    e2e = sub.add_parser("e2e", help="post end to end against both fakes and report throughput")
+    e2e.add_argument("--rounds", type=int, default=5)
+    e2e.add_argument("--pages", type=int, default=1, help="pages per round, run as one batch")
+    e2e.add_argument("--image-latency", type=float, default=2.0)
+    e2e.add_argument("--graph-latency", type=float, default=0.05)
+    e2e.add_argument("--jitter", type=float, default=0.0)
+    e2e.add_argument("--error-rate", type=float, default=0.0)
+    e2e.add_argument("--rate-limit-rate", type=float, default=0.0)
+    e2e.add_argument("--token-error-rate", type=float, default=0.0)
+    e2e.add_argument("--seed", type=int, default=1)
+    e2e.add_argument("--detail", action="store_true", help="serve high-detail, hard-to-compress images")
+    e2e.add_argument("--verbose", action="store_true", help="show the bot's output")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        sys.exit(1 if run_graph_checks() + run_image_checks() + run_encode_checks() else 0)
+
+    if args.command == "e2e":
+        report = run_e2e(args.rounds, args.pages, args.image_latency, args.graph_latency,
+                         args.jitter, args.error_rate, args.rate_limit_rate,
+                         args.token_error_rate, args.seed, args.verbose, args.detail)
+        print(json.dumps(report, indent=2))
+        return
+
+    chaos = dict(seed=args.seed, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                 rate_limit_rate=args.rate_limit_rate, token_error_rate=args.token_error_rate)
+    if args.command == "images":
+        fake = FakeImagesServer(args.host, args.port, detail=args.detail).configure(**chaos)
+        _serve(fake, f"Fake OpenAI images API (key: {fake.api_key}, base URL {fake.openai_base_url})")
+    else:
+        fake = FakeGraphServer(args.host, args.port).configure(**chaos)
+        _serve(fake, f"Fake Graph API (token: {fake.token})")
+
+
+if __name__ == "__main__":
+    main()
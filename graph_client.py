@@ -0,0 +1,195 @@
+"""Graph API client with a pooled keep-alive session, timeouts and retries.
+
+Transient failures (5xx, dropped connections, rate limits) are retried with
+exponential backoff and jitter; for uploads, only the ones where nothing can
+have been published. Errors are classified so callers only trip the
+kill switch on real auth failures.
+"""
+import os
+import random
+import time
+
+GRAPH_API_BASE = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com")
+GRAPH_API_VERSION = "v19.0"
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60  # photo uploads can be slow
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# https://developers.facebook.com/docs/graph-api/guides/error-handling
+AUTH_ERROR_CODES = {102, 190, 458, 459, 460, 463, 464, 467}
+PERMISSION_ERROR_CODES = {10} | set(range(200, 300))
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613, 80001}
+TRANSIENT_ERROR_CODES = {1, 2}
+
+
+class GraphAPIError(Exception):
+    """A Graph API call failed. kind is auth, rate_limit, transient or fatal."""
+
+    def __init__(self, message, kind="fatal", status=None, code=None, subcode=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.code = code
+        self.subcode = subcode
+
+    @property
+    def is_auth(self):
+        return self.kind == "auth"
+
+    @property
+    def is_retryable(self):
+        return self.kind in ("transient", "rate_limit")
+
+
+def classify_error(status, error):
+    """Map an HTTP status and Graph error body to an error kind."""
+    code = error.get("code")
+    if status == 429 or code in RATE_LIMIT_ERROR_CODES:
+        return "rate_limit"
+    if code in AUTH_ERROR_CODES or code in PERMISSION_ERROR_CODES or status == 401:
+        return "auth"
+    if status >= 500 or code in TRANSIENT_ERROR_CODES or error.get("is_transient"):
+        return "transient"
+    return "fatal"
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Exponential backoff with equal jitter: half fixed, half random."""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class GraphClient:
+    def __init__(self, token, base_url=GRAPH_API_BASE, version=GRAPH_API_VERSION,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, sleep=time.sleep):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.version = version
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.retries = 0
+
+        self.session = requests.Session()
+        # The token goes in a header so it never ends up in URLs or exception text.
+        self.session.headers["Authorization"] = f"OAuth {token}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def url(self, path):
+        return f"{self.base_url}/{self.version}/{path.lstrip('/')}"
+
+    def request(self, method, path, params=None, data=None, files=None, idempotent=None):
+        """Send a request, retrying transient failures. Returns the JSON body.
+
+        idempotent defaults to True for GET only. Other requests are not
+        retried after a read timeout or a 5xx, since the post may already
+        have been published; rate limits and refused connections still are.
+        """
+        import requests
+
+        if idempotent is None:
+            idempotent = method.upper() == "GET"
+        attempt = 0
+        while True:
+            for value in (files or {}).values():
+                if hasattr(value[1], "seek"):
+                    value[1].seek(0)
+            retry_after = None
+            try:
+                r = self.session.request(
+                    method, self.url(path), params=params, data=data, files=files,
+                    timeout=self.timeout,
+                )
+            except requests.exceptions.ConnectTimeout as e:
+                err = GraphAPIError(f"Connect timeout: {e.__class__.__name__}", "transient")
+            except requests.exceptions.ReadTimeout as e:
+                kind = "transient" if idempotent else "fatal"
+                err = GraphAPIError(f"Read timeout: {e.__class__.__name__}", kind)
+            except requests.exceptions.ConnectionError as e:
+                kind = "transient" if idempotent or _failed_before_send(e) else "fatal"
+                err = GraphAPIError(f"Connection error: {e.__class__.__name__}", kind)
+            else:
+                body = _json_body(r)
+                if r.status_code == 200:
+                    return body
+                error = body.get("error") or {}
+                kind = classify_error(r.status_code, error)
+                if kind == "transient" and not idempotent:
+                    kind = "fatal"
+                err = GraphAPIError(
+                    f"FB Error {r.status_code}: {error.get('message') or r.text[:200]}",
+                    kind,
+                    status=r.status_code,
+                    code=error.get("code"),
+                    subcode=error.get("error_subcode"),
+                )
+                retry_after = r.headers.get("Retry-After")
+
+            if not err.is_retryable or attempt >= self.max_retries:
+                raise err
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            print(f"Graph {method} {path} failed ({err}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            self.sleep(delay)
+            self.retries += 1
+            attempt += 1
+
+    def warm(self):
+        """Open a pooled connection ahead of the first real request.
+
+        Best effort: returns False instead of raising if the host is unreachable.
+        """
+        import requests
+
+        try:
+            self.session.head(self.base_url, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            return False
+        return True
+
+    def me(self):
+        return self.request("GET", "/me")
+
+    def debug_token(self, token):
+        """Token metadata: is_valid, expires_at (0 = never), scopes, ..."""
+        return self.request("GET", "/debug_token", params={"input_token": token}).get("data", {})
+
+    def upload_photo(self, page_id, image_buffer, published=True):
+        return self.request(
+            "POST",
+            f"/{page_id}/photos",
+            data={"published": "true" if published else "false"},
+            files={"source": ("image.jpg", image_buffer, "image/jpeg")},
+        )
+
+
+def _failed_before_send(exc):
+    """True if the connection was never established, so nothing was sent."""
+    from urllib3.exceptions import NewConnectionError
+
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _json_body(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
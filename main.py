@@ -1,76 +1,184 @@
+import time
+
+_PROCESS_START = time.perf_counter()
+
 import os
 import random
+import asyncio
 import base64
+import contextvars
+import functools
+import hashlib
 import json
-import requests
-import csv
+import threading
 from io import BytesIO
 from datetime import datetime, date
-import pytz
+from zoneinfo import ZoneInfo
 
-from openai import OpenAI
-from PIL import Image, ImageDraw, ImageFont, ImageStat, ImageFilter
+from state_store import LOG_ARCHIVE_DIR, StateStore, STATE_DB_FILE
+from artifact_cache import ArtifactCache, artifact_key
+from content_bank import BANK_INDEX_FILE, BANK_SOURCE_FILE, load_bank, nth_not_excluded
+from tracing import TRACE_PROM_FILE, annotate, finish_run, span, start_run, traced
+from planner import (
+    PLAN_FILE, SLOT_HOLIDAY, SLOT_KINDS, SLOT_NONE, SLOT_REGULAR, PlanRules,
+    holidays_for_year, plan_digest, plan_year, read_slot, write_plan,
+)
+
+# Heavy dependencies (openai, PIL, requests) are imported lazily by the
+# functions that need them, so hourly runs that exit at preflight never
+# pay for them.
 
 # =========================================================
 # ENV / CONFIG
 # =========================================================
 OPENAI_KEY = os.environ.get("OPENAI_API_KEY")
+# Point at a local stand-in (python fakes.py images) for offline runs.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
 FB_TOKEN = os.environ.get("FB_PAGE_ACCESS_TOKEN")
 FB_PAGE_ID = os.environ.get("FB_PAGE_ID")
 TIMEZONE = os.getenv("TIMEZONE", "Asia/Manila")
 DRY_RUN = os.getenv("DRY_RUN", "false").lower() == "true"
 
-if not OPENAI_KEY and not DRY_RUN:
-    raise Exception("OPENAI_API_KEY missing")
-if (not FB_TOKEN or not FB_PAGE_ID) and not DRY_RUN:
-    raise Exception("Facebook secrets missing")
+_client = None
+_graph_client = None
+_graph_client_lock = threading.Lock()
 
-if not DRY_RUN:
-    client = OpenAI(api_key=OPENAI_KEY)
-else:
-    client = None
+# =========================================================
+# PAGES (--batch RUNS SEVERAL PAGES CONCURRENTLY)
+# =========================================================
+# --batch reads a JSON list of page configs:
+#   {"name": ..., "page_id": ..., "token_env": ..., "timezone"?: ..., "bank"?: ..., "state_dir"?: ...}
+# Tokens come from the named environment variable, never from the file.
+PAGES_FILE = "pages.json"
+PAGE_STATE_DIR = "pages/{name}"
+
+# Shared by every page, so N pages make no more concurrent API calls than this.
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+_generation_slots = threading.BoundedSemaphore(GENERATION_CONCURRENCY)
+_upload_slots = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
+
+class PageContext:
+    """One page's settings, plus its own state store, content bank and Graph client."""
+
+    def __init__(self, name, page_id, token, timezone=None, bank_source=BANK_SOURCE_FILE,
+                 state_dir=None):
+        self.name = name
+        self.page_id = page_id
+        self.token = token
+        self.timezone = timezone or TIMEZONE
+        self.bank_source = bank_source
+        self.bank_index = (
+            BANK_INDEX_FILE if bank_source == BANK_SOURCE_FILE
+            else os.path.splitext(bank_source)[0] + ".idx"
+        )
+        self.state_dir = state_dir or PAGE_STATE_DIR.format(name=name)
+        self.store = None
+        self.bank = None
+        self.graph_client = None
+
+    def path(self, filename):
+        return os.path.join(self.state_dir, filename)
+
+_page = contextvars.ContextVar("page", default=None)
+
+def current_page():
+    """The page being run in batch mode, or None for the env-configured page."""
+    return _page.get()
+
+def page_credentials():
+    """(token, page id) of the current page."""
+    page = _page.get()
+    return (page.token, page.page_id) if page else (FB_TOKEN, FB_PAGE_ID)
+
+def page_timezone():
+    page = _page.get()
+    return ZoneInfo(page.timezone if page else TIMEZONE)
+
+def page_file(filename):
+    """Where a per-page state file lives: the page's state dir in batch mode."""
+    page = _page.get()
+    return page.path(filename) if page else filename
+
+def validate_secrets():
+    if not OPENAI_KEY and not DRY_RUN:
+        raise Exception("OPENAI_API_KEY missing")
+    token, page_id = page_credentials()
+    if (not token or not page_id) and not DRY_RUN:
+        raise Exception("Facebook secrets missing")
+
+def get_client():
+    """Build the OpenAI client on first use (None in dry run)."""
+    global _client
+    if _client is None and not DRY_RUN:
+        from openai import OpenAI
+        _client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+def now_local():
+    return datetime.now(page_timezone())
+
+_run_start = _PROCESS_START
+
+def report_startup(path):
+    """Print how long this run took to reach a decision on the given path."""
+    elapsed_ms = (time.perf_counter() - _run_start) * 1000
+    print(f"[startup] {path}: {elapsed_ms:.1f} ms")
+    annotate(path=path, startup_ms=round(elapsed_ms, 1))
 
 # =========================================================
 # COST CONTROL
 # =========================================================
 POST_WINDOWS = [(0, 2)]  # 7–10 PM (expanded for testing)
-LAST_POST_FILE = "last_post.txt"
-HOLIDAY_HISTORY_FILE = "holiday_history.json"
-
-# STATE FILES
-MONTHLY_USAGE_FILE = "monthly_usage.json"
-THOUGHT_HISTORY_FILE = "thought_history.json"
-ENGAGEMENT_LOG_FILE = "engagement_log.csv"
-ERROR_LOG_FILE = "error_log.txt"
+
+# STATE: everything except the kill switch lives in STATE_DB_FILE
 KILL_SWITCH_FILE = "posting_disabled.flag"
 
 MAX_MONTHLY_IMAGES = 30
 THOUGHT_COOLDOWN_DAYS = 35  # Full month + buffer to prevent recycling
 SCENE_COOLDOWN_DAYS = 5     # Avoid same scene within 5 days
-SCENE_HISTORY_FILE = "scene_history.json"
+
+_store = None
+
+_artifact_cache = None
+
+def get_store():
+    """Open the state database once per process (once per page in batch mode)."""
+    global _store
+    page = _page.get()
+    if page is not None:
+        if page.store is None:
+            os.makedirs(page.state_dir, exist_ok=True)
+            page.store = StateStore(page.path(STATE_DB_FILE), legacy_dir=None)
+        return page.store
+    if _store is None:
+        _store = StateStore(STATE_DB_FILE)
+    return _store
+
+def get_artifact_cache():
+    global _artifact_cache
+    if _artifact_cache is None:
+        _artifact_cache = ArtifactCache()
+    return _artifact_cache
 
 def is_good_posting_time():
-    tz = pytz.timezone(TIMEZONE)
-    hour = datetime.now(tz).hour
+    hour = now_local().hour
     return any(start <= hour < end for start, end in POST_WINDOWS)
 
 def already_posted_today():
-    today = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d")
-    if os.path.exists(LAST_POST_FILE):
-        with open(LAST_POST_FILE) as f:
-            return f.read().strip() == today
-    return False
+    today = now_local().strftime("%Y-%m-%d")
+    return get_store().get_meta("last_post") == today
 
 def mark_posted_today():
-    today = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d")
-    with open(LAST_POST_FILE, "w") as f:
-        f.write(today)
+    today = now_local().strftime("%Y-%m-%d")
+    get_store().set_meta("last_post", today)
 
 # =========================================================
 # FEATURE LOGIC
 # =========================================================
 def check_kill_switch():
-    if os.path.exists(KILL_SWITCH_FILE):
+    if os.path.exists(page_file(KILL_SWITCH_FILE)):
         return True
     return False
 
@@ -84,7 +192,7 @@ def validate_fonts():
         raise Exception(f"Missing font files: {missing}")
 
 def enable_kill_switch():
-    with open(KILL_SWITCH_FILE, "w") as f:
+    with open(page_file(KILL_SWITCH_FILE), "w") as f:
         f.write("DISABLED DUE TO FB API ERROR")
 
 def load_json_file(filepath):
@@ -94,235 +202,304 @@ def load_json_file(filepath):
         return json.load(f)
 
 def save_json_file(filepath, data):
-    with open(filepath, "w") as f:
+    # Write to a sibling temp file and swap it in, so a crash mid-write
+    # never leaves a truncated file behind.
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
 
 def check_monthly_cap():
-    data = load_json_file(MONTHLY_USAGE_FILE)
-    month = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m")
-    count = data.get(month, 0)
-    return count >= MAX_MONTHLY_IMAGES
+    """True once this month's images are used up.
+
+    Regular days leave room for the holidays still to come this month.
+    """
+    today = now_local().date()
+    used = get_store().monthly_usage(today.strftime("%Y-%m"))
+    if get_today_holiday() is None:
+        used += upcoming_holidays(today)
+    return used >= MAX_MONTHLY_IMAGES
 
 def increment_monthly_cap():
-    data = load_json_file(MONTHLY_USAGE_FILE)
-    month = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m")
-    data[month] = data.get(month, 0) + 1
-    save_json_file(MONTHLY_USAGE_FILE, data)
+    month = now_local().strftime("%Y-%m")
+    get_store().increment_monthly_usage(month)
 
 def get_thought_cooldown_history():
-    return load_json_file(THOUGHT_HISTORY_FILE)
+    return get_store().thought_history()
 
 def update_thought_history(thought_text):
-    history = get_thought_cooldown_history()
-    today = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d")
-    history[thought_text] = today
-    save_json_file(THOUGHT_HISTORY_FILE, history)
+    today = now_local().strftime("%Y-%m-%d")
+    get_store().set_thought_used(thought_text, today)
+
+def update_scene_history(scene_name):
+    today = now_local().strftime("%Y-%m-%d")
+    get_store().set_scene_used(scene_name, today)
 
 def log_engagement(scene, thought, status="POSTED"):
-    exists = os.path.exists(ENGAGEMENT_LOG_FILE)
-    with open(ENGAGEMENT_LOG_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not exists:
-            writer.writerow(["Date", "Time", "Scene", "Thought", "Status"])
-        
-        now = datetime.now(pytz.timezone(TIMEZONE))
-        writer.writerow([
-            now.strftime("%Y-%m-%d"),
-            now.strftime("%H:%M:%S"),
-            scene,
-            thought,
-            status
-        ])
+    now = now_local()
+    get_store().log_engagement(
+        now.strftime("%Y-%m-%d"),
+        now.strftime("%H:%M:%S"),
+        scene,
+        thought,
+        status,
+    )
 
 def log_error(e):
-    now = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")
-    with open(ERROR_LOG_FILE, "a") as f:
-        f.write(f"[{now}] ERROR: {e}\n")
-        import traceback
-        traceback.print_exc(file=f)
+    import traceback
+
+    now = now_local().strftime("%Y-%m-%d %H:%M:%S")
+    get_store().log_error(now, str(e), traceback.format_exc())
+
+def rotate_logs():
+    """Archive engagement/error log rows from before this month."""
+    archive_dir = page_file(LOG_ARCHIVE_DIR)
+    moved = get_store().rotate_logs(now_local().strftime("%Y-%m"), archive_dir)
+    if moved:
+        print(f"Archived {moved} log row(s) to {archive_dir}/.")
+
+HISTORY_CHECK_PICKS = 20
+
+def compact_history(force=False):
+    """Once a month, archive history entries past their cooldown or year.
+
+    The compaction is rolled back unless the cooldown sets, this year's
+    holidays and a run of seeded choose_scene_and_text() picks come out
+    the same afterwards.
+    """
+    store = get_store()
+    now = now_local()
+    month = now.strftime("%Y-%m")
+    if not force and store.get_meta("history_compacted") == month:
+        return 0
+    today = now.date()
+    first_thought = today.toordinal() - THOUGHT_COOLDOWN_DAYS + 1
+    first_scene = today.toordinal() - SCENE_COOLDOWN_DAYS + 1
+
+    def decisions():
+        # A private generator: batch pages pick concurrently from the shared one.
+        rng = random.Random(today.toordinal())
+        picks = [choose_scene_and_text(rng=rng, quiet=True) for _ in range(HISTORY_CHECK_PICKS)]
+        return (
+            store.thoughts_used_since(first_thought),
+            store.scenes_used_since(first_scene),
+            store.holiday_history().get(str(today.year), []),
+            [(scene_data["name"], text) for scene_data, text in picks],
+        )
+
+    before = decisions()
 
-def check_token_health():
+    def verify():
+        if decisions() != before:
+            raise Exception("History compaction would change selection results; rolled back.")
+
+    archive_dir = page_file(LOG_ARCHIVE_DIR)
+    moved = store.compact_history(first_thought, first_scene, today.year, month, verify, archive_dir)
+    store.set_meta("history_compacted", month)
+    if moved:
+        print(f"Archived {moved} expired history entries to {archive_dir}/.")
+    return moved
+
+def save_pending_post(post):
+    """Remember the content of a post that is about to be generated."""
+    post = dict(post, created=now_local().strftime("%Y-%m-%d"))
+    get_store().set_meta("pending_post", json.dumps(post))
+
+def clear_pending_post():
+    get_store().set_meta("pending_post", "")
+
+def load_pending_post():
+    """Return a previously failed post to retry, or None.
+
+    Regular posts are retried while their artifacts can still be cached;
+    holiday posts only on the holiday itself.
+    """
+    raw = get_store().get_meta("pending_post")
+    if not raw:
+        return None
+    post = json.loads(raw)
+    today = now_local().date()
+    created = date.fromisoformat(post["created"])
+    if post.get("holiday"):
+        return post if created == today else None
+    if (today - created).days > get_artifact_cache().max_age_seconds // 86400:
+        return None
+    return post
+
+def get_graph_client():
+    """Shared Graph API client (pooled keep-alive session)."""
+    global _graph_client
+    page = _page.get()
+    # The run pipeline may ask for it from a warm-up thread and the token check at once.
+    with _graph_client_lock:
+        if page is not None:
+            if page.graph_client is None:
+                from graph_client import GraphClient
+                page.graph_client = GraphClient(page.token)
+            return page.graph_client
+        if _graph_client is None:
+            from graph_client import GraphClient
+            _graph_client = GraphClient(FB_TOKEN)
+    return _graph_client
+
+# Token health is cached in the state store; a live check only happens when
+# the cache is stale at posting time, or hourly once expiry is close.
+TOKEN_HEALTH_TTL_HOURS = 24
+TOKEN_EXPIRY_WARNING_DAYS = 5
+TOKEN_EXPIRY_RECHECK_HOURS = 6
+
+def _token_fingerprint():
+    token, _ = page_credentials()
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+
+def cached_token_health():
+    raw = get_store().get_meta("token_health")
+    if not raw:
+        return None
+    cached = json.loads(raw)
+    # A rotated token invalidates the cache.
+    return cached if cached.get("token") == _token_fingerprint() else None
+
+def token_near_expiry(cached, now=None):
+    now = now if now is not None else time.time()
+    expires_at = (cached or {}).get("expires_at") or 0
+    return bool(expires_at) and expires_at - now < TOKEN_EXPIRY_WARNING_DAYS * 86400
+
+def token_known_bad(cached, now=None):
+    """True if the cached health already rules the token out (failed or expired)."""
+    if not cached:
+        return False
+    now = now if now is not None else time.time()
+    expires_at = cached.get("expires_at") or 0
+    return not cached.get("ok") or bool(expires_at) and expires_at <= now
+
+def token_health_is_fresh(cached, now=None):
+    now = now if now is not None else time.time()
+    if not cached or not cached.get("ok"):
+        return False
+    age = now - cached["checked_at"]
+    if cached.get("expires_at") and cached["expires_at"] <= now:
+        return False
+    if token_near_expiry(cached, now):
+        return age < TOKEN_EXPIRY_RECHECK_HOURS * 3600
+    return age < TOKEN_HEALTH_TTL_HOURS * 3600
+
+def _record_token_stat(hit):
+    store = get_store()
+    stats = json.loads(store.get_meta("token_health_stats") or '{"hits": 0, "misses": 0}')
+    stats["hits" if hit else "misses"] += 1
+    store.set_meta("token_health_stats", json.dumps(stats))
+    return stats
+
+def _live_token_check():
+    """Ask the Graph API about the token. Returns (ok, expires_at)."""
+    from graph_client import GraphAPIError
+
+    client = get_graph_client()
+    try:
+        data = client.debug_token(page_credentials()[0])
+    except GraphAPIError as e:
+        if e.is_auth or e.is_retryable:
+            raise
+        # debug_token needs app-level access some tokens lack; /me still
+        # proves the token works, just without an expiry.
+        client.me()
+        return True, None
+    if not data.get("is_valid", False):
+        raise GraphAPIError("Token reported invalid by debug_token", "auth")
+    return True, data.get("expires_at") or 0
+
+@traced("token_health")
+def check_token_health(force=False):
     if DRY_RUN:
         return True
-    
-    url = f"https://graph.facebook.com/me?access_token={FB_TOKEN}"
+
+    from graph_client import GraphAPIError
+
+    cached = cached_token_health()
+    if not force and token_health_is_fresh(cached):
+        stats = _record_token_stat(hit=True)
+        age_h = (time.time() - cached["checked_at"]) / 3600
+        print(f"[token] cache hit, checked {age_h:.1f}h ago "
+              f"(hits={stats['hits']} misses={stats['misses']})")
+        return True
+
+    stats = _record_token_stat(hit=False)
     try:
-        r = requests.get(url)
-        if r.status_code != 200:
-            log_error(f"Token Health Check Failed: {r.text}")
+        ok, expires_at = _live_token_check()
+    except GraphAPIError as e:
+        log_error(f"Token Health Check Failed: {e}")
+        get_store().set_meta("token_health", "")
+        # Only a rejected token disables posting; outages just skip this run.
+        if e.is_auth:
             enable_kill_switch()
-            return False
-        return True
-    except Exception as e:
-        log_error(f"Token Health Check Exception: {e}")
-        enable_kill_switch()
         return False
 
+    get_store().set_meta("token_health", json.dumps({
+        "token": _token_fingerprint(),
+        "ok": ok,
+        "checked_at": time.time(),
+        "expires_at": expires_at,
+    }))
+    expiry = (
+        "never expires" if expires_at == 0
+        else "expiry unknown" if expires_at is None
+        else f"expires {datetime.fromtimestamp(expires_at, page_timezone()):%Y-%m-%d %H:%M}"
+    )
+    print(f"[token] live check ok, {expiry} (hits={stats['hits']} misses={stats['misses']})")
+    if token_near_expiry({"expires_at": expires_at}):
+        print(f"WARNING: page token expires within {TOKEN_EXPIRY_WARNING_DAYS} days. Refresh it.")
+    return True
+
 
 # =========================================================
-# CURATED HUMAN THOUGHT BANK - 38 UNIQUE THOUGHTS
-# =========================================================
-THOUGHT_BANK = {
-    # GROWTH & PATIENCE (7)
-    "growth": [
-        "Growth is quiet when no one is watching.",
-        "Not everything that's slow is lost.",
-        "I stayed long enough to hear myself think.",
-        "Becoming who you're meant to be takes time.",
-        "Some seasons are just for learning, not harvesting.",
-        "You are not behind. You are exactly where you need to be.",
-        "The version of you that's coming will be worth the wait.",
-    ],
-    # FAITH & TRUST (7)
-    "faith": [
-        "Some nights, faith is the only shelter.",
-        "I whispered prayers I didn't know how to say out loud.",
-        "God hears you, even in the rain.",
-        "God has a plan. Trust, wait, and believe.",
-        "Even here, I was not forgotten.",
-        "Faith sometimes looks like the next step.",
-        "When you can't see the path, trust the One who does.",
-    ],
-    # LOVE & CONNECTION (6)
-    "love": [
-        "Some friendships are answers to prayers we never said out loud.",
-        "Love is choosing patience when it would be easier to leave.",
-        "The people who stay are the ones who matter.",
-        "Not every connection is meant to last, but some are meant to teach.",
-        "You are someone's reason to believe in kindness.",
-        "Home isn't always a place. Sometimes it's a person.",
-    ],
-    # HEALING & LETTING GO (6)
-    "healing": [
-        "I let go of what I could no longer carry.",
-        "Healing doesn't mean forgetting. It means it no longer controls you.",
-        "Some goodbyes are blessings in disguise.",
-        "You don't have to carry yesterday into tomorrow.",
-        "Rest is not quitting. It's preparation.",
-        "It's okay to outgrow who you used to be.",
-    ],
-    # HOPE & NEW BEGINNINGS (7)
-    "hope": [
-        "The stars stayed with me.",
-        "Still waters teach louder lessons.",
-        "Some answers arrive gently.",
-        "Hope often arrives quietly, not loudly.",
-        "Every ending is just a new beginning wearing a disguise.",
-        "The light you're looking for might already be inside you.",
-        "Tomorrow is unwritten. That's the beauty of it.",
-    ],
-    # PEACE & SOLITUDE (5)
-    "peace": [
-        "I didn't know where I was going, only that I had to keep walking.",
-        "The road teaches patience.",
-        "Silence isn't empty. It's full of answers.",
-        "Peace isn't the absence of storms. It's finding calm within them.",
-        "Sometimes doing nothing is the bravest thing you can do.",
-    ],
-}
-
+# CONTENT BANK (content/bank.json, COMPILED TO content/bank.idx)
 # =========================================================
-# RANDOMIZED PROMPT COMPONENTS (HIGH-QUALITY TEMPLATE)
-# =========================================================
-
-# SCENES (what we're looking at)
-SCENES = [
-    {
-        "name": "rural_path",
-        "scene": "A winding dirt path through tall grass overlooking a rural town",
-        "details": "Rolling hills, scattered rooftops, wildflowers along the path"
-    },
-    {
-        "name": "calm_river",
-        "scene": "A calm river with shimmering reflections and overhanging trees",
-        "details": "Mossy riverbanks, water lilies, lush greenery"
-    },
-    {
-        "name": "wooden_boat",
-        "scene": "A small wooden boat drifting quietly beneath leafy branches",
-        "details": "Crystal clear water, dappled light, overhanging fruit trees"
-    },
-    {
-        "name": "countryside_hill",
-        "scene": "A countryside hillside beneath a large shade tree",
-        "details": "Grassy meadow, distant village rooftops, scattered wildflowers"
-    },
-    {
-        "name": "seaside_cabin",
-        "scene": "A cozy seaside cabin surrounded by plants",
-        "details": "Weathered wood, potted flowers, ocean view, sandy path"
-    },
-    {
-        "name": "ocean_kitchen",
-        "scene": "An open kitchen interior overlooking the ocean",
-        "details": "Warm sunlight streaming in, potted herbs, vintage details"
-    },
-    {
-        "name": "campfire_van",
-        "scene": "A parked van in an open field near a quiet campfire",
-        "details": "Open countryside, distant hills, warm firelight glow"
-    },
-    {
-        "name": "village_road",
-        "scene": "A narrow village road winding through rolling hills",
-        "details": "Stone walls, cottages, trees lining the road, peaceful atmosphere"
-    },
-]
-
-# SEASONS + SKY
-SEASONS = {
-    "summer": [
-        "Bright summer sky with towering white cumulus clouds",
-        "Deep blue sky with soft atmospheric haze",
-    ],
-    "autumn": [
-        "Soft golden sky with warm amber clouds",
-        "Clear afternoon sky with drifting autumn leaves",
-    ],
-    "spring_rain": [
-        "Overcast spring sky with gentle rainfall",
-        "Soft gray-blue clouds with light mist",
-    ],
-    "winter": [
-        "Clear winter sky with pale sunlight",
-        "Cold blue sky with thin clouds and crisp air",
-    ],
+_bank = None
+
+def get_bank():
+    """The compiled content bank, opened (and recompiled if stale) once per process."""
+    global _bank
+    page = _page.get()
+    if page is not None:
+        if page.bank is None:
+            page.bank = load_bank(page.bank_source, page.bank_index)
+        return page.bank
+    if _bank is None:
+        _bank = load_bank()
+    return _bank
+
+# Old module-level names, resolved from the bank on first access.
+_BANK_ATTRS = {
+    "THOUGHT_BANK": "thoughts",
+    "SCENES": "scenes",
+    "SEASONS": "seasons",
+    "LIGHTING_OPTIONS": "lighting",
+    "ATMOSPHERE_OPTIONS": "atmosphere",
+    "MOOD_OPTIONS": "moods",
 }
 
-# LIGHTING OPTIONS
-LIGHTING_OPTIONS = [
-    "Warm midday sunlight with natural dappled shadows",
-    "Low-angle golden hour sunlight casting long shadows",
-    "Cool moonlight softly illuminating the landscape",
-    "Diffused soft light through clouds and mist",
-    "Crisp winter sunlight with cool, elongated shadows",
-]
-
-# ATMOSPHERE + MOTION
-ATMOSPHERE_OPTIONS = [
-    "Soft atmospheric haze with subtle lens flare",
-    "Gentle breeze moving grass and leaves",
-    "Light mist near the horizon with soft light bloom",
-    "Rain ripples on water and wet reflective surfaces",
-    "Still air with faint drifting particles",
-]
-
-# MOOD OPTIONS
-MOOD_OPTIONS = [
-    "Calm, nostalgic, peaceful mood",
-    "Quiet, reflective, emotional mood",
-    "Warm, comforting, tranquil mood",
-    "Serene, contemplative, timeless mood",
-]
+def __getattr__(name):
+    if name == "HOLIDAY_POSTS":
+        holidays = holidays_for_year(get_bank().holidays, now_local().year)
+        return {(day.month, day.day): holiday for day, holiday in holidays.items()}
+    if name in _BANK_ATTRS:
+        return getattr(get_bank(), _BANK_ATTRS[name])
+    if name == "SCENE_PROMPTS":
+        return {scene["name"]: scene["scene"] for scene in get_bank().scenes}
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def generate_image_prompt(scene_data):
     """Generate a complete prompt from randomized components."""
     # Pick random components
-    season_key = random.choice(list(SEASONS.keys()))
-    sky = random.choice(SEASONS[season_key])
-    lighting = random.choice(LIGHTING_OPTIONS)
-    atmosphere = random.choice(ATMOSPHERE_OPTIONS)
-    mood = random.choice(MOOD_OPTIONS)
+    bank = get_bank()
+    season_key = random.choice(list(bank.seasons.keys()))
+    sky = random.choice(bank.seasons[season_key])
+    lighting = random.choice(bank.lighting)
+    atmosphere = random.choice(bank.atmosphere)
+    mood = random.choice(bank.moods)
     
     # Build the master prompt
     prompt = (
@@ -339,9 +516,6 @@ def generate_image_prompt(scene_data):
     
     return prompt, season_key
 
-# Keep SCENE_PROMPTS for backwards compatibility (holiday posts use this format)
-SCENE_PROMPTS = {scene["name"]: scene["scene"] for scene in SCENES}
-
 # Seasonal Map: Month -> List of preferred thought categories
 SEASONAL_MAP = {
     "12": ["hope", "faith"],
@@ -350,138 +524,219 @@ SEASONAL_MAP = {
     "10": ["healing", "peace"],
 }
 
-def choose_scene_and_text():
-    # 1. Load history
-    history = get_thought_cooldown_history()
-    today_dt = datetime.now(pytz.timezone(TIMEZONE))
-    
-    # 2. Filter eligible thoughts (not on cooldown)
-    all_eligible = []
-    
-    for category, thoughts in THOUGHT_BANK.items():
-        for t in thoughts:
-            last_used_str = history.get(t)
-            if last_used_str:
-                last_used_dt = datetime.strptime(last_used_str, "%Y-%m-%d").replace(tzinfo=pytz.timezone(TIMEZONE))
-                days_diff = (today_dt - last_used_dt).days
-                if days_diff < THOUGHT_COOLDOWN_DAYS:
-                    continue  # Skip if used recently
-            all_eligible.append((category, t))
-    
-    if not all_eligible:
-        # Fallback if literally everything is on cooldown
-        category = random.choice(list(THOUGHT_BANK.keys()))
-        text = random.choice(THOUGHT_BANK[category])
-        scene_data = random.choice(SCENES)
-        return scene_data, text
-    
-    # 3. Compute available scenes (with cooldown check)
-    scene_history = load_json_file(SCENE_HISTORY_FILE)
-    recent_scenes = []
-    for s, date_str in scene_history.items():
-        try:
-            used_dt = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=pytz.timezone(TIMEZONE))
-            if (today_dt - used_dt).days < SCENE_COOLDOWN_DAYS:
-                recent_scenes.append(s)
-        except:
-            pass
-    
-    available_scenes = [s for s in SCENES if s["name"] not in recent_scenes]
-    if not available_scenes:
-        available_scenes = SCENES  # Fallback if all on cooldown
-    
-    # 4. Apply seasonal preference if applicable
+def choose_scene_and_text(reserved_thoughts=(), reserved_scenes=(), rng=random, quiet=False):
+    """Pick a scene and thought off cooldown.
+
+    Reserved thoughts and scenes (e.g. already sitting in the post queue) are
+    treated as if they had just been used. rng defaults to the shared random
+    module; quiet skips the dry-run notes.
+    """
+    store = get_store()
+    bank = get_bank()
+    today_dt = now_local()
+    today = today_dt.date().toordinal()
+
+    # 1. Thoughts used inside the cooldown window (indexed range query)
+    cooling = set(store.thoughts_used_since(today - THOUGHT_COOLDOWN_DAYS + 1))
+    cooling.update(reserved_thoughts)
+
+    # 2. Scenes off cooldown
+    recent_scenes = set(store.scenes_used_since(today - SCENE_COOLDOWN_DAYS + 1))
+    recent_scenes.update(reserved_scenes)
+    scenes = bank.scenes
+    recent_idx = sorted(i for i, s in enumerate(scenes) if s["name"] in recent_scenes)
+    if len(recent_idx) < len(scenes):
+        scene_data = scenes[nth_not_excluded(len(scenes), recent_idx, rng)]
+    else:
+        scene_data = rng.choice(scenes)  # Fallback if all on cooldown
+
+    # 3. Seasonal preference, then the full bank
     current_month = today_dt.strftime("%m")
     preferred_categories = SEASONAL_MAP.get(current_month, [])
-    
     if preferred_categories:
-        seasonal_eligible = [x for x in all_eligible if x[0] in preferred_categories]
-        if seasonal_eligible:
-            if DRY_RUN:
+        picked = bank.pick_thought(preferred_categories, cooling, rng)
+        if picked:
+            if DRY_RUN and not quiet:
                 print(f"Applying seasonal filter for month {current_month}: {preferred_categories}")
-            category, text = random.choice(seasonal_eligible)
-            scene_data = random.choice(available_scenes)
-            return scene_data, text
-    
-    # 5. Pick random from full valid list
-    category, text = random.choice(all_eligible)
-    scene_data = random.choice(available_scenes)
-    return scene_data, text
+            return scene_data, picked[1]
 
-# =========================================================
-# HOLIDAY POSTS — EXACT DATE ONLY
-# =========================================================
-HOLIDAY_POSTS = {
-    (1, 1):  {"name": "new_year", "text": "This year, I'm learning to walk slower and trust God more.", "scene": "quiet lakeside at dawn, person sitting on dock watching sunrise, mist over water"},
-    (2, 14): {"name": "valentines", "text": "Love is choosing patience when it would be easier to leave.", "scene": "couple walking hand in hand on evening street with warm cafe lights"},
-    (3, 8):  {"name": "womens_day", "text": "Strong women don't always speak loudly. Sometimes they endure quietly.", "scene": "woman by window with morning light streaming in, cup of coffee, peaceful strength"},
-    (4, 1):  {"name": "april_fools", "text": "Not everything that looks like failure is the end of the story.", "scene": "winding road through hills with light breaking through clouds, hopeful journey"},
-    (5, 1):  {"name": "labor_may", "text": "The work you do in silence still matters.", "scene": "worker resting at sunset, overlooking completed work, peaceful exhaustion"},
-    (6, 1):  {"name": "pride", "text": "You are allowed to exist without explaining yourself.", "scene": "person standing in open field at sunrise, arms open, freedom"},
-    (7, 4):  {"name": "independence", "text": "Freedom begins when fear no longer decides for you.", "scene": "open road under wide dramatic sky, journey ahead"},
-    (8, 4):  {"name": "friendship", "text": "Some friendships are answers to prayers we never said out loud.", "scene": "two friends sitting on hillside at golden hour, laughing together"},
-    (9, 1):  {"name": "labor_sep", "text": "Rest is not quitting. It's preparation.", "scene": "empty park bench under shady tree, late afternoon dappled light"},
-    (10, 31):{"name": "halloween", "text": "Not everything hidden is dangerous. Some things are healing.", "scene": "foggy forest path with lantern glow, mysterious but peaceful"},
-    (11, 28):{"name": "thanksgiving", "text": "Gratitude doesn't erase pain, but it softens the weight.", "scene": "warm dinner table by window with autumn light, family gathering"},
-    (12, 25):{"name": "christmas", "text": "Hope often arrives quietly, not loudly.", "scene": "snowy street at night with warm glowing windows, peaceful christmas eve"},
-}
+    picked = bank.pick_thought(list(bank.thoughts), cooling, rng)
+    if picked:
+        return scene_data, picked[1]
 
-def load_holiday_history():
-    if not os.path.exists(HOLIDAY_HISTORY_FILE):
-        return {}
-    with open(HOLIDAY_HISTORY_FILE) as f:
-        return json.load(f)
+    # Fallback if literally everything is on cooldown
+    category = rng.choice(list(bank.thoughts.keys()))
+    text = rng.choice(bank.thoughts[category])
+    return rng.choice(scenes), text
 
-def save_holiday_history(history):
-    with open(HOLIDAY_HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+# =========================================================
+# HOLIDAY POSTS — EXACT DATE ONLY (MOVABLE ONES RESOLVED PER YEAR)
+# =========================================================
+def load_holiday_history():
+    return get_store().holiday_history()
 
 def get_today_holiday():
-    today = date.today()
-    key = (today.month, today.day)
-    if key not in HOLIDAY_POSTS:
+    today = now_local().date()
+    holiday = holidays_for_year(get_bank().holidays, today.year).get(today)
+    if holiday is None:
         return None
 
     history = load_holiday_history()
     year = str(today.year)
     used = history.get(year, [])
 
-    holiday = HOLIDAY_POSTS[key]
     if holiday["name"] in used:
         return None
 
     return holiday
 
 def mark_holiday_used(name):
-    today = date.today()
-    year = str(today.year)
-    history = load_holiday_history()
-    history.setdefault(year, []).append(name)
-    save_holiday_history(history)
+    today = now_local().date()
+    get_store().add_holiday_used(str(today.year), name)
+
+def upcoming_holidays(today):
+    """Unused holidays later in today's month."""
+    used = load_holiday_history().get(str(today.year), [])
+    return sum(
+        1 for day, holiday in holidays_for_year(get_bank().holidays, today.year).items()
+        if day.month == today.month and day > today and holiday["name"] not in used
+    )
+
+# =========================================================
+# YEAR PLAN (ONE PASS PER YEAR, ONE SEEK PER RUN)
+# =========================================================
+def plan_rules():
+    """The live rules a plan is built with (and checked against)."""
+    return PlanRules(THOUGHT_COOLDOWN_DAYS, SCENE_COOLDOWN_DAYS, MAX_MONTHLY_IMAGES, SEASONAL_MAP)
+
+def build_plan(year=None):
+    """Plan the rest of the year from the current state and save it. Returns the slots."""
+    store = get_store()
+    bank = get_bank()
+    today = now_local().date()
+    year = year or today.year
+    start = max(today, date(year, 1, 1))
+    if start == today and already_posted_today():
+        start = date.fromordinal(today.toordinal() + 1)
+    first = start.toordinal()
+
+    rules = plan_rules()
+    slots = plan_year(
+        bank, year, start, rules,
+        store.thoughts_used_since(first - THOUGHT_COOLDOWN_DAYS + 1),
+        store.scenes_used_since(first - SCENE_COOLDOWN_DAYS + 1),
+        set(store.holiday_history().get(str(year), [])),
+        store.monthly_usage(start.strftime("%Y-%m")),
+    )
+    write_plan(page_file(PLAN_FILE.format(year=year)), year, plan_digest(bank.source_digest, rules), slots)
+    return slots
+
+def _slot_post(slot, today):
+    """(scene_data, text) for a regular slot that is still off cooldown, else None."""
+    if slot is None or slot.kind != SLOT_REGULAR:
+        return None
+    bank = get_bank()
+    text = bank.thought(slot.id)
+    scene_data = bank.scenes[slot.scene]
+    first_scene_day = today.toordinal() - SCENE_COOLDOWN_DAYS + 1
+    if is_thought_on_cooldown(text) or scene_data["name"] in get_store().scenes_used_since(first_scene_day):
+        return None
+    return scene_data, text
+
+def planned_post():
+    """Today's planned (scene_data, text), or None to choose live.
+
+    The plan is rebuilt from the current history if it is missing, was built
+    for another content bank or other planning rules, or has drifted: queued,
+    retried and live posts can put today's slot on cooldown, and every live
+    pick would push more planned slots onto cooldown after it.
+    """
+    bank = get_bank()
+    today = now_local().date()
+    path = page_file(PLAN_FILE.format(year=today.year))
+    digest, slot = read_slot(path, today)
+    stale = digest != plan_digest(bank.source_digest, plan_rules())
+    post = None if stale else _slot_post(slot, today)
+    if post is None and (stale or slot.kind in (SLOT_NONE, SLOT_REGULAR)):
+        print(f"Planning the rest of {today.year} into {path}.")
+        build_plan(today.year)
+        post = _slot_post(read_slot(path, today)[1], today)
+    return post
+
+def describe_plan(slots):
+    """One line per planned day, for --plan."""
+    bank = get_bank()
+    for slot in slots:
+        if slot.kind == SLOT_NONE:
+            continue
+        detail = ""
+        if slot.kind == SLOT_REGULAR:
+            detail = f"{bank.scenes[slot.scene]['name']:<16} {bank.thought(slot.id)}"
+        elif slot.kind == SLOT_HOLIDAY:
+            detail = bank.holidays[slot.id]["name"]
+        print(f"{slot.day} {SLOT_KINDS[slot.kind]:<8} {detail}".rstrip())
 
 # =========================================================
 # IMAGE GENERATION (CALLED ONLY IF POSTING)
 # =========================================================
-def generate_image_from_scene(prompt):
-    """Generate image from a complete prompt string."""
+# gpt-image-1 output format. jpeg/webp payloads are several times smaller
+# than png; the image is re-encoded for upload either way.
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "png")
+IMAGE_OUTPUT_COMPRESSION = int(os.getenv("IMAGE_OUTPUT_COMPRESSION", "95"))
+# Base64 characters decoded per step (a multiple of 4)
+B64_CHUNK_CHARS = 256 * 1024
+
+def decode_b64_image(b64, sink=None, chunk_chars=B64_CHUNK_CHARS):
+    """Decode a base64 image payload chunk by chunk straight into PIL.
+
+    Each decoded chunk goes to the image parser and, if given, to sink (the
+    raw artifact file), so the decoded bytes never exist as one buffer.
+    Returns (image, decoded byte count).
+    """
+    from PIL import ImageFile
+
+    parser = ImageFile.Parser()
+    decoded = 0
+    for start in range(0, len(b64), chunk_chars):
+        chunk = base64.b64decode(b64[start:start + chunk_chars])
+        parser.feed(chunk)
+        if sink is not None:
+            sink.write(chunk)
+        decoded += len(chunk)
+    return parser.close(), decoded
+
+@traced("generate")
+def generate_image_from_scene(prompt, sink=None):
+    """Generate an image from a complete prompt string. Returns a PIL image.
+
+    The raw image bytes are also written to sink, if given.
+    """
     if DRY_RUN:
         print(f"[DRY RUN] Generating image for prompt ({len(prompt)} chars):")
         print(f"  {prompt[:150]}...")
+        from PIL import Image
         # Return a blank dummy image for testing flow
-        img = Image.new("RGB", (1024, 1792), color=(50, 50, 50))
-        out = BytesIO()
-        img.save(out, "JPEG")
-        out.seek(0)
-        return out
-
-    r = client.images.generate(
-        model="gpt-image-1",
-        prompt=prompt,
-        size="1024x1536",
-        n=1,
-    )
+        return Image.new("RGB", (1024, 1792), color=(50, 50, 50))
+
+    options = {}
+    if IMAGE_OUTPUT_FORMAT != "png":
+        options = {"output_format": IMAGE_OUTPUT_FORMAT, "output_compression": IMAGE_OUTPUT_COMPRESSION}
+    with _generation_slots, span("images_api"):
+        r = get_client().images.generate(
+            model="gpt-image-1",
+            prompt=prompt,
+            size="1024x1536",
+            n=1,
+            **options,
+        )
 
-    return BytesIO(base64.b64decode(r.data[0].b64_json))
+    with span("decode") as s:
+        b64 = r.data[0].b64_json
+        # Only the payload string is needed from here on.
+        del r
+        img, decoded = decode_b64_image(b64, sink)
+        s.set(bytes_in=len(b64), bytes_out=decoded)
+    return img
 
 # =========================================================
 # IMAGE PROCESSING
@@ -489,99 +744,659 @@ def generate_image_from_scene(prompt):
 FONT_MAIN = "fonts/LibreBaskerville-Regular.ttf"
 FONT_MARK = "fonts/LibreBaskerville-Regular.ttf"
 WATERMARK_TEXT = "© Yesterday's Letters"
+WATERMARK_FONT_SIZE = 26
+
+# Precomputed line breaks for the whole content bank (see --precompute-layouts)
+LAYOUT_CACHE_FILE = "layout_cache.json"
+# gpt-image-1 portrait output size
+SOURCE_IMAGE_SIZE = (1024, 1536)
+
+# Output renditions: name -> aspect ratio (width, height). "feed" is the one
+# uploaded to the page; the rest are cached next to it, ready for upload.
+RENDITIONS = {
+    "feed": (4, 5),
+    "square": (1, 1),
+    "story": (9, 16),
+    "landscape": (191, 100),
+}
+PRIMARY_RENDITION = "feed"
+ENABLED_RENDITIONS = [PRIMARY_RENDITION] + [
+    name.strip() for name in os.getenv("RENDITIONS", ",".join(RENDITIONS)).split(",")
+    if name.strip() and name.strip() != PRIMARY_RENDITION
+]
 
-def crop_to_4_5(img):
-    target_h = int(img.width * 5 / 4)
-    top = (img.height - target_h) // 2
-    return img.crop((0, top, img.width, top + target_h))
-
-def is_dark(img, box):
-    crop = img.crop(box).convert("L")
-    return ImageStat.Stat(crop).mean[0] < 130
-
-def add_text(image_buffer, text):
-    img = Image.open(image_buffer).convert("RGBA")
-    img = crop_to_4_5(img)
-
-    overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
+def validate_renditions():
+    """Fail before any API call if RENDITIONS names an unknown aspect ratio."""
+    unknown = [name for name in ENABLED_RENDITIONS if name not in RENDITIONS]
+    if unknown:
+        raise Exception(f"Unknown renditions {unknown}; choose from {list(RENDITIONS)}")
 
-    # ---- TYPOGRAPHY SCALE (smaller, calmer) ----
-    FONT_SIZE = 38 if len(text) <= 90 else 34
-    LINE_HEIGHT = int(FONT_SIZE * 1.35)
+_layouts = None
 
-    font = ImageFont.truetype(FONT_MAIN, FONT_SIZE)
+@functools.lru_cache(maxsize=None)
+def load_font(path, size):
+    """Process-wide font cache keyed by path and size."""
+    from PIL import ImageFont
+    return ImageFont.truetype(path, size)
 
-    # ---- FIXED TEXT BOX (prevents drift) ----
-    BOX_WIDTH = int(img.width * 0.70)
-    BOX_HEIGHT = LINE_HEIGHT * 4
-    BOX_X = (img.width - BOX_WIDTH) // 2
+@functools.lru_cache(maxsize=None)
+def _font_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
 
-    # ---- SMART VERTICAL ZONES (top / middle / lower-mid) ----
-    candidate_ys = [
-        int(img.height * 0.30),
-        int(img.height * 0.45),
-        int(img.height * 0.58),
-    ]
+# Lines the caption box holds; longer texts spill outside it (see preview.py)
+TEXT_BOX_LINES = 4
 
-    def zone_score(y):
-        crop = img.crop((BOX_X, y, BOX_X + BOX_WIDTH, y + BOX_HEIGHT)).convert("L")
-        stat = ImageStat.Stat(crop)
-        edges = crop.filter(ImageFilter.FIND_EDGES)
-        edge_stat = ImageStat.Stat(edges)
-        return stat.stddev[0] + edge_stat.mean[0]
+def text_font_size(text):
+    return 38 if len(text) <= 90 else 34
 
-    BOX_Y = min(candidate_ys, key=zone_score)
+def text_box_width(image_width):
+    return int(image_width * 0.70)
 
-    # ---- LIGHT / DARK AUTO-DETECT ----
-    luminance = ImageStat.Stat(
-        img.crop((BOX_X, BOX_Y, BOX_X + BOX_WIDTH, BOX_Y + BOX_HEIGHT)).convert("L")
-    ).mean[0]
+def _layout_key(text, font_path, font_size, box_width):
+    # The font digest invalidates entries automatically when a font file changes.
+    return f"{_font_digest(font_path)}|{font_size}|{box_width}|{text}"
 
-    TEXT_COLOR = (245, 245, 240, 255) if luminance < 135 else (30, 30, 30, 255)
-    SHADOW_COLOR = (0, 0, 0, 70) if luminance < 135 else (0, 0, 0, 40)
+def _load_layouts():
+    global _layouts
+    if _layouts is None:
+        _layouts = load_json_file(LAYOUT_CACHE_FILE)
+    return _layouts
 
-    # ---- LINE WRAPPING ----
+def _wrap_text(text, font, box_width):
     words = text.split()
     lines, current = [], ""
 
     for w in words:
         test = f"{current} {w}".strip()
-        if draw.textlength(test, font=font) <= BOX_WIDTH:
+        if font.getlength(test) <= box_width:
             current = test
         else:
             lines.append(current)
             current = w
     lines.append(current)
+    return [[line, font.getlength(line)] for line in lines]
+
+def layout_text(text, font_path, font_size, box_width):
+    """Wrapped lines as [line, pixel width] pairs, measured at most once per key."""
+    layouts = _load_layouts()
+    key = _layout_key(text, font_path, font_size, box_width)
+    lines = layouts.get(key)
+    if lines is None:
+        lines = _wrap_text(text, load_font(font_path, font_size), box_width)
+        layouts[key] = lines
+    return lines
+
+def precompute_layouts():
+    """Measure every bank text once and save the layouts to LAYOUT_CACHE_FILE."""
+    global _layouts
+    _layouts = {}
+    bank = get_bank()
+    texts = {t for thoughts in bank.thoughts.values() for t in thoughts}
+    texts.update(h["text"] for h in bank.holidays)
+    box_widths = set()
+    for name in ENABLED_RENDITIONS:
+        left, _, right, _ = aspect_crop_box(SOURCE_IMAGE_SIZE, RENDITIONS[name])
+        box_widths.add(text_box_width(right - left))
+    for text in sorted(texts):
+        for box_width in box_widths:
+            layout_text(text, FONT_MAIN, text_font_size(text), box_width)
+    layout_text(WATERMARK_TEXT, FONT_MARK, WATERMARK_FONT_SIZE, SOURCE_IMAGE_SIZE[0])
+    save_json_file(LAYOUT_CACHE_FILE, _layouts)
+    return len(_layouts)
+
+def aspect_crop_box(size, ratio):
+    """Largest centred box of the given (w, h) aspect ratio inside size."""
+    width, height = size
+    ratio_w, ratio_h = ratio
+    target_h = int(width * ratio_h / ratio_w)
+    if target_h <= height:
+        top = (height - target_h) // 2
+        return (0, top, width, top + target_h)
+    target_w = int(height * ratio_w / ratio_h)
+    left = (width - target_w) // 2
+    return (left, 0, left + target_w, height)
+
+def crop_to_aspect(img, ratio):
+    return img.crop(aspect_crop_box(img.size, ratio))
 
-    # ---- VERTICAL CENTERING INSIDE BOX ----
-    y = BOX_Y + (BOX_HEIGHT - len(lines) * LINE_HEIGHT) // 2
+def crop_to_4_5(img):
+    return crop_to_aspect(img, (4, 5))
+
+def is_dark(img, box):
+    from PIL import ImageStat
+    crop = img.crop(box).convert("L")
+    return ImageStat.Stat(crop).mean[0] < 130
+
+# Text box search area: vertical band (fraction of height) for the box top,
+# and how far (fraction of width) the box may shift off centre.
+PLACEMENT_Y_RANGE = (0.25, 0.62)
+PLACEMENT_X_SHIFT = 0.08
+PLACEMENT_STEPS_Y = 16
+PLACEMENT_STEPS_X = 5
+
+def _summed_area(a):
+    """Summed-area table with a zero row/column in front, so box sums need no bounds checks."""
+    import numpy as np
+
+    sat = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(a, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+def _box_sums(sat, xs, ys, w, h):
+    """Sum over every w x h box whose top-left corner is in ys x xs (O(1) per box)."""
+    import numpy as np
+
+    y0, x0 = np.ix_(ys, xs)
+    return sat[y0 + h, x0 + w] - sat[y0, x0 + w] - sat[y0 + h, x0] + sat[y0, x0]
+
+def find_text_box(img, box_width, box_height):
+    """Choose the calmest box position for the text.
+
+    Luminance and edge maps are computed once for the whole image; summed-area
+    tables then give mean, stddev and edge density for every candidate box.
+    Returns (box_x, box_y, mean_luminance).
+    """
+    import numpy as np
+    from PIL import ImageFilter
+
+    gray = img.convert("L")
+    lum = np.asarray(gray, dtype=np.float64)
+    edges = np.asarray(gray.filter(ImageFilter.FIND_EDGES), dtype=np.float64)
+
+    sat_lum = _summed_area(lum)
+    sat_sq = _summed_area(lum * lum)
+    sat_edges = _summed_area(edges)
+
+    center_x = (img.width - box_width) // 2
+    shift = int(img.width * PLACEMENT_X_SHIFT)
+    xs = np.linspace(max(center_x - shift, 0), min(center_x + shift, img.width - box_width),
+                     PLACEMENT_STEPS_X).astype(np.intp)
+    y_lo = int(img.height * PLACEMENT_Y_RANGE[0])
+    y_hi = min(int(img.height * PLACEMENT_Y_RANGE[1]), img.height - box_height)
+    ys = np.linspace(y_lo, y_hi, PLACEMENT_STEPS_Y).astype(np.intp)
+
+    n = float(box_width * box_height)
+    mean = _box_sums(sat_lum, xs, ys, box_width, box_height) / n
+    var = _box_sums(sat_sq, xs, ys, box_width, box_height) / n - mean * mean
+    edge_density = _box_sums(sat_edges, xs, ys, box_width, box_height) / n
+    score = np.sqrt(np.maximum(var, 0.0)) + edge_density
+
+    # On flat backgrounds every box ties; nudge towards the centre of the band.
+    dist = np.abs(ys[:, None] - (y_lo + y_hi) / 2) / img.height + np.abs(xs[None, :] - center_x) / img.width
+    score = score + dist * 1e-6
+
+    iy, ix = np.unravel_index(np.argmin(score), score.shape)
+    return int(xs[ix]), int(ys[iy]), float(mean[iy, ix])
+
+def _clip_box(box, size):
+    left, top, right, bottom = box
+    return (max(int(left), 0), max(int(top), 0), min(int(right), size[0]), min(int(bottom), size[1]))
+
+def _boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def composite_regions(img, layers):
+    """Alpha-blend overlays onto an RGB image, touching only their boxes.
+
+    layers is a list of (box, draw_fn); draw_fn(draw, origin) draws onto an
+    RGBA overlay the size of box, with origin the box's top-left corner in
+    image coordinates. Overlapping boxes are merged so layering is preserved.
+    """
+    from PIL import Image, ImageDraw
+
+    merged = []
+    for box, draw_fn in layers:
+        box = _clip_box(box, img.size)
+        fns = [draw_fn]
+        for other in list(merged):
+            if _boxes_overlap(box, other[0]):
+                merged.remove(other)
+                box = (min(box[0], other[0][0]), min(box[1], other[0][1]),
+                       max(box[2], other[0][2]), max(box[3], other[0][3]))
+                fns = other[1] + fns
+        merged.append((box, fns))
+
+    for box, fns in merged:
+        if box[2] <= box[0] or box[3] <= box[1]:
+            continue
+        region = img.crop(box).convert("RGBA")
+        overlay = Image.new("RGBA", region.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        for fn in fns:
+            fn(draw, box[:2])
+        img.paste(Image.alpha_composite(region, overlay).convert("RGB"), box[:2])
+    return img
+
+# Upload budget and quality floors for the JPEG encoder
+JPEG_MAX_BYTES = int(os.getenv("JPEG_MAX_BYTES", str(1024 * 1024)))
+JPEG_QUALITY_RANGE = (int(os.getenv("JPEG_MIN_QUALITY", "80")), 95)
+JPEG_MIN_PSNR = float(os.getenv("JPEG_MIN_PSNR", "0"))  # dB; 0 disables the perceptual floor
+# Below this quality 4:2:0 chroma subsampling spends the bytes better than 4:4:4
+JPEG_FULL_CHROMA_MIN_QUALITY = 90
+
+def _psnr(img, jpeg_buffer):
+    import numpy as np
+    from PIL import Image
+
+    jpeg_buffer.seek(0)
+    decoded = np.asarray(Image.open(jpeg_buffer).convert("RGB"), dtype=np.float32)
+    mse = float(np.mean((np.asarray(img, dtype=np.float32) - decoded) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def encode_jpeg_targeted(img, max_bytes=None, out=None):
+    """Encode img as JPEG at the best quality that fits the byte budget.
+
+    Searches quality and chroma subsampling (progressive + optimized, or
+    baseline when that overflows Pillow's encoder buffer), reusing a single
+    buffer. Quality never drops below JPEG_QUALITY_RANGE[0], and
+    JPEG_MIN_PSNR, when set, wins over the budget. Returns (buffer, stats).
+    """
+    start = time.perf_counter()
+    max_bytes = max_bytes or JPEG_MAX_BYTES
+    out = out if out is not None else BytesIO()
+    q_min, q_max = JPEG_QUALITY_RANGE
+    attempts = []
+
+    def encode(quality, subsampling):
+        if attempts and attempts[-1][:2] == (quality, subsampling):
+            return attempts[-1][2]
+        progressive = True
+        out.seek(0)
+        out.truncate()
+        try:
+            img.save(out, "JPEG", quality=quality, subsampling=subsampling,
+                     optimize=True, progressive=True)
+        except OSError:
+            # Optimized/progressive output must fit a buffer Pillow sizes from
+            # the pixel count (w*h, 2*w*h at q95+); past that it fails. Encode
+            # baseline instead, so the size is real and out stays a valid JPEG.
+            progressive = False
+            out.seek(0)
+            out.truncate()
+            img.save(out, "JPEG", quality=quality, subsampling=subsampling)
+        attempts.append((quality, subsampling, out.tell(), progressive))
+        return out.tell()
+
+    def largest_quality_within_budget(q_lo, subsampling):
+        # Most posts fit at full quality; check that before bisecting.
+        if encode(q_max, subsampling) <= max_bytes:
+            return q_max
+        found, lo, hi = None, q_lo, q_max - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if encode(mid, subsampling) <= max_bytes:
+                found, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        return found
+
+    quality, subsampling = q_min, 2
+    for sub, q_lo in ((0, max(q_min, JPEG_FULL_CHROMA_MIN_QUALITY)), (2, q_min)):
+        found = largest_quality_within_budget(q_lo, sub)
+        if found is not None:
+            quality, subsampling = found, sub
+            break
+
+    psnr = None
+    if JPEG_MIN_PSNR:
+        encode(quality, subsampling)
+        psnr = _psnr(img, out)
+        if psnr < JPEG_MIN_PSNR:
+            # Lowest quality above the budget pick that still meets the floor.
+            best = None
+            lo, hi = quality + 1, q_max
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                encode(mid, subsampling)
+                mid_psnr = _psnr(img, out)
+                if mid_psnr >= JPEG_MIN_PSNR:
+                    best, hi = (mid, mid_psnr), mid - 1
+                else:
+                    lo = mid + 1
+            if best is None:
+                encode(q_max, subsampling)
+                best = (q_max, _psnr(img, out))
+            quality, psnr = best
+
+    size = encode(quality, subsampling)
+    out.seek(0)
+    stats = {
+        "bytes": size,
+        "quality": quality,
+        "subsampling": "4:4:4" if subsampling == 0 else "4:2:0",
+        "psnr": psnr,
+        "progressive": attempts[-1][3],
+        "attempts": len(attempts),
+        "encode_ms": (time.perf_counter() - start) * 1000,
+        "over_budget": size > max_bytes,
+    }
+    return out, stats
+
+def report_encode(name, stats):
+    psnr = f" psnr={stats['psnr']:.1f}dB" if stats.get("psnr") else ""
+    over = " OVER BUDGET" if stats["over_budget"] else ""
+    baseline = "" if stats["progressive"] else " baseline"
+    print(
+        f"[encode] {name}: {stats['bytes'] / 1024:.0f} KB q={stats['quality']} "
+        f"{stats['subsampling']}{baseline}{psnr} in {stats['encode_ms']:.0f} ms "
+        f"({stats['attempts']} attempts){over}"
+    )
+
+def encode_jpeg(img):
+    with span("encode") as s:
+        out, _ = encode_jpeg_targeted(img)
+        s.set(bytes_out=len(out.getbuffer()))
+    return out
 
-    for line in lines:
-        w = draw.textlength(line, font=font)
-        x = (img.width - w) // 2
+def open_rgb(source):
+    """RGB PIL image from an image or a file-like object, converting only if needed."""
+    from PIL import Image
 
-        # subtle shadow (legibility only)
-        draw.text((x + 2, y + 2), line, font=font, fill=SHADOW_COLOR)
-        draw.text((x, y), line, font=font, fill=TEXT_COLOR)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    return img if img.mode == "RGB" else img.convert("RGB")
 
+@traced("add_text")
+def add_text(image_buffer, text):
+    """Caption an image (PIL image or file-like) for the feed. Returns a JPEG BytesIO."""
+    img = open_rgb(image_buffer)
+    return encode_jpeg(render_text(crop_to_4_5(img), text))
+
+def render_text(img, text):
+    """Draw the text block and watermark onto an already cropped RGB image.
+
+    Only the text and watermark boxes are ever converted to RGBA; the rest of
+    the frame stays RGB.
+    """
+    # ---- TYPOGRAPHY SCALE (smaller, calmer) ----
+    FONT_SIZE = text_font_size(text)
+    LINE_HEIGHT = int(FONT_SIZE * 1.35)
+
+    font = load_font(FONT_MAIN, FONT_SIZE)
+
+    # ---- FIXED TEXT BOX SIZE (prevents drift) ----
+    BOX_WIDTH = text_box_width(img.width)
+    BOX_HEIGHT = LINE_HEIGHT * TEXT_BOX_LINES
+
+    # ---- SMART PLACEMENT (calmest box in the middle band) ----
+    BOX_X, BOX_Y, luminance = find_text_box(img, BOX_WIDTH, BOX_HEIGHT)
+
+    # ---- LIGHT / DARK AUTO-DETECT ----
+    TEXT_COLOR = (245, 245, 240, 255) if luminance < 135 else (30, 30, 30, 255)
+    SHADOW_COLOR = (0, 0, 0, 70) if luminance < 135 else (0, 0, 0, 40)
+
+    # ---- LINE WRAPPING (cached) ----
+    lines = layout_text(text, FONT_MAIN, FONT_SIZE, BOX_WIDTH)
+
+    # ---- VERTICAL CENTERING INSIDE BOX ----
+    text_top = BOX_Y + (BOX_HEIGHT - len(lines) * LINE_HEIGHT) // 2
+    placed = []
+    y = text_top
+    for line, w in lines:
+        placed.append((BOX_X + (BOX_WIDTH - w) // 2, y, line))
         y += LINE_HEIGHT
 
-    # ---- WATERMARK (unchanged, quieter) ----
-    mark_font = ImageFont.truetype(FONT_MAIN, 26)
-    mw = draw.textlength(WATERMARK_TEXT, font=mark_font)
-    draw.text(
-        ((img.width - mw) // 2, img.height - 58),
-        WATERMARK_TEXT,
-        font=mark_font,
-        fill=(255, 255, 255, 130),
+    def draw_text_block(draw, origin):
+        ox, oy = origin
+        for x, y, line in placed:
+            # subtle shadow (legibility only)
+            draw.text((x - ox + 2, y - oy + 2), line, font=font, fill=SHADOW_COLOR)
+            draw.text((x - ox, y - oy), line, font=font, fill=TEXT_COLOR)
+
+    # Padding covers the shadow offset, ascenders and descenders.
+    pad = FONT_SIZE // 2
+    text_box = (
+        min(x for x, _, _ in placed) - pad,
+        text_top - pad,
+        max(x + w for (x, _, _), (_, w) in zip(placed, lines)) + pad,
+        text_top + len(lines) * LINE_HEIGHT + pad,
     )
 
-    final = Image.alpha_composite(img, overlay)
-    out = BytesIO()
-    final.convert("RGB").save(out, "JPEG", quality=95)
-    out.seek(0)
-    return out
+    # ---- WATERMARK (unchanged, quieter) ----
+    mark_font = load_font(FONT_MARK, WATERMARK_FONT_SIZE)
+    [(_, mw)] = layout_text(WATERMARK_TEXT, FONT_MARK, WATERMARK_FONT_SIZE, SOURCE_IMAGE_SIZE[0])
+    mark_x, mark_y = (img.width - mw) // 2, img.height - 58
+
+    def draw_watermark(draw, origin):
+        draw.text(
+            (mark_x - origin[0], mark_y - origin[1]),
+            WATERMARK_TEXT,
+            font=mark_font,
+            fill=(255, 255, 255, 130),
+        )
+
+    mark_pad = WATERMARK_FONT_SIZE // 2
+    mark_box = (mark_x - mark_pad, mark_y - mark_pad,
+                mark_x + mw + mark_pad, mark_y + WATERMARK_FONT_SIZE + 2 * mark_pad)
+
+    return composite_regions(img, [(text_box, draw_text_block), (mark_box, draw_watermark)])
+
+# =========================================================
+# RENDITIONS (ONE DECODE, ALL ASPECT RATIOS IN PARALLEL)
+# =========================================================
+def _render_rendition(img, text, ratio):
+    out, stats = encode_jpeg_targeted(render_text(crop_to_aspect(img, ratio), text))
+    return out.getvalue(), stats
+
+def _render_rendition_worker(shm_name, size, text, ratio):
+    """Process-pool entry point: render from the decoded source in shared memory."""
+    from multiprocessing import shared_memory
+    from PIL import Image
+
+    # Workers share the parent's resource tracker, which unregisters the
+    # segment when the parent unlinks it; nothing to undo here.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = Image.frombuffer("RGB", size, shm.buf, "raw", "RGB", 0, 1)
+        rendered = _render_rendition(img, text, ratio)
+        del img
+        return rendered
+    finally:
+        shm.close()
+
+SHM_COPY_ROWS = 128
+
+@traced("render_renditions")
+def render_renditions(image_buffer, text, names=None, max_workers=None):
+    """Render every configured aspect ratio from one decoded source image.
+
+    The source (a PIL image or file-like) is decoded once into shared memory
+    and each rendition is cropped, captioned and encoded in its own worker
+    process. Returns {name: BytesIO of JPEG}; encode stats are printed per
+    rendition.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    names = names or ENABLED_RENDITIONS
+    img = open_rgb(image_buffer)
+    workers = min(len(names), max_workers or os.cpu_count() or 1)
+
+    def collect(results):
+        renditions = {}
+        for name, (data, stats) in results:
+            report_encode(name, stats)
+            renditions[name] = BytesIO(data)
+        return renditions
+
+    if workers <= 1:
+        return collect((name, _render_rendition(img, text, RENDITIONS[name])) for name in names)
+
+    size = img.size
+    row_bytes = size[0] * 3
+    shm = shared_memory.SharedMemory(create=True, size=row_bytes * size[1])
+    try:
+        # Copy in strips so a second full-size copy of the pixels never exists.
+        for top in range(0, size[1], SHM_COPY_ROWS):
+            strip = img.crop((0, top, size[0], min(size[1], top + SHM_COPY_ROWS))).tobytes()
+            shm.buf[top * row_bytes:top * row_bytes + len(strip)] = strip
+        del img, strip
+        # This runs on a worker thread next to the warm-ups; forking a
+        # threaded process can copy a held lock into the child.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {
+                name: pool.submit(_render_rendition_worker, shm.name, size, text, RENDITIONS[name])
+                for name in names
+            }
+            return collect((name, future.result()) for name, future in futures.items())
+    finally:
+        shm.close()
+        shm.unlink()
+
+def rendition_key(key, name):
+    # The primary rendition keeps the bare key so earlier cache entries still hit.
+    return key if name == PRIMARY_RENDITION else f"{key}.{name}"
+
+@traced("render_post")
+def render_post(prompt, text):
+    """Generate and caption the image, resuming from cached artifacts."""
+    if DRY_RUN:
+        return add_text(generate_image_from_scene(prompt), text)
+
+    cache = get_artifact_cache()
+    key = artifact_key(prompt, text)
+
+    final = cache.get(rendition_key(key, PRIMARY_RENDITION), "final")
+    if final is not None:
+        print(f"Reusing cached final image {key[:12]}.")
+        return BytesIO(final)
+
+    raw = cache.get(key, "raw")
+    if raw is not None:
+        print(f"Reusing cached generated image {key[:12]}.")
+        source = BytesIO(raw)
+        del raw
+    else:
+        # The raw bytes stream into the cache as they are decoded.
+        with cache.writer(key, "raw") as sink:
+            source = generate_image_from_scene(prompt, sink)
+
+    renditions = render_renditions(source, text)
+    del source
+    for name, rendition in renditions.items():
+        cache.put(rendition_key(key, name), "final", rendition.getvalue())
+    return renditions[PRIMARY_RENDITION]
+
+# =========================================================
+# PRE-GENERATION QUEUE (FILLED OFF-HOURS, DRAINED AT POST TIME)
+# =========================================================
+PREGENERATE_QUEUE_SIZE = int(os.getenv("PREGENERATE_QUEUE_SIZE", "3"))
+
+def is_thought_on_cooldown(text):
+    last_used = get_thought_cooldown_history().get(text)
+    if not last_used:
+        return False
+    return (now_local().date() - date.fromisoformat(last_used)).days < THOUGHT_COOLDOWN_DAYS
+
+def next_queued_post():
+    """Oldest queued post that is still postable, dropping stale entries."""
+    store = get_store()
+    cache = get_artifact_cache()
+    for post in list(store.queued_posts()):
+        image = cache.get(post["artifact_key"], "queued")
+        if image is not None and not is_thought_on_cooldown(post["text"]):
+            return dict(post, image=image)
+        print(f"Dropping stale queued post {post['id']} ({post['scene_name']}).")
+        store.remove_queued_post(post["id"])
+        cache.delete(post["artifact_key"], "queued")
+    return None
+
+def pregenerate(target_size=PREGENERATE_QUEUE_SIZE):
+    """Fill the post queue with fully rendered posts. Returns an exit code."""
+    if check_kill_switch():
+        print("KILL SWITCH ACTIVE. Not pre-generating.")
+        return 0
+    if is_good_posting_time() and not DRY_RUN:
+        print("Inside posting window. Not pre-generating.")
+        return 0
+
+    store = get_store()
+    queue = store.queued_posts()
+    month = now_local().strftime("%Y-%m")
+    # Queued posts will count against the cap once they are posted.
+    budget = MAX_MONTHLY_IMAGES - store.monthly_usage(month) - len(queue)
+    missing = min(target_size - len(queue), budget)
+    if missing <= 0:
+        print(f"Post queue has {len(queue)}/{target_size}. Nothing to pre-generate.")
+        return 0
+
+    validate_secrets()
+    validate_fonts()
+    validate_renditions()
+
+    reserved_thoughts = {post["text"] for post in queue}
+    reserved_scenes = {post["scene_name"] for post in queue}
+    cache = get_artifact_cache()
+    try:
+        for _ in range(missing):
+            scene_data, text = choose_scene_and_text(reserved_thoughts, reserved_scenes)
+            scene_prompt, season = generate_image_prompt(scene_data)
+            print(f"PRE-GENERATING: {scene_data['name']} ({season})")
+            final_image = render_post(scene_prompt, text)
+            if DRY_RUN:
+                # Placeholder images must never reach the real queue.
+                continue
+
+            key = artifact_key(scene_prompt, text)
+            cache.put(key, "queued", final_image.getvalue())
+            store.enqueue_post(
+                now_local().strftime("%Y-%m-%d"), scene_prompt, text, scene_data["name"], key,
+            )
+            reserved_thoughts.add(text)
+            reserved_scenes.add(scene_data["name"])
+    except Exception as e:
+        print(f"Pre-generation failed: {e}")
+        log_error(e)
+        return 1
+
+    print(f"Post queue now has {len(store.queued_posts())} post(s).")
+    return 0
+
+# =========================================================
+# RUN PIPELINE (GENERATION OVERLAPPED WITH CHECKS AND WARM-UPS)
+# =========================================================
+def warm_fonts(texts=()):
+    """Load the layout cache and the fonts the given texts will be drawn with."""
+    _load_layouts()
+    for size in {text_font_size(text) for text in texts}:
+        load_font(FONT_MAIN, size)
+    load_font(FONT_MARK, WATERMARK_FONT_SIZE)
+
+def warm_graph():
+    if not DRY_RUN:
+        get_graph_client().warm()
+
+async def produce_post(scene_prompt, text, queued=None):
+    """Render the post while the warm-ups run. Returns (image, token_ok).
+
+    The warm-ups run in worker threads alongside the token check, which stays
+    on this thread because it reads and writes the state store. Generation is
+    paid for, so it only starts once the check has passed, and not at all
+    when the cached health already says the token is bad. On failure the
+    image is None and the pending post is kept for the next run.
+    """
+    # Warm-ups are best effort; rendering and upload load what they need anyway.
+    warm_ups = asyncio.gather(
+        asyncio.to_thread(warm_fonts, [text]),
+        asyncio.to_thread(warm_graph),
+        return_exceptions=True,
+    )
+    try:
+        if token_known_bad(cached_token_health()):
+            print("[token] cached health is bad; not generating.")
+            return None, False
+        await asyncio.sleep(0)  # let the warm-ups start before blocking on the token check
+        if not check_token_health():
+            return None, False
+        if queued:
+            return BytesIO(queued["image"]), True
+        return await asyncio.to_thread(render_post, scene_prompt, text), True
+    finally:
+        await warm_ups
 
 # =========================================================
 # FACEBOOK POST
@@ -591,105 +1406,419 @@ def post_to_facebook(image_buffer):
         print("[DRY RUN] Skipping Facebook upload.")
         return
 
-    url = f"https://graph.facebook.com/v19.0/{FB_PAGE_ID}/photos"
-    data = {"access_token": FB_TOKEN, "published": "true"}
-    files = {"source": ("image.jpg", image_buffer, "image/jpeg")}
-    
+    from graph_client import GraphAPIError
+
+    upload_bytes = len(image_buffer.getbuffer())
+    start = time.perf_counter()
     try:
-        r = requests.post(url, data=data, files=files)
-        if r.status_code != 200:
-            raise Exception(f"FB Error {r.status_code}: {r.text}")
-    except Exception as e:
-        print(f"CRITICAL: Facebook Post Failed. Enabling Kill Switch. Error: {e}")
-        enable_kill_switch()
-        raise e
+        with _upload_slots, span("upload", bytes_in=upload_bytes):
+            get_graph_client().upload_photo(page_credentials()[1], image_buffer)
+    except GraphAPIError as e:
+        if e.is_auth:
+            print(f"CRITICAL: Facebook Post Failed. Enabling Kill Switch. Error: {e}")
+            enable_kill_switch()
+        else:
+            print(f"Facebook Post Failed ({e.kind}). Will retry next run. Error: {e}")
+        raise
+    print(f"[upload] {upload_bytes / 1024:.0f} KB in {(time.perf_counter() - start) * 1000:.0f} ms")
 
 # =========================================================
 # MAIN (STRICT ORDER — DO NOT CHANGE)
 # =========================================================
-if __name__ == "__main__":
-    print(f"Starting Bot. Dry Run: {DRY_RUN}")
-
-    # 1. Safety Checks
+def preflight():
+    """Cheap stdlib-only gates. Returns a skip reason, or None to go ahead."""
     if check_kill_switch():
-        print("KILL SWITCH ACTIVE. Posting disabled. Exiting.")
-        exit(0)
-    
-    # Validate fonts exist before making any API calls
-    validate_fonts()
-    
-    # Token Health Check
-    if not check_token_health():
-        print("Token Health Check Failed. Kill switch enabled. Exiting.")
-        exit(1)
-
-    if check_monthly_cap() and not DRY_RUN:
-        print("MONTHLY CAP REACHED. Exiting.")
-        exit(0)
+        return "KILL SWITCH ACTIVE. Posting disabled. Exiting."
+    if DRY_RUN:
+        return None
+    # Outside posting time the token is only re-checked as it nears expiry,
+    # so a dying token trips the kill switch before the next post is due.
+    cached = cached_token_health()
+    if token_near_expiry(cached) and not token_health_is_fresh(cached):
+        validate_secrets()
+        if not check_token_health(force=True):
+            return "Token Health Check Failed. Exiting."
+    if not is_good_posting_time():
+        return "Outside posting window. Skipping."
+    if already_posted_today():
+        return "Already posted today. Skipping."
+    if check_monthly_cap():
+        return "MONTHLY CAP REACHED. Exiting."
+    return None
+
+def run_once():
+    """One full pass: preflight, content, generate, post, record. Returns an exit code."""
+    code, status = 1, "failed"
+    try:
+        code, status = _run_once()
+        return code
+    finally:
+        finish_run(status, prom_file=page_prom_file())
 
-    # 2. Time gate
-    if not is_good_posting_time() and not DRY_RUN:
-        print("Outside posting window. Skipping.")
-        exit(0)
+def _run_once():
+    """Returns (exit code, trace status): "ok", "skip" or "failed"."""
+    print(f"Starting Bot. Dry Run: {DRY_RUN}")
 
-    # 3. Daily gate
-    if already_posted_today() and not DRY_RUN:
-        print("Already posted today. Skipping.")
-        exit(0)
+    # 1. Preflight (stdlib only: kill switch, time gate, daily gate, cap)
+    with span("preflight"):
+        skip_reason = preflight()
+    if skip_reason:
+        print(skip_reason)
+        report_startup("skip")
+        return 0, "skip"
 
-    # 4. Decide content (FREE)
-    holiday = get_today_holiday()
-    if holiday:
-        text = holiday["text"]
-        # For holidays, use the old-style direct prompt
-        scene_prompt = (
-            f"Cinematic anime-style illustration, ultra high detail, 8K quality, painterly digital art. "
-            f"{holiday['scene']}, with a wide sense of depth and scale. "
-            f"Rich saturated colors, detailed foliage and natural textures. "
-            f"Calm, nostalgic, peaceful mood, slice-of-life atmosphere. "
-            f"Anime background art quality, hand-painted look, soft brush textures, realistic lighting, no text, no watermark."
-        )
-        is_holiday = True
-        scene_name = "holiday_" + holiday["name"]
-        print("HOLIDAY POST:", holiday["name"])
-    else:
-        scene_data, text = choose_scene_and_text()
-        # Generate randomized prompt from scene data
-        scene_prompt, season = generate_image_prompt(scene_data)
-        scene_name = scene_data["name"]
-        is_holiday = False
-        print(f"REGULAR POST: {scene_name} ({season})")
-
-    # 5. GENERATE & POST (COSTS MONEY)
+    # 2. Safety checks (only paid for when we are actually posting)
+    validate_secrets()
+    # Validate fonts exist before making any API calls
+    validate_fonts()
+    validate_renditions()
+    report_startup("post")
+
+    # 3. Decide content (FREE)
+    with span("decide"):
+        pending = load_pending_post()
+        holiday = get_today_holiday()
+        queued = None
+        if pending and holiday and not pending.get("holiday"):
+            pending = None  # today's holiday wins; the regular retry is dropped
+        if pending:
+            text = pending["text"]
+            scene_prompt = pending["prompt"]
+            scene_name = pending["scene_name"]
+            holiday = pending.get("holiday")
+            is_holiday = bool(holiday)
+            print(f"RETRYING PENDING POST: {scene_name}")
+        elif holiday:
+            text = holiday["text"]
+            # For holidays, use the old-style direct prompt
+            scene_prompt = (
+                f"Cinematic anime-style illustration, ultra high detail, 8K quality, painterly digital art. "
+                f"{holiday['scene']}, with a wide sense of depth and scale. "
+                f"Rich saturated colors, detailed foliage and natural textures. "
+                f"Calm, nostalgic, peaceful mood, slice-of-life atmosphere. "
+                f"Anime background art quality, hand-painted look, soft brush textures, realistic lighting, no text, no watermark."
+            )
+            is_holiday = True
+            scene_name = "holiday_" + holiday["name"]
+            print("HOLIDAY POST:", holiday["name"])
+        else:
+            queued = next_queued_post()
+            is_holiday = False
+            if queued:
+                text = queued["text"]
+                scene_prompt = queued["prompt"]
+                scene_name = queued["scene_name"]
+                print(f"QUEUED POST: {scene_name} (generated {queued['created']})")
+            else:
+                scene_data, text = planned_post() or choose_scene_and_text()
+                # Generate randomized prompt from scene data
+                scene_prompt, season = generate_image_prompt(scene_data)
+                scene_name = scene_data["name"]
+                print(f"REGULAR POST: {scene_name} ({season})")
+
+    if not DRY_RUN and not pending and not queued:
+        save_pending_post({
+            "prompt": scene_prompt,
+            "text": text,
+            "scene_name": scene_name,
+            "holiday": holiday,
+        })
+
+    # 4. Token health check, then GENERATE (COSTS MONEY) while the warm-ups run
     try:
-        image_buffer = generate_image_from_scene(scene_prompt)
-        final_image = add_text(image_buffer, text)
+        final_image, token_ok = asyncio.run(produce_post(scene_prompt, text, queued))
+        if not token_ok:
+            if check_kill_switch():
+                print("Token Health Check Failed. Kill switch enabled. Exiting.")
+            else:
+                print("Token Health Check Failed. Exiting.")
+            return 1, "failed"
+
+        # 5. POST
         post_to_facebook(final_image)
 
-        # 6. Record state (Only on success)
+        # 6. Record state (Only on success, as one transaction)
         if not DRY_RUN:
-            mark_posted_today()
-            increment_monthly_cap()
-            update_thought_history(text)
-            # Track used scene to ensure variety
-            scene_history = load_json_file(SCENE_HISTORY_FILE)
-            scene_history[scene_name] = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d")
-            save_json_file(SCENE_HISTORY_FILE, scene_history)
-            if is_holiday:
-                mark_holiday_used(holiday["name"])
-            
-            log_engagement(scene_name, text, "SUCCESS")
+            with span("record_state"), get_store().transaction():
+                mark_posted_today()
+                increment_monthly_cap()
+                update_thought_history(text)
+                # Track used scene to ensure variety
+                update_scene_history(scene_name)
+                if is_holiday:
+                    mark_holiday_used(holiday["name"])
+
+                if queued:
+                    get_store().remove_queued_post(queued["id"])
+                clear_pending_post()
+                log_engagement(scene_name, text, "SUCCESS")
+            if queued:
+                get_artifact_cache().delete(queued["artifact_key"], "queued")
         else:
             log_engagement(scene_name, text, "DRY_RUN_SUCCESS")
 
         print("Post successful.")
+        return 0, "ok"
 
     except Exception as e:
         print(f"Process failed: {e}")
         log_engagement(scene_name, text, f"FAILED: {e}")
         log_error(e)
-        exit(1)
+        return 1, "failed"
+
+    finally:
+        if not DRY_RUN:
+            if _page.get() is None:
+                # Batch runs share the cache; run_batch evicts once every page is done.
+                get_artifact_cache().evict()
+            try:
+                rotate_logs()
+                compact_history()
+            except Exception as e:
+                # Housekeeping must not turn a posted run into a failed one.
+                print(f"Log/history archiving failed: {e}")
+                log_error(e)
+
+# =========================================================
+# BATCH MODE (ONE RUN PER PAGE, CONCURRENTLY)
+# =========================================================
+def page_prom_file():
+    """Per-page metrics file in batch mode (None = the default file)."""
+    page = _page.get()
+    if page is None:
+        return None
+    base, ext = os.path.splitext(TRACE_PROM_FILE)
+    return f"{base}-{page.name}{ext}"
+
+def load_pages(path=PAGES_FILE):
+    """PageContexts for every entry in a pages file."""
+    with open(path) as f:
+        configs = json.load(f)
+    pages = []
+    for config in configs:
+        token_env = config.get("token_env")
+        pages.append(PageContext(
+            config["name"],
+            config.get("page_id"),
+            os.environ.get(token_env) if token_env else None,
+            timezone=config.get("timezone"),
+            bank_source=config.get("bank", BANK_SOURCE_FILE),
+            state_dir=config.get("state_dir"),
+        ))
+    names = [page.name for page in pages]
+    if len(set(names)) != len(names):
+        raise Exception(f"Duplicate page names in {path}: {names}")
+    return pages
+
+def _run_page(page):
+    """run_once() for one page, inside that page's context."""
+    _page.set(page)
+    start_run()
+    annotate(page=page.name)
+    print(f"[{page.name}] Starting page run.")
+    try:
+        return run_once()
+    except Exception as e:
+        print(f"[{page.name}] Run failed before posting: {e}")
+        return 1
+    finally:
+        if page.store is not None:
+            page.store.close()
+            page.store = None
+
+def run_batch(pages):
+    """Run every page once, concurrently. Returns 0 only if every page succeeded.
+
+    Each page keeps its own state database, kill switch, plan and archive
+    under its state dir; the image API and upload concurrency limits are
+    shared, so the batch takes about as long as its slowest page.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(pages), thread_name_prefix="page") as pool:
+        futures = {
+            page.name: pool.submit(contextvars.copy_context().run, _run_page, page)
+            for page in pages
+        }
+        codes = {name: future.result() for name, future in futures.items()}
+    if not DRY_RUN:
+        get_artifact_cache().evict()
+    for name, code in codes.items():
+        print(f"[batch] {name}: {'ok' if code == 0 else 'failed'}")
+    return max(codes.values(), default=0)
+
+# =========================================================
+# DAEMON MODE (WARM PROCESS, SLEEPS BETWEEN POSTING WINDOWS)
+# =========================================================
+DAEMON_RETRY_SECONDS = 15 * 60      # after a failed run inside the window
+DAEMON_KILL_SWITCH_POLL_SECONDS = 60
+
+def seconds_until_next_window(now=None, include_current=True):
+    """Seconds until the next POST_WINDOWS opening in TIMEZONE.
+
+    Returns 0 while a window is open, unless include_current is False.
+    """
+    now = now or now_local()
+    if include_current and any(start <= now.hour < end for start, end in POST_WINDOWS):
+        return 0.0
+    openings = []
+    for day_offset in (0, 1):
+        day = date.fromordinal(now.date().toordinal() + day_offset)
+        for start, _ in POST_WINDOWS:
+            opening = datetime(day.year, day.month, day.day, start, tzinfo=now.tzinfo)
+            if opening > now:
+                openings.append(opening)
+    # Compare timestamps so DST transitions are measured in real seconds.
+    return max(min(o.timestamp() for o in openings) - now.timestamp(), 0.0)
+
+def warm_up():
+    """Load everything a post needs once, so daemon runs start hot."""
+    validate_secrets()
+    validate_fonts()
+    get_client()
+    if not DRY_RUN:
+        get_graph_client()
+    warm_fonts(t for thoughts in get_bank().thoughts.values() for t in thoughts)
+
+def run_daemon():
+    """Post once per window from a long-lived process.
+
+    SIGTERM/SIGINT stop the daemon between runs. SIGHUP (or SIGUSR1) wakes it
+    to re-read the kill switch file and state immediately, e.g. after creating
+    or removing posting_disabled.flag.
+    """
+    import signal
+    import threading
+
+    global _run_start
+    stop = threading.Event()
+    wake = threading.Event()
+
+    def on_stop(signum, frame):
+        print(f"Received signal {signum}. Stopping after the current step.")
+        stop.set()
+        wake.set()
+
+    def on_wake(signum, frame):
+        wake.set()
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    for name in ("SIGHUP", "SIGUSR1"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), on_wake)
+
+    print(f"Starting daemon. Dry Run: {DRY_RUN}")
+    warm_up()
+    report_startup("daemon warm-up")
+
+    while not stop.is_set():
+        get_store().reload()
+        if check_kill_switch():
+            print("KILL SWITCH ACTIVE. Waiting for it to be cleared.")
+            delay = DAEMON_KILL_SWITCH_POLL_SECONDS
+        else:
+            delay = seconds_until_next_window()
+            if delay == 0:
+                _run_start = time.perf_counter()
+                code = run_once()
+                get_store().reload()
+                # Retry failures while the window is still open; otherwise the
+                # day is done and we sleep to the next opening.
+                if code != 0 and is_good_posting_time() and not already_posted_today():
+                    delay = DAEMON_RETRY_SECONDS
+                else:
+                    delay = seconds_until_next_window(include_current=False)
+
+        print(f"Sleeping {delay / 3600:.2f}h.")
+        wake.clear()
+        wake.wait(timeout=delay)
+
+    print("Daemon stopped.")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Yesterday's Letters posting bot")
+    parser.add_argument(
+        "--precompute-layouts", action="store_true",
+        help=f"measure line breaks for the whole content bank into {LAYOUT_CACHE_FILE}",
+    )
+    parser.add_argument(
+        "--pregenerate", nargs="?", type=int, const=PREGENERATE_QUEUE_SIZE, metavar="N",
+        help="fill the post queue with N rendered posts instead of posting",
+    )
+    parser.add_argument(
+        "--plan", nargs="?", type=int, const=0, metavar="YEAR",
+        help="plan the rest of YEAR (default: this year) into plan_YEAR.bin and print it",
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="stay running and post at each POST_WINDOWS opening instead of exiting",
+    )
+    parser.add_argument(
+        "--failures", nargs="?", type=int, const=10, metavar="N",
+        help="print the N most recent failed posts and errors",
+    )
+    parser.add_argument(
+        "--scene-counts", nargs="?", const="", metavar="YYYY-MM",
+        help="print successful posts per scene for a month (default: this month)",
+    )
+    parser.add_argument(
+        "--batch", nargs="?", const=PAGES_FILE, metavar="PAGES_FILE",
+        help=f"run once for every page in PAGES_FILE (default {PAGES_FILE}), concurrently",
+    )
+    parser.add_argument(
+        "--compact-history", action="store_true",
+        help=f"archive expired cooldown and holiday history to {LOG_ARCHIVE_DIR}/ now",
+    )
+    args = parser.parse_args()
+
+    if args.compact_history:
+        if not compact_history(force=True):
+            print("Nothing to compact.")
+        exit(0)
+
+    if args.failures is not None:
+        for row in get_store().last_failures(args.failures):
+            print(f"{row['date']} {row['time']}  {row['scene']}: {row['status']}")
+        for row in get_store().last_errors(args.failures):
+            print(f"{row['timestamp']}  {row['message']}")
+        exit(0)
 
+    if args.scene_counts is not None:
+        month = args.scene_counts or now_local().strftime("%Y-%m")
+        counts = get_store().posts_per_scene(month)
+        for scene, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            print(f"{count:4d}  {scene}")
+        print(f"{sum(counts.values())} post(s) in {month}")
+        exit(0)
+
+    if args.precompute_layouts:
+        print(f"Saved {precompute_layouts()} layouts to {LAYOUT_CACHE_FILE}.")
+        exit(0)
 
+    if args.plan is not None:
+        slots = build_plan(args.plan or None)
+        describe_plan(slots)
+        year = slots[0].day.year
+        counts = {kind: sum(1 for s in slots if SLOT_KINDS[s.kind] == kind) for kind in SLOT_KINDS[1:]}
+        print(f"Planned {year}: {counts['regular']} regular, {counts['holiday']} holiday, "
+              f"{counts['capped']} capped day(s) -> {PLAN_FILE.format(year=year)}")
+        exit(0)
 
+    if args.pregenerate is not None:
+        print(f"Pre-generating posts. Dry Run: {DRY_RUN}")
+        code = pregenerate(args.pregenerate)
+        annotate(path="pregenerate")
+        finish_run("ok" if code == 0 else "failed")
+        exit(code)
+
+    if args.batch:
+        exit(run_batch(load_pages(args.batch)))
+
+    if args.daemon:
+        run_daemon()
+        exit(0)
 
+    exit(run_once())
@@ -0,0 +1,185 @@
+"""Year-at-a-time posting plan.
+
+plan_year() walks the remaining days of a year once, applying the same rules
+as a live run: holidays (including movable ones), thought and scene
+cooldowns, SEASONAL_MAP preferences and the monthly cap, which keeps room
+for holidays later in the month. write_plan() stores the result as
+fixed-width records, so a run finds today's slot with a single seek:
+
+    header   magic (with format version), year, day count, plan digest
+             (sha256 of the content bank source the ids refer to and the
+             planning rules)
+    slots    one (kind, thought or holiday id, scene index) per day of the year
+
+The plan is rebuilt whenever the content bank or the rules change. It is a schedule, not
+a promise: a run re-checks cooldowns before using its slot.
+"""
+import calendar
+import collections
+import hashlib
+import json
+import os
+import random
+import struct
+from datetime import date
+
+from content_bank import nth_not_excluded
+
+PLAN_FILE = "plan_{year}.bin"
+
+_MAGIC = b"YLPLAN\x00\x01"
+_HEADER = struct.Struct("<8sHH32s")  # magic, year, day count, bank digest
+_SLOT = struct.Struct("<BIH")        # kind, thought/holiday id, scene index
+
+NO_ID = 0xFFFFFFFF
+NO_SCENE = 0xFFFF
+
+# Slot kinds
+SLOT_NONE = 0      # before the plan started
+SLOT_REGULAR = 1
+SLOT_HOLIDAY = 2
+SLOT_CAPPED = 3    # monthly cap reached, no post
+SLOT_KINDS = ("none", "regular", "holiday", "capped")
+
+PlanRules = collections.namedtuple(
+    "PlanRules", "thought_cooldown scene_cooldown monthly_cap seasonal_map"
+)
+Slot = collections.namedtuple("Slot", "day kind id scene")
+
+
+def plan_digest(bank_digest, rules):
+    """Digest of everything a plan depends on: the content bank and the rules."""
+    rules_json = json.dumps(rules._asdict(), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(bank_digest + rules_json).digest()
+
+
+# =========================================================
+# HOLIDAY CALENDAR
+# =========================================================
+def holiday_date(holiday, year):
+    """The date a bank holiday falls on in the given year, or None."""
+    month = holiday["month"]
+    if "day" in holiday:
+        try:
+            return date(year, month, holiday["day"])
+        except ValueError:
+            return None  # e.g. Feb 29 outside leap years
+    weekday, nth = holiday["weekday"], holiday["nth"]
+    if nth > 0:
+        first_weekday = date(year, month, 1).weekday()
+        day = 1 + (weekday - first_weekday) % 7 + (nth - 1) * 7
+    else:
+        last_day = calendar.monthrange(year, month)[1]
+        day = last_day - (date(year, month, last_day).weekday() - weekday) % 7
+    return date(year, month, day)
+
+
+def holidays_for_year(holidays, year):
+    """{date: holiday} for every bank holiday in the given year."""
+    by_date = {}
+    for holiday in holidays:
+        day = holiday_date(holiday, year)
+        if day is not None:
+            by_date[day] = holiday
+    return by_date
+
+
+# =========================================================
+# PLANNING
+# =========================================================
+def plan_year(bank, year, start, rules, thought_days, scene_days, used_holidays,
+              month_usage, seed=None):
+    """Plan every day of `year` from `start` on. Returns one Slot per day.
+
+    thought_days / scene_days map recently used thoughts and scenes to the
+    day ordinal they were last used, used_holidays are the holiday names
+    already posted this year and month_usage is the image count so far in
+    start's month.
+    """
+    rng = random.Random(year if seed is None else seed)
+    holiday_ids = {h["name"]: i for i, h in enumerate(bank.holidays)}
+    by_date = holidays_for_year(bank.holidays, year)
+    scene_ids = {scene["name"]: i for i, scene in enumerate(bank.scenes)}
+    all_categories = list(bank.categories)
+
+    cooling = dict(thought_days)
+    recent_scenes = dict(scene_days)
+    used_holidays = set(used_holidays)
+    usage = collections.Counter({start.month: month_usage})
+    slots = []
+    for ordinal in range(date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal() + 1):
+        day = date.fromordinal(ordinal)
+        if day < start:
+            slots.append(Slot(day, SLOT_NONE, NO_ID, NO_SCENE))
+            continue
+        holiday = by_date.get(day)
+        if holiday and holiday["name"] in used_holidays:
+            holiday = None
+        # Regular days leave room for the holidays still to come this month.
+        reserved = 0 if holiday else sum(
+            1 for d, h in by_date.items()
+            if d.month == day.month and d > day and h["name"] not in used_holidays
+        )
+        if usage[day.month] + reserved >= rules.monthly_cap:
+            slots.append(Slot(day, SLOT_CAPPED, NO_ID, NO_SCENE))
+            continue
+        usage[day.month] += 1
+
+        # Only the last cooldown's worth of history is kept.
+        cooling = {t: d for t, d in cooling.items() if d > ordinal - rules.thought_cooldown}
+        recent_scenes = {s: d for s, d in recent_scenes.items() if d > ordinal - rules.scene_cooldown}
+
+        if holiday:
+            used_holidays.add(holiday["name"])
+            slots.append(Slot(day, SLOT_HOLIDAY, holiday_ids[holiday["name"]], NO_SCENE))
+            cooling[holiday["text"]] = ordinal
+            recent_scenes["holiday_" + holiday["name"]] = ordinal
+            continue
+
+        excluded = sorted(scene_ids[s] for s in recent_scenes if s in scene_ids)
+        if len(excluded) < len(bank.scenes):
+            scene = nth_not_excluded(len(bank.scenes), excluded, rng)
+        else:
+            scene = rng.randrange(len(bank.scenes))
+
+        preferred = rules.seasonal_map.get(day.strftime("%m"), [])
+        thought_id = bank.pick_thought_id(preferred, cooling, rng) if preferred else None
+        if thought_id is None:
+            thought_id = bank.pick_thought_id(all_categories, cooling, rng)
+        if thought_id is None:
+            start_id, stop_id = bank.categories[rng.choice(all_categories)]
+            thought_id = rng.randrange(start_id, stop_id)
+
+        slots.append(Slot(day, SLOT_REGULAR, thought_id, scene))
+        cooling[bank.thought(thought_id)] = ordinal
+        recent_scenes[bank.scenes[scene]["name"]] = ordinal
+    return slots
+
+
+# =========================================================
+# PLAN FILE
+# =========================================================
+def write_plan(path, year, digest, slots):
+    out = bytearray(_HEADER.pack(_MAGIC, year, len(slots), digest))
+    for slot in slots:
+        out += _SLOT.pack(slot.kind, slot.id, slot.scene)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+
+
+def read_slot(path, day):
+    """(plan digest, Slot) for the given day, or (None, None) if there is no plan."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None, None
+    with f:
+        magic, year, days, digest = _HEADER.unpack(f.read(_HEADER.size))
+        index = day.timetuple().tm_yday - 1
+        if magic != _MAGIC or year != day.year or index >= days:
+            return None, None
+        f.seek(_HEADER.size + index * _SLOT.size)
+        kind, slot_id, scene = _SLOT.unpack(f.read(_SLOT.size))
+    return digest, Slot(day, kind, slot_id, scene)
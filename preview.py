@@ -0,0 +1,237 @@
+"""Render every thought and holiday text onto sample backgrounds for review.
+
+No API calls: backgrounds are synthetic (dark, light and busy skies) unless
+--backgrounds points at a directory of images, e.g. saved generations. Each
+(text, background, rendition) is rendered in a process pool with the real
+render_text(), and the results are laid out as contact sheets:
+
+    python preview.py [--out previews] [--renditions feed,square]
+                      [--backgrounds DIR] [--filter hope] [--workers N] [--strict]
+
+Texts that wrap past the TEXT_BOX_LINES caption box, or have a word wider
+than the box, are flagged in red on the sheets and listed at the end
+(--strict exits 1 if there are any).
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import main
+
+SHEET_COLUMNS = 6
+SHEET_ROWS = 5
+THUMB_WIDTH = 240
+CAPTION_HEIGHT = 34
+SHEET_MARGIN = 12
+OVERFLOW_COLOR = (200, 40, 40)
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".raw")
+
+
+# =========================================================
+# CONTENT + LAYOUT CHECKS
+# =========================================================
+def bank_entries(text_filter=""):
+    """(label, text) for every thought and holiday in the content bank."""
+    bank = main.get_bank()
+    entries = []
+    for category, thoughts in bank.thoughts.items():
+        for i, text in enumerate(thoughts):
+            entries.append((f"{category}/{i}", text))
+    for holiday in bank.holidays:
+        entries.append((f"holiday/{holiday['name']}", holiday["text"]))
+    return [(label, text) for label, text in entries
+            if text_filter in label or text_filter.lower() in text.lower()]
+
+
+def rendition_width(name):
+    left, _, right, _ = main.aspect_crop_box(main.SOURCE_IMAGE_SIZE, main.RENDITIONS[name])
+    return right - left
+
+
+def overflow(text, width):
+    """Why a text does not fit the caption box at this image width, or None."""
+    box_width = main.text_box_width(width)
+    lines = main.layout_text(text, main.FONT_MAIN, main.text_font_size(text), box_width)
+    if len(lines) > main.TEXT_BOX_LINES:
+        return f"{len(lines)} lines"
+    if any(w > box_width for _, w in lines):
+        return "word wider than box"
+    return None
+
+
+# =========================================================
+# RENDERING (PROCESS POOL)
+# =========================================================
+def synthetic_backgrounds():
+    """name -> source-sized RGB image: a dark sky, a pale sky and a busy scene."""
+    from PIL import Image
+
+    size = main.SOURCE_IMAGE_SIZE
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 64)
+
+    def sky(top, bottom, texture=None, amount=0.0):
+        layers = []
+        for t, b in zip(top, bottom):
+            channel = gradient.point(lambda v, t=t, b=b: t + (b - t) * v // 255)
+            if texture is not None:
+                channel = Image.blend(channel, texture, amount)
+            layers.append(channel)
+        return Image.merge("RGB", layers)
+
+    return {
+        "dark": sky((12, 18, 48), (70, 60, 90)),
+        "light": sky((190, 215, 240), (250, 240, 220)),
+        "busy": sky((40, 90, 60), (220, 180, 120), noise, 0.45),
+    }
+
+
+def load_backgrounds(directory):
+    from PIL import Image
+
+    backgrounds = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_SUFFIXES):
+            img = Image.open(os.path.join(directory, name)).convert("RGB")
+            backgrounds[os.path.splitext(name)[0]] = img.resize(main.SOURCE_IMAGE_SIZE)
+    if not backgrounds:
+        raise Exception(f"No images found in {directory}")
+    return backgrounds
+
+
+# Per-worker state, set up once by _init_worker().
+_backgrounds = None
+_crops = {}
+_placements = {}
+_current = None
+
+
+def _init_worker(background_dir):
+    global _backgrounds
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    _backgrounds = load_backgrounds(background_dir) if background_dir else synthetic_backgrounds()
+    find_text_box = main.find_text_box
+
+    def cached_find_text_box(img, box_width, box_height):
+        # Placement depends only on the background and the box size, and most
+        # texts share a handful of font sizes, so this skips the image scan.
+        key = (_current, box_width, box_height)
+        if key not in _placements:
+            _placements[key] = find_text_box(img, box_width, box_height)
+        return _placements[key]
+
+    main.find_text_box = cached_find_text_box
+
+
+def _render_thumb(job):
+    """Render one (text, background, rendition) and return it as a JPEG thumbnail."""
+    global _current
+    text, background, rendition = job
+    _current = (background, rendition)
+    if _current not in _crops:
+        _crops[_current] = main.crop_to_aspect(_backgrounds[background], main.RENDITIONS[rendition])
+    img = main.render_text(_crops[_current].copy(), text)
+    img.thumbnail((THUMB_WIDTH, THUMB_WIDTH * 4))
+    out = BytesIO()
+    img.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+# =========================================================
+# CONTACT SHEETS
+# =========================================================
+def contact_sheet(cells, title):
+    """Grid of (label, thumbnail bytes, overflow reason) with captions."""
+    from PIL import Image, ImageDraw
+
+    thumbs = [Image.open(BytesIO(data)) for _, data, _ in cells]
+    cell_w = THUMB_WIDTH + SHEET_MARGIN
+    cell_h = max(t.height for t in thumbs) + CAPTION_HEIGHT + SHEET_MARGIN
+    rows = math.ceil(len(cells) / SHEET_COLUMNS)
+    sheet = Image.new("RGB", (SHEET_COLUMNS * cell_w + SHEET_MARGIN,
+                              rows * cell_h + 40 + SHEET_MARGIN), (245, 245, 242))
+    draw = ImageDraw.Draw(sheet)
+    title_font = main.load_font(main.FONT_MAIN, 18)
+    label_font = main.load_font(main.FONT_MAIN, 12)
+    draw.text((SHEET_MARGIN, 12), title, font=title_font, fill=(30, 30, 30))
+
+    for i, ((label, _, reason), thumb) in enumerate(zip(cells, thumbs)):
+        x = SHEET_MARGIN + (i % SHEET_COLUMNS) * cell_w
+        y = 40 + SHEET_MARGIN + (i // SHEET_COLUMNS) * cell_h
+        sheet.paste(thumb, (x, y))
+        if reason:
+            draw.rectangle((x - 3, y - 3, x + thumb.width + 2, y + thumb.height + 2),
+                           outline=OVERFLOW_COLOR, width=3)
+        draw.text((x, y + thumb.height + 4), label, font=label_font, fill=(30, 30, 30))
+        if reason:
+            draw.text((x, y + thumb.height + 18), f"OVERFLOW: {reason}", font=label_font,
+                      fill=OVERFLOW_COLOR)
+    return sheet
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Render the content bank for typography review")
+    parser.add_argument("--out", default="previews", help="directory for the contact sheets")
+    parser.add_argument("--renditions", default=main.PRIMARY_RENDITION,
+                        help=f"comma-separated, from {', '.join(main.RENDITIONS)}")
+    parser.add_argument("--backgrounds", metavar="DIR",
+                        help="render onto the images in DIR instead of synthetic skies")
+    parser.add_argument("--filter", default="", help="only labels or texts containing this")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--strict", action="store_true", help="exit 1 if any text overflows")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    main.validate_fonts()
+    renditions = [name.strip() for name in args.renditions.split(",") if name.strip()]
+    unknown = [name for name in renditions if name not in main.RENDITIONS]
+    if unknown:
+        parser.error(f"unknown rendition(s): {', '.join(unknown)}")
+    entries = bank_entries(args.filter)
+    if not entries:
+        print("No texts match.")
+        return 0
+    background_names = list(
+        load_backgrounds(args.backgrounds) if args.backgrounds else synthetic_backgrounds()
+    )
+
+    flags = {
+        (label, rendition): overflow(text, rendition_width(rendition))
+        for label, text in entries for rendition in renditions
+    }
+    jobs = [(text, background, rendition)
+            for rendition in renditions for background in background_names
+            for _, text in entries]
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.backgrounds,)) as pool:
+        thumbs = iter(pool.map(_render_thumb, jobs, chunksize=max(1, len(jobs) // (4 * args.workers))))
+        os.makedirs(args.out, exist_ok=True)
+        per_sheet = SHEET_COLUMNS * SHEET_ROWS
+        sheets = 0
+        for rendition in renditions:
+            for background in background_names:
+                cells = [(label, next(thumbs), flags[label, rendition]) for label, _ in entries]
+                for page, first in enumerate(range(0, len(cells), per_sheet), start=1):
+                    pages = math.ceil(len(cells) / per_sheet)
+                    title = f"{rendition} on {background} ({page}/{pages})"
+                    path = os.path.join(args.out, f"{rendition}-{background}-{page:02d}.jpg")
+                    contact_sheet(cells[first:first + per_sheet], title).save(path, quality=90)
+                    sheets += 1
+
+    overflowing = sorted((label, rendition, reason) for (label, rendition), reason in flags.items() if reason)
+    print(f"Rendered {len(jobs)} previews of {len(entries)} texts onto {sheets} contact sheet(s) "
+          f"in {args.out}/ ({time.perf_counter() - start:.1f}s).")
+    if overflowing:
+        print(f"{len(overflowing)} overflow(s) past the {main.TEXT_BOX_LINES}-line caption box:")
+        text_of = dict(entries)
+        for label, rendition, reason in overflowing:
+            print(f"  {label} [{rendition}]: {reason}: {text_of[label]}")
+    return 1 if overflowing and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
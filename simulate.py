@@ -0,0 +1,285 @@
+"""Fast-forward the bot through simulated days on a virtual clock.
+
+Each simulated day runs the real run_once() decision path (preflight, pending
+retry, holidays, queue, plan or live choice, state recording) against an
+in-memory store. Image generation, upload, token checks and warm-ups are
+stubbed. Usage:
+
+    python simulate.py [--days 3650] [--bank-sizes 0,1000,10000]
+                       [--mode live|planned] [--failure-rate 0.0] [--seed 1]
+
+Reports, per bank size:
+- thought and scene repeat intervals and cooldown violations
+- how often each fallback fired
+- the category distribution
+- per-decision latency
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import main
+from content_bank import BANK_SOURCE_FILE, load_bank
+from state_store import StateStore
+
+
+class VirtualClock:
+    """Stands in for main.now_local(); advanced one day at a time."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, days=1):
+        self.now += timedelta(days=days)
+
+
+def synthetic_bank(size, workdir):
+    """The real bank with `size` thoughts spread over its categories. Returns a loaded bank."""
+    with open(BANK_SOURCE_FILE, encoding="utf-8") as f:
+        source = json.load(f)
+    if size:
+        categories = list(source["thoughts"])
+        source["thoughts"] = {
+            category: [
+                f"Synthetic thought {i} about {category}."
+                for i in range(n, size, len(categories))
+            ]
+            for n, category in enumerate(categories)
+        }
+    path = os.path.join(workdir, f"bank-{size}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(source, f)
+    return load_bank(path, os.path.join(workdir, f"bank-{size}.idx"))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Recorder:
+    """Wraps the decision functions to count outcomes and time them."""
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.posts = []            # (day ordinal, scene, thought)
+        self.statuses = collections.Counter()
+        self.fallbacks = collections.Counter()
+        self.decision_us = []
+        self.run_us = []
+        self._picks = []
+
+    def install(self, mode):
+        real_choose = main.choose_scene_and_text
+        real_planned = main.planned_post
+        real_pick = self.bank.pick_thought
+        real_nth = main.nth_not_excluded
+
+        def pick_thought(categories, cooling, rng=random):
+            picked = real_pick(categories, cooling, rng)
+            self._picks.append(picked)
+            return picked
+
+        def nth_not_excluded(n, excluded, rng=random):
+            self._picks.append("scene")
+            return real_nth(n, excluded, rng)
+
+        def choose(*args, **kwargs):
+            self._picks = []
+            start = time.perf_counter()
+            result = real_choose(*args, **kwargs)
+            self.decision_us.append((time.perf_counter() - start) * 1e6)
+            if "scene" not in self._picks:
+                self.fallbacks["all_scenes_on_cooldown"] += 1
+            thoughts = [p for p in self._picks if p != "scene"]
+            if len(thoughts) == 2 and thoughts[0] is None:
+                self.fallbacks["seasonal_exhausted"] += 1
+            if thoughts and thoughts[-1] is None:
+                self.fallbacks["all_thoughts_on_cooldown"] += 1
+            return result
+
+        def planned():
+            start = time.perf_counter()
+            result = real_planned() if mode == "planned" else None
+            if mode == "planned":
+                self.decision_us.append((time.perf_counter() - start) * 1e6)
+                if result is None:
+                    self.fallbacks["plan_slot_unusable"] += 1
+            return result
+
+        def log_engagement(scene, thought, status="POSTED"):
+            self.statuses[status.split(":")[0]] += 1
+            if status == "SUCCESS":
+                self.posts.append((main.now_local().date().toordinal(), scene, thought))
+
+        self.bank.pick_thought = pick_thought
+        main.nth_not_excluded = nth_not_excluded
+        main.choose_scene_and_text = choose
+        main.planned_post = planned
+        main.log_engagement = log_engagement
+
+    def report(self, thought_cooldown, scene_cooldown):
+        def intervals(index):
+            """Repeat gaps in days, each flagged if either post was a holiday."""
+            last = {}
+            gaps = []
+            for day, scene, thought in self.posts:
+                key = (day, scene, thought)[index]
+                holiday = scene.startswith("holiday_")
+                if key in last:
+                    gaps.append((day - last[key][0], holiday or last[key][1]))
+                last[key] = (day, holiday)
+            return gaps
+
+        thought_gaps = intervals(2)
+        scene_gaps = [gap for gap, _ in intervals(1)]
+        # Holidays post on their date regardless of cooldowns.
+        holiday_repeats = sum(1 for gap, holiday in thought_gaps if holiday and gap < thought_cooldown)
+        thought_gaps = [gap for gap, _ in thought_gaps]
+        categories = collections.Counter()
+        for _, scene, thought in self.posts:
+            ids = self.bank.ids(thought)
+            categories[self.bank.category_of(ids[0]) if ids else "holiday"] += 1
+        return {
+            "posts": len(self.posts),
+            "statuses": dict(self.statuses),
+            "thought_repeat_days": {
+                "min": min(thought_gaps, default=0),
+                "median": statistics.median(thought_gaps) if thought_gaps else 0,
+                "under_cooldown": sum(1 for g in thought_gaps if g < thought_cooldown),
+                "caused_by_holidays": holiday_repeats,
+            },
+            "scene_repeat_days": {
+                "min": min(scene_gaps, default=0),
+                "median": statistics.median(scene_gaps) if scene_gaps else 0,
+                "under_cooldown": sum(1 for g in scene_gaps if g < scene_cooldown),
+            },
+            "fallbacks": dict(self.fallbacks),
+            "categories": dict(categories.most_common()),
+            "decision_us": {
+                "p50": percentile(self.decision_us, 0.5),
+                "p95": percentile(self.decision_us, 0.95),
+                "max": max(self.decision_us, default=0.0),
+            },
+            "run_us_p50": percentile(self.run_us, 0.5),
+        }
+
+
+def simulate(days, bank, mode="live", failure_rate=0.0, start=None, seed=1):
+    """Run `days` simulated days against `bank`. Returns the report dict."""
+    random.seed(seed)
+    tz = ZoneInfo(main.TIMEZONE)
+    start = start or datetime(2026, 1, 1, tzinfo=tz)
+    window_start = main.POST_WINDOWS[0][0]
+    clock = VirtualClock(start.replace(hour=window_start, minute=30))
+
+    def upload(image_buffer):
+        if random.random() < failure_rate:
+            raise Exception("Simulated upload failure")
+
+    saved = {name: getattr(main, name) for name in (
+        "now_local", "render_post", "post_to_facebook", "check_token_health",
+        "validate_secrets", "validate_fonts", "check_kill_switch", "report_startup",
+        "choose_scene_and_text", "planned_post", "log_engagement", "nth_not_excluded",
+        "compact_history", "warm_fonts", "warm_graph", "DRY_RUN", "_store", "_bank",
+    )}
+    main.now_local = clock
+    main.render_post = lambda prompt, text: io.BytesIO(b"")
+    main.post_to_facebook = upload
+    main.check_token_health = lambda force=False: True
+    main.warm_fonts = lambda texts=(): None
+    main.warm_graph = lambda: None
+    main.validate_secrets = main.validate_fonts = lambda: None
+    main.check_kill_switch = lambda: False
+    main.report_startup = lambda path: None
+    # Its verification picks would count as decisions.
+    main.compact_history = lambda force=False: 0
+    main.DRY_RUN = False
+    main._store = StateStore(":memory:", legacy_dir=None)
+    main._bank = bank
+
+    recorder = Recorder(bank)
+    recorder.install(mode)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)  # plan files and the artifact cache stay out of the tree
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                for _ in range(days):
+                    run_start = time.perf_counter()
+                    main.run_once()
+                    recorder.run_us.append((time.perf_counter() - run_start) * 1e6)
+                    clock.advance()
+                    out.seek(0)
+                    out.truncate()
+    finally:
+        os.chdir(cwd)
+        main._store.close()
+        del bank.pick_thought
+        for name, value in saved.items():
+            setattr(main, name, value)
+    return recorder.report(main.THOUGHT_COOLDOWN_DAYS, main.SCENE_COOLDOWN_DAYS)
+
+
+def print_report(size, report):
+    t, s, d = report["thought_repeat_days"], report["scene_repeat_days"], report["decision_us"]
+    print(f"\n=== bank size {size}: {report['posts']} posts {report['statuses']}")
+    print(f"thought repeats: min {t['min']}d, median {t['median']}d, under cooldown {t['under_cooldown']} "
+          f"({t['caused_by_holidays']} by holiday posts)")
+    print(f"scene repeats:   min {s['min']}d, median {s['median']}d, under cooldown {s['under_cooldown']}")
+    print(f"fallbacks:       {report['fallbacks'] or 'none'}")
+    print(f"decision:        p50 {d['p50']:.0f} us, p95 {d['p95']:.0f} us, max {d['max']:.0f} us "
+          f"(whole run p50 {report['run_us_p50']:.0f} us)")
+    total = sum(report["categories"].values()) or 1
+    print("categories:      " + ", ".join(
+        f"{c} {n / total:.0%}" for c, n in report["categories"].items()
+    ))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Simulate the bot over many days")
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--bank-sizes", default="0",
+                        help="comma-separated synthetic bank sizes (0 = the real bank)")
+    parser.add_argument("--mode", choices=("live", "planned"), default="live",
+                        help="live: every day goes through choose_scene_and_text; "
+                             "planned: use the year plan first")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="chance that a simulated upload fails")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print reports as JSON")
+    args = parser.parse_args()
+
+    reports = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.bank_sizes.split(",")):
+            bank = synthetic_bank(size, workdir)
+            start = time.perf_counter()
+            report = simulate(args.days, bank, args.mode, args.failure_rate, seed=args.seed)
+            report["elapsed_s"] = time.perf_counter() - start
+            reports[bank.count] = report
+            if not args.json:
+                print_report(bank.count, report)
+                print(f"simulated {args.days} days in {report['elapsed_s']:.1f}s")
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main_cli()
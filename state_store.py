@@ -0,0 +1,594 @@
+"""Single-file bot state backed by SQLite.
+
+Replaces the separate last_post.txt / monthly_usage.json / *_history.json /
+engagement_log.csv / error_log.txt files. Each table is read at most once per
+run, writes only touch the rows that changed, and the success path commits
+everything in a single transaction.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+
+STATE_DB_FILE = "bot_state.db"
+# Closed months of engagement/error log rows, and history entries that no
+# longer affect any decision, are moved here as gzipped JSONL.
+LOG_ARCHIVE_DIR = "logs"
+
+# Files written by the pre-SQLite versions of the bot; imported once when the
+# database is first created.
+LEGACY_FILES = {
+    "last_post": "last_post.txt",
+    "monthly_usage": "monthly_usage.json",
+    "thought_history": "thought_history.json",
+    "scene_history": "scene_history.json",
+    "holiday_history": "holiday_history.json",
+    "engagement_log": "engagement_log.csv",
+    "error_log": "error_log.txt",
+}
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run, so new steps are only ever appended.
+MIGRATIONS = [
+    """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    CREATE TABLE monthly_usage (month TEXT PRIMARY KEY, count INTEGER NOT NULL);
+    CREATE TABLE thought_history (thought TEXT PRIMARY KEY, last_used TEXT NOT NULL);
+    CREATE TABLE scene_history (scene TEXT PRIMARY KEY, last_used TEXT NOT NULL);
+    CREATE TABLE holiday_history (
+        year TEXT NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (year, name)
+    );
+    CREATE TABLE engagement_log (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        scene TEXT,
+        thought TEXT,
+        status TEXT
+    );
+    CREATE TABLE error_log (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        message TEXT,
+        traceback TEXT
+    );
+    """,
+    """
+    CREATE TABLE post_queue (
+        id INTEGER PRIMARY KEY,
+        created TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        text TEXT NOT NULL,
+        scene_name TEXT NOT NULL,
+        artifact_key TEXT NOT NULL
+    );
+    """,
+    # Day ordinal (date.toordinal) of last use, indexed so the cooldown set
+    # is a range scan instead of parsing every history row.
+    """
+    ALTER TABLE thought_history ADD COLUMN day INTEGER;
+    ALTER TABLE scene_history ADD COLUMN day INTEGER;
+    UPDATE thought_history SET day = CAST(julianday(last_used) - 1721424.5 AS INTEGER);
+    UPDATE scene_history SET day = CAST(julianday(last_used) - 1721424.5 AS INTEGER);
+    CREATE INDEX thought_history_day ON thought_history (day);
+    CREATE INDEX scene_history_day ON scene_history (day);
+    """,
+    # Log rotation: hot tables hold the current month, older months live in
+    # compressed segments with per-month counts kept here.
+    """
+    CREATE INDEX engagement_log_date ON engagement_log (date, status);
+    CREATE INDEX error_log_timestamp ON error_log (timestamp);
+    CREATE TABLE log_segments (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        month TEXT NOT NULL,
+        path TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        sha256 TEXT NOT NULL
+    );
+    CREATE INDEX log_segments_month ON log_segments (kind, month);
+    CREATE TABLE log_counts (
+        kind TEXT NOT NULL,
+        month TEXT NOT NULL,
+        status TEXT NOT NULL,
+        scene TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (kind, month, status, scene)
+    );
+    """,
+]
+
+# kind -> (table, date column, columns kept in segments)
+LOG_TABLES = {
+    "engagement": ("engagement_log", "date", ("date", "time", "scene", "thought", "status")),
+    "error": ("error_log", "timestamp", ("timestamp", "message", "traceback")),
+}
+
+
+def status_class(status):
+    """'FAILED: <error>' -> 'FAILED'; other statuses unchanged."""
+    return (status or "").split(":", 1)[0]
+
+
+class StateStore:
+    def __init__(self, path=STATE_DB_FILE, legacy_dir="."):
+        self.path = path
+        is_new = path == ":memory:" or not os.path.exists(path)
+        # Autocommit mode; transaction() issues BEGIN/COMMIT explicitly.
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self._cache = {}
+        self._in_transaction = False
+        self._migrate()
+        if is_new and legacy_dir is not None:
+            self._import_legacy(legacy_dir)
+
+    def close(self):
+        self.conn.close()
+
+    def reload(self):
+        """Forget cached reads so the next access sees the database as it is now."""
+        self._cache.clear()
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.transaction():
+                for statement in script.split(";"):
+                    if statement.strip():
+                        self.conn.execute(statement)
+                self.conn.execute(f"PRAGMA user_version = {i}")
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one atomic commit. Nested use joins the outer one."""
+        if self._in_transaction:
+            yield
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            # Cached reads may hold values from the rolled-back writes.
+            self._cache.clear()
+            raise
+        else:
+            self.conn.execute("COMMIT")
+        finally:
+            self._in_transaction = False
+
+    # -----------------------------------------------------
+    # Meta (last post date, misc scalars)
+    # -----------------------------------------------------
+    def get_meta(self, key, default=None):
+        meta = self._cache.get("meta")
+        if meta is None:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+            self._cache["meta"] = meta
+        return meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self.get_meta(key)
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+        self._cache["meta"][key] = value
+
+    # -----------------------------------------------------
+    # Monthly usage
+    # -----------------------------------------------------
+    def monthly_usage(self, month):
+        row = self.conn.execute(
+            "SELECT count FROM monthly_usage WHERE month = ?", (month,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def increment_monthly_usage(self, month):
+        self.conn.execute(
+            "INSERT INTO monthly_usage (month, count) VALUES (?, 1) "
+            "ON CONFLICT(month) DO UPDATE SET count = count + 1",
+            (month,),
+        )
+
+    # -----------------------------------------------------
+    # Thought / scene / holiday history
+    # -----------------------------------------------------
+    def _history(self, table, key_col):
+        if table not in self._cache:
+            self._cache[table] = dict(
+                self.conn.execute(f"SELECT {key_col}, last_used FROM {table}")
+            )
+        return self._cache[table]
+
+    def _set_history(self, table, key_col, key, day):
+        history = self._history(table, key_col)
+        self.conn.execute(
+            f"INSERT INTO {table} ({key_col}, last_used, day) VALUES (?, ?, ?) "
+            f"ON CONFLICT({key_col}) DO UPDATE SET "
+            f"last_used = excluded.last_used, day = excluded.day",
+            (key, day, date.fromisoformat(day).toordinal()),
+        )
+        history[key] = day
+
+    def _used_since(self, table, key_col, first_day):
+        return dict(self.conn.execute(
+            f"SELECT {key_col}, day FROM {table} WHERE day >= ?", (first_day,)
+        ))
+
+    def thought_history(self):
+        return self._history("thought_history", "thought")
+
+    def set_thought_used(self, thought, day):
+        self._set_history("thought_history", "thought", thought, day)
+
+    def thoughts_used_since(self, first_day):
+        """{thought: day ordinal} for thoughts last used on or after first_day."""
+        return self._used_since("thought_history", "thought", first_day)
+
+    def scene_history(self):
+        return self._history("scene_history", "scene")
+
+    def set_scene_used(self, scene, day):
+        self._set_history("scene_history", "scene", scene, day)
+
+    def scenes_used_since(self, first_day):
+        """{scene: day ordinal} for scenes last used on or after first_day."""
+        return self._used_since("scene_history", "scene", first_day)
+
+    def holiday_history(self):
+        if "holiday_history" not in self._cache:
+            history = {}
+            for year, name in self.conn.execute(
+                "SELECT year, name FROM holiday_history ORDER BY rowid"
+            ):
+                history.setdefault(year, []).append(name)
+            self._cache["holiday_history"] = history
+        return self._cache["holiday_history"]
+
+    def add_holiday_used(self, year, name):
+        history = self.holiday_history()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO holiday_history (year, name) VALUES (?, ?)",
+            (year, name),
+        )
+        used = history.setdefault(year, [])
+        if name not in used:
+            used.append(name)
+
+    def compact_history(self, first_thought_day, first_scene_day, year, month,
+                        verify=None, archive_dir=LOG_ARCHIVE_DIR):
+        """Move history entries that can no longer affect a decision to the archive.
+
+        Thoughts and scenes last used before first_*_day (day ordinals) and
+        holidays from years before `year` go to <archive_dir>/history-<month>.
+        verify(), if given, runs once the rows are gone and before the commit;
+        raising from it rolls everything back. Returns the number of rows moved.
+        """
+        expired = (
+            ("thought_history", "day < ?", first_thought_day),
+            ("scene_history", "day < ?", first_scene_day),
+            ("holiday_history", "year < ?", str(year)),
+        )
+        written = []
+        try:
+            with self.transaction():
+                entries = []
+                for table, where, bound in expired:
+                    cur = self.conn.execute(f"SELECT * FROM {table} WHERE {where}", (bound,))
+                    columns = [c[0] for c in cur.description]
+                    entries.extend(dict(zip(columns, row), table=table) for row in cur)
+                    self.conn.execute(f"DELETE FROM {table} WHERE {where}", (bound,))
+                if not entries:
+                    return 0
+                self._cache.clear()
+                if verify is not None:
+                    verify()
+                written.append(self._write_segment(archive_dir, "history", month, entries))
+        except BaseException:
+            self._cache.clear()
+            for path in written:
+                os.remove(path)
+            raise
+        self.conn.execute("VACUUM")
+        return len(entries)
+
+    # -----------------------------------------------------
+    # Pre-generated post queue (oldest first)
+    # -----------------------------------------------------
+    def queued_posts(self):
+        if "post_queue" not in self._cache:
+            self.conn.row_factory = sqlite3.Row
+            try:
+                rows = self.conn.execute("SELECT * FROM post_queue ORDER BY id").fetchall()
+            finally:
+                self.conn.row_factory = None
+            self._cache["post_queue"] = [dict(row) for row in rows]
+        return self._cache["post_queue"]
+
+    def enqueue_post(self, created, prompt, text, scene_name, artifact_key):
+        queue = self.queued_posts()
+        cur = self.conn.execute(
+            "INSERT INTO post_queue (created, prompt, text, scene_name, artifact_key) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (created, prompt, text, scene_name, artifact_key),
+        )
+        queue.append({
+            "id": cur.lastrowid,
+            "created": created,
+            "prompt": prompt,
+            "text": text,
+            "scene_name": scene_name,
+            "artifact_key": artifact_key,
+        })
+
+    def remove_queued_post(self, post_id):
+        queue = self.queued_posts()
+        self.conn.execute("DELETE FROM post_queue WHERE id = ?", (post_id,))
+        queue[:] = [q for q in queue if q["id"] != post_id]
+
+    # -----------------------------------------------------
+    # Logs (append-only)
+    # -----------------------------------------------------
+    def log_engagement(self, date, time, scene, thought, status):
+        self.conn.execute(
+            "INSERT INTO engagement_log (date, time, scene, thought, status) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (date, time, scene, thought, status),
+        )
+
+    def log_error(self, timestamp, message, traceback_text=""):
+        self.conn.execute(
+            "INSERT INTO error_log (timestamp, message, traceback) VALUES (?, ?, ?)",
+            (timestamp, message, traceback_text),
+        )
+
+    # -----------------------------------------------------
+    # Log rotation + queries
+    # -----------------------------------------------------
+    def rotate_logs(self, current_month, archive_dir=LOG_ARCHIVE_DIR):
+        """Move log rows from before current_month into per-month segments.
+
+        Returns the number of rows moved. Cheap when there is nothing to do.
+        """
+        pending = {}
+        for kind, (table, date_col, columns) in LOG_TABLES.items():
+            if self.conn.execute(
+                f"SELECT 1 FROM {table} WHERE {date_col} < ? LIMIT 1", (current_month,)
+            ).fetchone():
+                pending[kind] = (table, date_col, columns)
+        if not pending:
+            return 0
+
+        written = []
+        moved = 0
+        try:
+            with self.transaction():
+                for kind, (table, date_col, columns) in pending.items():
+                    rows = self.conn.execute(
+                        f"SELECT {', '.join(columns)} FROM {table} WHERE {date_col} < ? ORDER BY id",
+                        (current_month,),
+                    ).fetchall()
+                    by_month = {}
+                    for row in rows:
+                        by_month.setdefault(row[0][:7], []).append(dict(zip(columns, row)))
+                    for month, entries in sorted(by_month.items()):
+                        path = self._write_segment(archive_dir, kind, month, entries)
+                        written.append(path)
+                        self._count_segment(kind, month, entries)
+                    self.conn.execute(f"DELETE FROM {table} WHERE {date_col} < ?", (current_month,))
+                    moved += len(rows)
+        except BaseException:
+            for path in written:
+                os.remove(path)
+            raise
+        # Give the freed pages back so the committed database file shrinks.
+        self.conn.execute("VACUUM")
+        return moved
+
+    def _write_segment(self, archive_dir, kind, month, entries):
+        part = self.conn.execute(
+            "SELECT COUNT(*) FROM log_segments WHERE kind = ? AND month = ?", (kind, month)
+        ).fetchone()[0]
+        suffix = f".{part + 1}" if part else ""
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"{kind}-{month}{suffix}.jsonl.gz")
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        tmp_path = f"{path}.tmp"
+        # mtime=0 keeps the bytes identical for identical rows.
+        with gzip.GzipFile(tmp_path, "wb", mtime=0) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.conn.execute(
+            "INSERT INTO log_segments (kind, month, path, rows, sha256) VALUES (?, ?, ?, ?, ?)",
+            (kind, month, path, len(entries), hashlib.sha256(data).hexdigest()),
+        )
+        return path
+
+    def _count_segment(self, kind, month, entries):
+        counts = {}
+        for e in entries:
+            key = (status_class(e.get("status", "ERROR")), e.get("scene") or "")
+            counts[key] = counts.get(key, 0) + 1
+        for (status, scene), count in counts.items():
+            self.conn.execute(
+                "INSERT INTO log_counts (kind, month, status, scene, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(kind, month, status, scene) DO UPDATE SET count = count + excluded.count",
+                (kind, month, status, scene, count),
+            )
+
+    def _archived(self, kind, month):
+        """Rows of one archived month, oldest first."""
+        entries = []
+        for (path,) in self.conn.execute(
+            "SELECT path FROM log_segments WHERE kind = ? AND month = ? ORDER BY id", (kind, month)
+        ):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entries.extend(json.loads(line) for line in f)
+        return entries
+
+    def _last(self, kind, n, where, params, archived_status):
+        """Newest-first rows matching `where`, falling back to archived months
+        that the counts say contain any."""
+        table, date_col, columns = LOG_TABLES[kind]
+        rows = [
+            dict(zip(columns, row)) for row in self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY id DESC LIMIT ?",
+                (*params, n),
+            )
+        ]
+        months = self.conn.execute(
+            "SELECT DISTINCT month FROM log_counts WHERE kind = ? AND status = ? ORDER BY month DESC",
+            (kind, archived_status),
+        ).fetchall()
+        for (month,) in months:
+            if len(rows) >= n:
+                break
+            matches = [e for e in self._archived(kind, month)
+                       if status_class(e.get("status", "ERROR")) == archived_status]
+            rows.extend(reversed(matches[-(n - len(rows)):]))
+        return rows[:n]
+
+    def last_failures(self, n=10):
+        """The n most recent failed posts, newest first."""
+        return self._last("engagement", n, "status LIKE 'FAILED%'", (), "FAILED")
+
+    def last_errors(self, n=10):
+        """The n most recent error log entries, newest first."""
+        return self._last("error", n, "1", (), "ERROR")
+
+    def posts_per_scene(self, month, status="SUCCESS"):
+        """{scene: count} of posts with the given status in a YYYY-MM month."""
+        counts = dict(self.conn.execute(
+            "SELECT scene, count FROM log_counts "
+            "WHERE kind = 'engagement' AND month = ? AND status = ?",
+            (month, status),
+        ))
+        for scene, count in self.conn.execute(
+            "SELECT scene, COUNT(*) FROM engagement_log "
+            "WHERE date BETWEEN ? AND ? AND status = ? GROUP BY scene",
+            (f"{month}-01", f"{month}-31", status),
+        ):
+            counts[scene] = counts.get(scene, 0) + count
+        return counts
+
+    # -----------------------------------------------------
+    # One-time import of the old per-file state
+    # -----------------------------------------------------
+    def _import_legacy(self, legacy_dir):
+        def path(name):
+            return os.path.join(legacy_dir, LEGACY_FILES[name])
+
+        def load_json(name):
+            if not os.path.exists(path(name)):
+                return {}
+            try:
+                with open(path(name)) as f:
+                    data = json.load(f)
+            except ValueError as e:
+                print(f"Skipping legacy {LEGACY_FILES[name]}: {e}")
+                return {}
+            if not isinstance(data, dict):
+                print(f"Skipping legacy {LEGACY_FILES[name]}: expected an object")
+                return {}
+            return data
+
+        def skip(name, key, value):
+            print(f"Skipping legacy {LEGACY_FILES[name]} entry {key!r}: {value!r}")
+
+        imported = []
+        with self.transaction():
+            if os.path.exists(path("last_post")):
+                with open(path("last_post")) as f:
+                    value = f.read().strip()
+                if value and _is_iso_date(value):
+                    self.set_meta("last_post", value)
+                elif value:
+                    skip("last_post", "date", value)
+                imported.append("last_post")
+
+            for month, count in load_json("monthly_usage").items():
+                if _is_month(month) and isinstance(count, int) and not isinstance(count, bool):
+                    self.conn.execute(
+                        "INSERT INTO monthly_usage (month, count) VALUES (?, ?)",
+                        (month, count),
+                    )
+                else:
+                    skip("monthly_usage", month, count)
+            for thought, day in load_json("thought_history").items():
+                if _is_iso_date(day):
+                    self.set_thought_used(thought, day)
+                else:
+                    skip("thought_history", thought, day)
+            for scene, day in load_json("scene_history").items():
+                if _is_iso_date(day):
+                    self.set_scene_used(scene, day)
+                else:
+                    skip("scene_history", scene, day)
+            for year, names in load_json("holiday_history").items():
+                if not (year.isdigit() and isinstance(names, list)):
+                    skip("holiday_history", year, names)
+                    continue
+                for name in names:
+                    if isinstance(name, str):
+                        self.add_holiday_used(year, name)
+                    else:
+                        skip("holiday_history", year, name)
+
+            if os.path.exists(path("engagement_log")):
+                with open(path("engagement_log"), newline="", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    next(reader, None)  # header
+                    for row in reader:
+                        if len(row) == 5:
+                            self.log_engagement(*row)
+                imported.append("engagement_log")
+
+            if os.path.exists(path("error_log")):
+                with open(path("error_log"), errors="replace") as f:
+                    for timestamp, message, tb in _parse_error_log(f.read()):
+                        self.log_error(timestamp, message, tb)
+                imported.append("error_log")
+
+        imported += [
+            name for name in ("monthly_usage", "thought_history", "scene_history", "holiday_history")
+            if os.path.exists(path(name))
+        ]
+        if imported:
+            print(f"Imported legacy state into {self.path}: {', '.join(sorted(imported))}")
+
+
+def _is_iso_date(value):
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _is_month(value):
+    return _is_iso_date(f"{value}-01") and len(value) == 7
+
+
+_ERROR_HEADER = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] ERROR: (.*)$")
+
+
+def _parse_error_log(text):
+    """Split the old error_log.txt into (timestamp, message, traceback) entries."""
+    entries = []
+    for line in text.splitlines():
+        m = _ERROR_HEADER.match(line)
+        if m:
+            entries.append([m.group(1), m.group(2), []])
+        elif entries:
+            entries[-1][2].append(line)
+    return [(ts, msg, "\n".join(tb)) for ts, msg, tb in entries]
@@ -0,0 +1,95 @@
+import json
+import random
+
+import pytest
+
+from content_bank import ContentBank, compile_bank, load_bank, nth_not_excluded, validate_bank
+
+
+def small_bank():
+    return {
+        "thoughts": {
+            "hope": ["Morning comes.", "Keep going.", "Shared line."],
+            "peace": ["Be still.", "Shared line."],
+        },
+        "scenes": [{"name": "lake", "scene": "quiet lake", "details": "mist"}],
+        "seasons": {"summer": ["clear sky"]},
+        "lighting": ["golden hour"],
+        "atmosphere": ["calm"],
+        "moods": ["hopeful"],
+        "holidays": [{"month": 1, "day": 1, "name": "new_year", "text": "New.", "scene": "dawn"}],
+    }
+
+
+def write_bank(tmp_path, bank):
+    source = tmp_path / "bank.json"
+    source.write_text(json.dumps(bank), encoding="utf-8")
+    return str(source), str(tmp_path / "bank.idx")
+
+
+def test_compiled_index_round_trips(tmp_path):
+    source, index = write_bank(tmp_path, small_bank())
+    assert compile_bank(source, index) == 5
+
+    bank = ContentBank.open(index)
+    assert bank.categories == {"hope": (0, 3), "peace": (3, 5)}
+    assert list(bank.thoughts["hope"]) == ["Morning comes.", "Keep going.", "Shared line."]
+    assert bank.thoughts["peace"][-1] == "Shared line."
+    assert sorted(bank.ids("Shared line.")) == [2, 4]
+    assert bank.ids("Not in the bank.") == []
+    assert [h["name"] for h in bank.holidays] == ["new_year"]
+
+
+def test_stale_index_is_recompiled(tmp_path, capsys):
+    source, index = write_bank(tmp_path, small_bank())
+    compile_bank(source, index)
+
+    changed = small_bank()
+    changed["thoughts"]["peace"].append("Rest.")
+    write_bank(tmp_path, changed)
+    bank = load_bank(source, index)
+    assert list(bank.thoughts["peace"]) == ["Be still.", "Shared line.", "Rest."]
+    assert "recompiling" in capsys.readouterr().out
+
+
+def test_validation_reports_each_problem():
+    bank = small_bank()
+    bank["thoughts"]["hope"].append("Keep going.")
+    bank["scenes"].append({"name": "lake", "scene": "another lake", "details": ""})
+    bank["holidays"].append({"month": 13, "day": 1, "name": "new_year", "text": "x", "scene": "y"})
+    bank["holidays"].append({"month": 11, "weekday": 3, "nth": 5, "name": "late", "text": "x", "scene": "y"})
+    errors = validate_bank(bank)
+    assert "thoughts.hope[3]: duplicate 'Keep going.'" in errors
+    assert "scenes[1].details: expected non-empty text" in errors
+    assert "scenes[1]: duplicate name 'lake'" in errors
+    assert "holidays[1]: invalid month 13" in errors
+    assert "holidays[1]: duplicate name 'new_year'" in errors
+    assert "holidays[2]: needs a day, or a weekday (0-6) and nth (1-4 or -1)" in errors
+    assert validate_bank(small_bank()) == []
+
+
+def test_invalid_source_is_not_compiled(tmp_path):
+    bank = small_bank()
+    bank["lighting"] = []
+    source, index = write_bank(tmp_path, bank)
+    with pytest.raises(Exception, match="lighting: expected a non-empty list"):
+        compile_bank(source, index)
+
+
+def test_nth_not_excluded_skips_excluded_indices():
+    rng = random.Random(14)
+    excluded = [0, 2, 3, 7]
+    picks = {nth_not_excluded(8, excluded, rng) for _ in range(500)}
+    assert picks == {1, 4, 5, 6}
+
+
+def test_pick_thought_skips_cooling_texts(tmp_path):
+    bank = load_bank(*write_bank(tmp_path, small_bank()))
+    rng = random.Random(14)
+
+    cooling = {"Morning comes.", "Shared line."}
+    picks = {bank.pick_thought(["hope", "peace"], cooling, rng) for _ in range(200)}
+    assert picks == {("hope", "Keep going."), ("peace", "Be still.")}
+
+    assert bank.pick_thought(["hope"], {"Morning comes.", "Keep going.", "Shared line."}) is None
+    assert bank.pick_thought_id(["unknown"], set()) is None
@@ -0,0 +1,46 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import main
+
+
+def detailed_image(size=(1024, 1280)):
+    """Hard-to-compress RGB noise: a plain quality 95 JPEG is about 1.3 MB."""
+    gradient = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", [
+        Image.blend(Image.effect_noise(size, 64), gradient, 0.25) for _ in range(3)
+    ])
+
+
+@pytest.fixture(scope="module")
+def detailed():
+    return detailed_image()
+
+
+def test_flat_image_keeps_full_quality():
+    out, stats = main.encode_jpeg_targeted(Image.new("RGB", (1024, 1280), (90, 120, 150)))
+    assert stats["quality"] == main.JPEG_QUALITY_RANGE[1]
+    assert stats["subsampling"] == "4:4:4" and stats["progressive"]
+    assert stats["bytes"] == len(out.getvalue())
+
+
+def test_detailed_image_fits_the_default_budget(detailed):
+    # The 4:4:4 probes overflow Pillow's progressive encoder buffer here.
+    out, stats = main.encode_jpeg_targeted(detailed)
+    assert stats["bytes"] <= main.JPEG_MAX_BYTES and not stats["over_budget"]
+    Image.open(out).verify()
+
+
+def test_budget_above_encoder_buffer_picks_a_baseline_encode(detailed):
+    out, stats = main.encode_jpeg_targeted(detailed, max_bytes=2 * 1024 * 1024)
+    assert not stats["progressive"] and not stats["over_budget"]
+    assert stats["bytes"] == len(out.getvalue())
+    Image.open(BytesIO(out.getvalue())).verify()
+
+
+def test_unreachable_budget_is_flagged(detailed):
+    out, stats = main.encode_jpeg_targeted(detailed, max_bytes=100 * 1024)
+    assert stats["over_budget"] and stats["quality"] == main.JPEG_QUALITY_RANGE[0]
+    Image.open(out).verify()
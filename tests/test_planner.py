@@ -0,0 +1,121 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+import main
+from content_bank import load_bank
+from planner import (
+    SLOT_CAPPED, SLOT_HOLIDAY, SLOT_NONE, SLOT_REGULAR, PlanRules,
+    holiday_date, plan_digest, plan_year, read_slot, write_plan,
+)
+
+RULES = PlanRules(7, 2, 20, {"10": ["peace"]})
+
+
+@pytest.fixture
+def bank(tmp_path):
+    source = tmp_path / "bank.json"
+    source.write_text(json.dumps({
+        "thoughts": {
+            "hope": [f"Hope {i}." for i in range(8)],
+            "peace": [f"Peace {i}." for i in range(8)],
+        },
+        "scenes": [{"name": f"scene_{i}", "scene": f"scene {i}", "details": "d"} for i in range(4)],
+        "seasons": {"autumn": ["grey sky"]},
+        "lighting": ["soft"],
+        "atmosphere": ["calm"],
+        "moods": ["quiet"],
+        "holidays": [
+            {"month": 10, "day": 31, "name": "halloween", "text": "Lantern.", "scene": "fog"},
+            {"month": 11, "weekday": 3, "nth": 4, "name": "thanksgiving", "text": "Thanks.", "scene": "table"},
+        ],
+    }), encoding="utf-8")
+    return load_bank(str(source), str(tmp_path / "bank.idx"))
+
+
+def test_holiday_dates_for_a_known_year():
+    assert holiday_date({"month": 11, "weekday": 3, "nth": 4}, 2026) == date(2026, 11, 26)
+    assert holiday_date({"month": 9, "weekday": 0, "nth": 1}, 2026) == date(2026, 9, 7)
+    assert holiday_date({"month": 5, "weekday": 0, "nth": -1}, 2026) == date(2026, 5, 25)
+    assert holiday_date({"month": 2, "day": 29}, 2026) is None
+    assert holiday_date({"month": 2, "day": 29}, 2028) == date(2028, 2, 29)
+
+
+def test_plan_slots_for_2026(bank):
+    slots = plan_year(bank, 2026, date(2026, 3, 10), RULES, {}, {}, set(), 0)
+    assert len(slots) == 365
+    assert [s.day for s in slots[:2]] == [date(2026, 1, 1), date(2026, 1, 2)]
+    assert {s.kind for s in slots if s.day < date(2026, 3, 10)} == {SLOT_NONE}
+
+    by_day = {s.day: s for s in slots}
+    assert (by_day[date(2026, 10, 31)].kind, by_day[date(2026, 10, 31)].id) == (SLOT_HOLIDAY, 0)
+    assert (by_day[date(2026, 11, 26)].kind, by_day[date(2026, 11, 26)].id) == (SLOT_HOLIDAY, 1)
+
+    # The cap keeps room for Halloween on the last day of October.
+    october = [s for s in slots if s.day.month == 10]
+    assert [s.kind for s in october].count(SLOT_CAPPED) == 11
+    assert sum(1 for s in october if s.kind != SLOT_CAPPED) == RULES.monthly_cap
+    # October prefers its seasonal category.
+    assert {bank.category_of(s.id) for s in october if s.kind == SLOT_REGULAR} == {"peace"}
+
+    last_thought, last_scene = {}, {}
+    for s in slots:
+        if s.kind != SLOT_REGULAR:
+            continue
+        day = s.day.toordinal()
+        assert day - last_thought.get(s.id, -100) >= RULES.thought_cooldown
+        assert day - last_scene.get(s.scene, -100) >= RULES.scene_cooldown
+        last_thought[s.id] = day
+        last_scene[s.scene] = day
+
+    assert plan_year(bank, 2026, date(2026, 3, 10), RULES, {}, {}, set(), 0) == slots
+
+
+def test_used_holidays_and_history_are_respected(bank):
+    start = date(2026, 10, 30)
+    recent = {"Peace 0.": start.toordinal() - 1}
+    slots = plan_year(bank, 2026, start, RULES, recent, {}, {"halloween"}, 0)
+    by_day = {s.day: s for s in slots}
+    assert by_day[date(2026, 10, 31)].kind == SLOT_REGULAR
+    assert "Peace 0." not in {bank.thought(by_day[date(2026, 10, d)].id) for d in (30, 31)}
+
+
+def test_read_slot_seeks_to_the_day(tmp_path, bank):
+    slots = plan_year(bank, 2026, date(2026, 1, 1), RULES, {}, {}, set(), 0)
+    path = str(tmp_path / "plan_2026.bin")
+    digest = plan_digest(bank.source_digest, RULES)
+    write_plan(path, 2026, digest, slots)
+
+    for day in (date(2026, 1, 1), date(2026, 7, 4), date(2026, 12, 31)):
+        assert read_slot(path, day) == (digest, slots[day.timetuple().tm_yday - 1])
+    assert read_slot(path, date(2027, 1, 1)) == (None, None)
+    assert read_slot(str(tmp_path / "plan_2027.bin"), date(2027, 1, 1)) == (None, None)
+
+
+def test_plan_digest_covers_the_rules(bank):
+    digest = plan_digest(bank.source_digest, RULES)
+    assert plan_digest(bank.source_digest, RULES._replace()) == digest
+    assert plan_digest(bank.source_digest, RULES._replace(thought_cooldown=8)) != digest
+    assert plan_digest(bank.source_digest, RULES._replace(scene_cooldown=3)) != digest
+    assert plan_digest(bank.source_digest, RULES._replace(monthly_cap=19)) != digest
+
+
+def test_planned_post_rebuilds_when_the_rules_change(tmp_path, monkeypatch, capsys, bank):
+    from state_store import StateStore
+
+    store = StateStore(":memory:", legacy_dir=None)
+    monkeypatch.setattr(main, "_bank", bank)
+    monkeypatch.setattr(main, "_store", store)
+    monkeypatch.setattr(main, "now_local", lambda: datetime(2026, 6, 1, 9, 0))
+    monkeypatch.chdir(tmp_path)
+
+    assert main.planned_post() is not None
+    assert "Planning the rest of 2026" in capsys.readouterr().out
+    main.planned_post()
+    assert "Planning" not in capsys.readouterr().out
+
+    monkeypatch.setattr(main, "THOUGHT_COOLDOWN_DAYS", main.THOUGHT_COOLDOWN_DAYS + 1)
+    main.planned_post()
+    assert "Planning the rest of 2026" in capsys.readouterr().out
+    store.close()
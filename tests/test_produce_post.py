@@ -0,0 +1,71 @@
+import asyncio
+import time
+from io import BytesIO
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "warm_fonts", lambda texts: calls.append("warm_fonts"))
+    monkeypatch.setattr(main, "warm_graph", lambda: calls.append("warm_graph"))
+    monkeypatch.setattr(main, "cached_token_health", lambda: None)
+
+    def render_post(prompt, text):
+        calls.append("render_post")
+        return BytesIO(b"jpeg")
+
+    monkeypatch.setattr(main, "render_post", render_post)
+    return calls
+
+
+def token_check(calls, ok):
+    def check():
+        calls.append("token_check")
+        return ok
+    return check
+
+
+def test_generation_waits_for_the_token_check(calls, monkeypatch):
+    monkeypatch.setattr(main, "check_token_health", token_check(calls, True))
+    image, token_ok = asyncio.run(main.produce_post("prompt", "text"))
+
+    assert token_ok and image.getvalue() == b"jpeg"
+    assert calls.index("token_check") < calls.index("render_post")
+    assert {"warm_fonts", "warm_graph"} <= set(calls)
+
+
+def test_failed_token_check_skips_generation(calls, monkeypatch):
+    monkeypatch.setattr(main, "check_token_health", token_check(calls, False))
+    assert asyncio.run(main.produce_post("prompt", "text")) == (None, False)
+    assert "render_post" not in calls
+
+
+@pytest.mark.parametrize("cached", [
+    {"ok": False, "checked_at": 0},
+    {"ok": True, "checked_at": 0, "expires_at": 1},
+])
+def test_known_bad_cached_health_skips_generation(calls, monkeypatch, cached):
+    monkeypatch.setattr(main, "cached_token_health", lambda: cached)
+    monkeypatch.setattr(main, "check_token_health", token_check(calls, True))
+    assert asyncio.run(main.produce_post("prompt", "text")) == (None, False)
+    assert "token_check" not in calls and "render_post" not in calls
+
+
+def test_queued_post_is_not_regenerated(calls, monkeypatch):
+    monkeypatch.setattr(main, "check_token_health", token_check(calls, True))
+    image, token_ok = asyncio.run(main.produce_post("prompt", "text", {"image": b"queued"}))
+    assert token_ok and image.getvalue() == b"queued"
+    assert "render_post" not in calls
+
+
+def test_token_known_bad():
+    now = time.time()
+    assert not main.token_known_bad(None)
+    assert not main.token_known_bad({"ok": True, "checked_at": now, "expires_at": 0})
+    assert not main.token_known_bad({"ok": True, "checked_at": now, "expires_at": now + 60})
+    assert main.token_known_bad({"ok": True, "checked_at": now, "expires_at": now - 60})
+    assert main.token_known_bad({"ok": False, "checked_at": now})
@@ -0,0 +1,90 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from state_store import StateStore
+
+TODAY = datetime(2026, 6, 15, 9, 0)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = StateStore(":memory:", legacy_dir=None)
+    monkeypatch.setattr(main, "_store", store)
+    monkeypatch.setattr(main, "now_local", lambda: TODAY)
+    random.seed(13)
+    yield store
+    store.close()
+
+
+def days_ago(n):
+    return (TODAY - timedelta(days=n)).date().isoformat()
+
+
+def all_thoughts():
+    return {t for thoughts in main.THOUGHT_BANK.values() for t in thoughts}
+
+
+def test_thought_is_eligible_once_its_cooldown_has_passed(store):
+    target = main.THOUGHT_BANK["hope"][0]
+    for t in all_thoughts():
+        store.set_thought_used(t, days_ago(main.THOUGHT_COOLDOWN_DAYS - 1))
+    store.set_thought_used(target, days_ago(main.THOUGHT_COOLDOWN_DAYS))
+
+    for _ in range(20):
+        assert main.choose_scene_and_text()[1] == target
+
+
+def test_thought_inside_the_window_is_never_picked(store):
+    target = main.THOUGHT_BANK["hope"][0]
+    for t in all_thoughts():
+        store.set_thought_used(t, days_ago(main.THOUGHT_COOLDOWN_DAYS))
+    store.set_thought_used(target, days_ago(main.THOUGHT_COOLDOWN_DAYS - 1))
+
+    picks = {main.choose_scene_and_text()[1] for _ in range(500)}
+    assert target not in picks
+    assert len(picks) > 1
+
+
+def test_scene_cooldown_boundary(store):
+    eligible, cooling = main.SCENES[0]["name"], main.SCENES[1]["name"]
+    for scene in main.SCENES:
+        store.set_scene_used(scene["name"], days_ago(main.SCENE_COOLDOWN_DAYS - 1))
+    store.set_scene_used(eligible, days_ago(main.SCENE_COOLDOWN_DAYS))
+
+    for _ in range(20):
+        assert main.choose_scene_and_text()[0]["name"] == eligible
+
+    store.set_scene_used(eligible, days_ago(0))
+    store.set_scene_used(cooling, days_ago(main.SCENE_COOLDOWN_DAYS))
+    assert main.choose_scene_and_text()[0]["name"] == cooling
+
+
+def test_reserved_entries_count_as_cooling(store):
+    target = main.THOUGHT_BANK["hope"][0]
+    for t in all_thoughts() - {target}:
+        store.set_thought_used(t, days_ago(1))
+    other = main.THOUGHT_BANK["hope"][1]
+    store.set_thought_used(other, days_ago(main.THOUGHT_COOLDOWN_DAYS))
+
+    picks = {main.choose_scene_and_text(reserved_thoughts={target})[1] for _ in range(50)}
+    assert picks == {other}
+
+
+def test_history_compaction_keeps_selection_and_shared_random_state(store, tmp_path, monkeypatch):
+    thoughts = sorted(all_thoughts())
+    monkeypatch.chdir(tmp_path)
+    for i, t in enumerate(thoughts):
+        store.set_thought_used(t, days_ago(i % (2 * main.THOUGHT_COOLDOWN_DAYS)))
+    for i, scene in enumerate(main.SCENES):
+        store.set_scene_used(scene["name"], days_ago(i))
+    store.add_holiday_used("2025", "new_year")
+
+    state = random.getstate()
+    assert main.compact_history(force=True) > 0
+    assert random.getstate() == state
+    assert (tmp_path / "logs" / "history-2026-06.jsonl.gz").exists()
+    assert store.holiday_history() == {}
+    assert all(day >= days_ago(main.THOUGHT_COOLDOWN_DAYS - 1) for day in store.thought_history().values())
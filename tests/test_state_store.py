@@ -0,0 +1,232 @@
+import gzip
+import json
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+from state_store import MIGRATIONS, StateStore
+
+
+def write_legacy(tmp_path, **files):
+    for name, content in files.items():
+        text = content if isinstance(content, str) else json.dumps(content)
+        (tmp_path / name).write_text(text, encoding="utf-8")
+
+
+def test_new_database_runs_every_migration(tmp_path):
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=None)
+    assert store.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    store.close()
+
+
+def test_reopening_keeps_state_and_does_not_reimport(tmp_path):
+    write_legacy(tmp_path, **{"last_post.txt": "2026-03-01\n"})
+    db = str(tmp_path / "bot_state.db")
+    store = StateStore(db, legacy_dir=str(tmp_path))
+    store.set_meta("last_post", "2026-03-02")
+    store.close()
+
+    store = StateStore(db, legacy_dir=str(tmp_path))
+    assert store.get_meta("last_post") == "2026-03-02"
+    store.close()
+
+
+def test_imports_legacy_json_and_csv(tmp_path):
+    write_legacy(
+        tmp_path,
+        **{
+            "last_post.txt": "2026-03-01\n",
+            "monthly_usage.json": {"2026-02": 27, "2026-03": 1},
+            "thought_history.json": {"Rest is not quitting.": "2026-02-14"},
+            "scene_history.json": {"lake_dawn": "2026-02-27"},
+            "holiday_history.json": {"2026": ["new_year", "valentines"]},
+            "engagement_log.csv": (
+                "Date,Time,Scene,Thought,Status\n"
+                "2026-02-28,09:01:00,lake_dawn,Rest is not quitting.,SUCCESS\n"
+                "2026-03-01,09:02:00,short row\n"
+            ),
+            "error_log.txt": (
+                "[2026-02-28 09:05:00] ERROR: upload failed\n"
+                "Traceback (most recent call last):\n"
+                "  boom\n"
+            ),
+        },
+    )
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=str(tmp_path))
+
+    assert store.get_meta("last_post") == "2026-03-01"
+    assert store.monthly_usage("2026-02") == 27
+    assert store.thought_history() == {"Rest is not quitting.": "2026-02-14"}
+    assert store.scene_history() == {"lake_dawn": "2026-02-27"}
+    assert sorted(store.holiday_history()["2026"]) == ["new_year", "valentines"]
+    rows = store.conn.execute("SELECT date, scene, status FROM engagement_log").fetchall()
+    assert rows == [("2026-02-28", "lake_dawn", "SUCCESS")]
+    errors = store.conn.execute("SELECT timestamp, message, traceback FROM error_log").fetchall()
+    assert errors == [("2026-02-28 09:05:00", "upload failed",
+                       "Traceback (most recent call last):\n  boom")]
+    store.close()
+
+
+def test_malformed_legacy_values_are_skipped(tmp_path, capsys):
+    write_legacy(
+        tmp_path,
+        **{
+            "last_post.txt": "yesterday\n",
+            "monthly_usage.json": {"2026-02": "lots", "2026-03": 2, "March": 1},
+            "thought_history.json": {"Kept.": "2026-02-14", "Dropped.": "14/02/2026"},
+            "scene_history.json": "not json",
+            "holiday_history.json": {"2026": "new_year"},
+        },
+    )
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=str(tmp_path))
+
+    assert store.get_meta("last_post") is None
+    assert store.monthly_usage("2026-03") == 2
+    assert store.monthly_usage("2026-02") == 0
+    assert store.thought_history() == {"Kept.": "2026-02-14"}
+    assert store.scene_history() == {}
+    assert store.holiday_history() == {}
+    out = capsys.readouterr().out
+    assert "Skipping legacy thought_history.json entry 'Dropped.'" in out
+    assert "Skipping legacy scene_history.json" in out
+    store.close()
+
+
+def test_failed_transaction_rolls_back_and_clears_cache(tmp_path):
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=None)
+    store.set_thought_used("Kept.", "2026-01-01")
+    try:
+        with store.transaction():
+            store.set_thought_used("Dropped.", "2026-01-02")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert store.thought_history() == {"Kept.": "2026-01-01"}
+    on_disk = sqlite3.connect(str(tmp_path / "bot_state.db")).execute(
+        "SELECT thought FROM thought_history").fetchall()
+    assert on_disk == [("Kept.",)]
+    store.close()
+
+
+def logged_store(tmp_path):
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=None)
+    for day, scene, status in [
+        ("2026-04-30", "lake_dawn", "SUCCESS"),
+        ("2026-05-01", "lake_dawn", "SUCCESS"),
+        ("2026-05-02", "city_rain", "FAILED: timeout"),
+        ("2026-05-03", "city_rain", "SUCCESS"),
+        ("2026-06-01", "lake_dawn", "FAILED: 500"),
+    ]:
+        store.log_engagement(day, "09:00", scene, "Rest.", status)
+    store.log_error("2026-05-02 09:00:01", "timeout")
+    store.log_error("2026-06-01 09:00:01", "500")
+    return store
+
+
+def read_segment(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rotate_logs_moves_closed_months_into_segments(tmp_path):
+    store = logged_store(tmp_path)
+    logs = tmp_path / "logs"
+    assert store.rotate_logs("2026-06", str(logs)) == 5
+
+    assert sorted(os.listdir(logs)) == [
+        "engagement-2026-04.jsonl.gz", "engagement-2026-05.jsonl.gz", "error-2026-05.jsonl.gz",
+    ]
+    assert [e["date"] for e in read_segment(logs / "engagement-2026-05.jsonl.gz")] == [
+        "2026-05-01", "2026-05-02", "2026-05-03",
+    ]
+    hot = store.conn.execute("SELECT date FROM engagement_log").fetchall()
+    assert hot == [("2026-06-01",)]
+
+    assert store.posts_per_scene("2026-05") == {"lake_dawn": 1, "city_rain": 1}
+    assert [f["date"] for f in store.last_failures(5)] == ["2026-06-01", "2026-05-02"]
+    assert [e["message"] for e in store.last_errors(5)] == ["500", "timeout"]
+    assert store.rotate_logs("2026-06", str(logs)) == 0
+    store.close()
+
+
+def test_late_rows_get_a_second_segment(tmp_path):
+    store = logged_store(tmp_path)
+    logs = tmp_path / "logs"
+    store.rotate_logs("2026-06", str(logs))
+    store.log_engagement("2026-05-31", "23:59", "lake_dawn", "Late.", "SUCCESS")
+    assert store.rotate_logs("2026-06", str(logs)) == 1
+
+    assert [e["thought"] for e in read_segment(logs / "engagement-2026-05.2.jsonl.gz")] == ["Late."]
+    assert store.posts_per_scene("2026-05") == {"lake_dawn": 2, "city_rain": 1}
+    store.close()
+
+
+def test_failed_rotation_keeps_rows_and_removes_segments(tmp_path, monkeypatch):
+    store = logged_store(tmp_path)
+    logs = tmp_path / "logs"
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "_count_segment", fail)
+    with pytest.raises(RuntimeError):
+        store.rotate_logs("2026-06", str(logs))
+
+    assert os.listdir(logs) == []
+    assert store.conn.execute("SELECT COUNT(*) FROM engagement_log").fetchone()[0] == 5
+    assert store.conn.execute("SELECT COUNT(*) FROM log_segments").fetchone()[0] == 0
+    store.close()
+
+
+def history_store(tmp_path):
+    store = StateStore(str(tmp_path / "bot_state.db"), legacy_dir=None)
+    store.set_thought_used("Old.", "2026-01-10")
+    store.set_thought_used("Recent.", "2026-05-20")
+    store.set_scene_used("lake_dawn", "2026-05-01")
+    store.set_scene_used("city_rain", "2026-05-30")
+    store.add_holiday_used("2025", "new_year")
+    store.add_holiday_used("2026", "new_year")
+    (tmp_path / "logs").mkdir()
+    return store
+
+
+def compact(store, tmp_path, verify=None):
+    first_day = date(2026, 5, 1).toordinal()
+    return store.compact_history(
+        first_day, first_day + 25, 2026, "2026-06", verify, archive_dir=str(tmp_path / "logs"))
+
+
+def test_compact_history_archives_expired_rows(tmp_path):
+    store = history_store(tmp_path)
+    assert compact(store, tmp_path, verify=lambda: None) == 3
+
+    assert store.thought_history() == {"Recent.": "2026-05-20"}
+    assert store.scene_history() == {"city_rain": "2026-05-30"}
+    assert store.holiday_history() == {"2026": ["new_year"]}
+    archived = read_segment(tmp_path / "logs" / "history-2026-06.jsonl.gz")
+    assert sorted((e["table"], e.get("thought") or e.get("scene") or e.get("year")) for e in archived) == [
+        ("holiday_history", "2025"), ("scene_history", "lake_dawn"), ("thought_history", "Old."),
+    ]
+    assert compact(store, tmp_path) == 0
+    store.close()
+
+
+def test_failed_verify_rolls_back_and_leaves_no_segment(tmp_path):
+    store = history_store(tmp_path)
+    seen = []
+
+    def verify():
+        seen.append(store.thought_history().copy())
+        raise Exception("selection changed")
+
+    with pytest.raises(Exception, match="selection changed"):
+        compact(store, tmp_path, verify)
+
+    assert seen == [{"Recent.": "2026-05-20"}]
+    assert os.listdir(tmp_path / "logs") == []
+    assert store.thought_history() == {"Old.": "2026-01-10", "Recent.": "2026-05-20"}
+    assert store.holiday_history() == {"2025": ["new_year"], "2026": ["new_year"]}
+    assert store.conn.execute("SELECT COUNT(*) FROM log_segments").fetchone()[0] == 0
+    store.close()
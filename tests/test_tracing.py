@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import main
+import tracing
+from state_store import StateStore
+
+
+@pytest.fixture
+def trace_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer())
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(tmp_path / "trace_runs.jsonl"))
+    monkeypatch.setattr(tracing, "TRACE_PROM_FILE", str(tmp_path / "metrics.prom"))
+    return tmp_path
+
+
+def last_run(tmp_path):
+    lines = (tmp_path / "trace_runs.jsonl").read_text().splitlines()
+    return json.loads(lines[-1]), (tmp_path / "metrics.prom").read_text()
+
+
+def test_skipped_run_is_recorded_as_skip(trace_files, monkeypatch):
+    monkeypatch.setattr(main, "preflight", lambda: "Outside posting window. Skipping.")
+    assert main.run_once() == 0
+
+    record, prom = last_run(trace_files)
+    assert record["status"] == "skip"
+    assert record["path"] == "skip"
+    assert [s["name"] for s in record["spans"]] == ["preflight"]
+    assert "yesterdays_letters_run_success 1\n" in prom
+
+
+def test_failed_token_check_is_recorded_as_failed(trace_files, monkeypatch):
+    main.get_bank()
+    monkeypatch.chdir(trace_files)
+    monkeypatch.setattr(main, "_store", StateStore(":memory:", legacy_dir=None))
+    monkeypatch.setattr(main, "preflight", lambda: None)
+    for check in ("validate_secrets", "validate_fonts", "validate_renditions"):
+        monkeypatch.setattr(main, check, lambda: None)
+
+    async def produce_post(scene_prompt, text, queued=None):
+        return None, False
+
+    monkeypatch.setattr(main, "produce_post", produce_post)
+    monkeypatch.setattr(main, "check_kill_switch", lambda: False)
+    assert main.run_once() == 1
+
+    record, prom = last_run(trace_files)
+    assert record["status"] == "failed"
+    assert "yesterdays_letters_run_success 0\n" in prom
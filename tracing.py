@@ -0,0 +1,240 @@
+"""Per-stage spans for a run, with JSON and Prometheus textfile export.
+
+Enabled with TRACE=true. Each span records wall time, CPU time, bytes in/out
+(when the stage sets them) and peak RSS. finish_run() appends the run as one
+JSON line to TRACE_FILE and rewrites TRACE_PROM_FILE for node_exporter's
+textfile collector.
+
+When tracing is off, span() hands back a shared no-op object and traced()
+returns the function undecorated, so the cost is one global check.
+
+The current run lives in a context variable, so concurrent runs (one per
+page in batch mode) each call start_run() in their own context and get
+their own record; worker threads started with the context join its run.
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import time
+
+TRACE_ENABLED = os.getenv("TRACE", "false").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "trace_runs.jsonl")
+TRACE_PROM_FILE = os.getenv("TRACE_PROM_FILE", "metrics.prom")
+METRIC_PREFIX = "yesterdays_letters"
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Span:
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.run = tracer.current_run()
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        """Attach values such as bytes_in / bytes_out to this span."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.parent = self.tracer.current.get()
+        self._token = self.tracer.current.set(self.name)
+        self._rss = _peak_rss_bytes()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = _peak_rss_bytes()
+        self.tracer.current.reset(self._token)
+        record = {
+            "name": self.name,
+            "parent": self.parent,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_bytes": rss,
+            "rss_growth_bytes": rss - self._rss if rss is not None else None,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.fields)
+        self.run.spans.append(record)
+        return False
+
+
+class Run:
+    def __init__(self):
+        self.spans = []
+        self.fields = {}
+        self.started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+
+class Tracer:
+    def __init__(self):
+        self.current = contextvars.ContextVar("span", default=None)
+        self.run = contextvars.ContextVar("run")
+        self.reset()
+
+    def reset(self):
+        self.run.set(Run())
+
+    def current_run(self):
+        run = self.run.get(None)
+        if run is None:
+            # A thread started without a copied context gets a run of its own.
+            run = Run()
+            self.run.set(run)
+        return run
+
+
+_tracer = Tracer() if TRACE_ENABLED else None
+
+
+def span(name, **fields):
+    """Context manager timing one stage. Nested spans record their parent."""
+    if _tracer is None:
+        return _NOOP
+    return Span(_tracer, name, fields)
+
+
+def traced(name=None):
+    """Decorator form of span(); a no-op when tracing is off."""
+    def decorate(fn):
+        if _tracer is None:
+            return fn
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_run():
+    """Begin a separate run record in the current context."""
+    if _tracer is not None:
+        _tracer.reset()
+
+
+def annotate(**fields):
+    """Attach run-level fields (path taken, ids, ...) to the current run."""
+    if _tracer is not None:
+        _tracer.current_run().fields.update(fields)
+
+
+def finish_run(status, trace_file=None, prom_file=None):
+    """Write the current run's record and metrics, then start a new run."""
+    if _tracer is None:
+        return None
+    run = _tracer.current_run()
+    record = {
+        "started": run.started,
+        "status": status,
+        "wall_s": round(time.perf_counter() - run._wall, 6),
+        "cpu_s": round(time.process_time() - run._cpu, 6),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        **run.fields,
+        "spans": run.spans,
+    }
+    with open(trace_file or TRACE_FILE, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    _write_textfile(prom_file or TRACE_PROM_FILE, prometheus_text(record))
+    _tracer.reset()
+    return record
+
+
+# =========================================================
+# PROMETHEUS TEXTFILE EXPORT
+# =========================================================
+_STAGE_METRICS = [
+    # (metric, span field, help)
+    ("stage_wall_seconds", "wall_s", "Wall time spent in the stage during the last run."),
+    ("stage_cpu_seconds", "cpu_s", "Process CPU time spent in the stage during the last run."),
+    ("stage_bytes_in", "bytes_in", "Bytes consumed by the stage during the last run."),
+    ("stage_bytes_out", "bytes_out", "Bytes produced by the stage during the last run."),
+    ("stage_peak_rss_bytes", "peak_rss_bytes", "Process peak RSS when the stage finished."),
+    ("stage_calls", None, "Times the stage ran during the last run."),
+]
+
+
+def prometheus_text(record):
+    """Render a run record in the Prometheus text exposition format."""
+    stages = {}
+    for s in record["spans"]:
+        agg = stages.setdefault(s["name"], {"calls": 0})
+        agg["calls"] += 1
+        for _, field, _ in _STAGE_METRICS:
+            if field and s.get(field) is not None:
+                if field == "peak_rss_bytes":
+                    agg[field] = max(agg.get(field, 0), s[field])
+                else:
+                    agg[field] = agg.get(field, 0) + s[field]
+
+    lines = []
+    # Batch runs label every sample with the page they belong to.
+    page = f'page="{record["page"]}"' if record.get("page") else ""
+
+    def labels(*pairs):
+        pairs = [p for p in (page,) + pairs if p]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def metric(name, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        for sample_labels, value in samples:
+            lines.append(f"{METRIC_PREFIX}_{name}{sample_labels} {value}")
+
+    metric("run_timestamp_seconds", "Start of the last run (unix time).", [(labels(), record["started"])])
+    metric("run_success", "1 if the last run succeeded or skipped cleanly.",
+           [(labels(), 1 if record["status"] in ("ok", "skip") else 0)])
+    metric("run_wall_seconds", "Wall time of the last run.", [(labels(), record["wall_s"])])
+    metric("run_cpu_seconds", "Process CPU time of the last run.", [(labels(), record["cpu_s"])])
+    for name, field, help_text in _STAGE_METRICS:
+        samples = []
+        for stage, agg in sorted(stages.items()):
+            value = agg["calls"] if field is None else agg.get(field)
+            if value is not None:
+                samples.append((labels(f'stage="{stage}"'), value))
+        metric(name, help_text, samples)
+    return "\n".join(lines) + "\n"
+
+
+def _write_textfile(path, text):
+    # node_exporter may read at any moment; never let it see a partial file.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)